@@ -0,0 +1,165 @@
+"""Disk cache of complete analysis results keyed by input fingerprints.
+
+A key is the SHA-256 of the loaded files' contents plus the analysis
+options (mode, include_inactive, ...), so renamed or touched files still
+hit and any content change misses. Entries are gzipped JSON files; the
+least recently used ones are evicted once the directory exceeds its byte
+budget.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import sys
+import tempfile
+
+# Bump when analysis semantics change so stale results are never served.
+CACHE_VERSION = 1
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# Result values stored as-is; anything else (a SpillList) is not cached.
+JSON_SECTION_TYPES = (dict, list, str, int, float, bool, type(None))
+
+# (path, size, mtime_ns) -> sha256 hex, so unchanged files are hashed once.
+_fingerprints: dict[tuple[str, int, int], str] = {}
+
+
+def cache_root() -> str:
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "ship-distances-analyzer")
+
+
+def default_cache_dir() -> str:
+    return os.path.join(cache_root(), "results")
+
+
+def file_fingerprint(path: str) -> str:
+    """Content hash of a file, memoized on (path, size, mtime)."""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    digest = _fingerprints.get(memo_key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        _fingerprints[memo_key] = digest
+    return digest
+
+
+def make_key(mode: str, fingerprints: list[str], options: dict) -> str:
+    payload = json.dumps(
+        {
+            "version": CACHE_VERSION,
+            "mode": mode,
+            "inputs": fingerprints,
+            "options": options,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, directory: str | None = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory or default_cache_dir()
+        self.max_bytes = max_bytes
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json.gz")
+
+    def get(self, key: str) -> dict | None:
+        path = self._path(key)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as file:
+                result = json.load(file)
+        except (OSError, ValueError):
+            return None
+        try:
+            os.utime(path)  # mtime is the LRU clock
+        except OSError:
+            pass
+        return result
+
+    def put(self, key: str, result: dict) -> None:
+        """Store ``result``; skipped when a row section is spilled to disk
+        (streaming plans): reading it back whole would defeat the budget."""
+        if not all(isinstance(value, JSON_SECTION_TYPES) for value in result.values()):
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb") as file:
+                file.write(json.dumps(result, ensure_ascii=False).encode("utf-8"))
+            os.replace(tmp_path, self._path(key))
+        except BaseException as exc:
+            # Never leave a partial entry behind: _evict only sees *.json.gz.
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            if isinstance(exc, OSError):
+                return
+            raise
+        self._evict()
+
+    def clear(self) -> None:
+        for name, _, _ in self._entries():
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    def _entries(self) -> list[tuple[str, int, float]]:
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        entries = []
+        for name in names:
+            if not name.endswith(".json.gz"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((name, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _evict(self) -> None:
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        for name, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            total -= size
+
+
+def cached_analysis(
+    cache: "ResultCache | None",
+    mode: str,
+    fingerprints: list[str],
+    options: dict,
+    compute,
+) -> tuple[dict, bool]:
+    """Return ``(result, from_cache)``, running ``compute()`` on a miss."""
+    if cache is None:
+        return compute(), False
+    key = make_key(mode, fingerprints, options)
+    result = cache.get(key)
+    if result is not None:
+        return result, True
+    result = compute()
+    cache.put(key, result)
+    return result, False
@@ -1,131 +1,33 @@
-import csv
 import os
 import threading
 import tkinter as tk
 import tkinter.filedialog  # Ensures PyInstaller bundles submodules
 import tkinter.messagebox  # Ensures PyInstaller bundles submodules
 import tkinter.ttk  # Ensures PyInstaller bundles submodules
-from dataclasses import dataclass
 from tkinter import filedialog, messagebox, ttk
 
+from analysis_cache import ResultCache, cached_analysis, file_fingerprint
+from distances_engine import (
+    PORT_COLUMNS,
+    RULE_COLUMNS,
+    SEGMENT_COLUMNS,
+    ComplexDistanceEngine,
+    PortsData,
+    build_complex_output_table,
+    load_segments,
+    read_rules_csv,
+)
+from heatmap_window import RegionHeatmapWindow
+from memory_budget import MemoryBudget
+from planner import plan_analysis, run_plan
+from profiling import Profiler, profile_phase
+
 try:
     from tkinterdnd2 import DND_FILES, TkinterDnD
 except Exception:
     DND_FILES = None
     TkinterDnD = None
 
-PORT_COLUMNS = [
-    "id",
-    "port",
-    "load",
-    "mgo_at_port",
-    "is_archived",
-    "region_id",
-    "port_country_id",
-    "port_code",
-    "port_type",
-    "is_active_port",
-    "coordinates",
-    "port_nickname",
-    "refer_port_id",
-]
-
-RULE_COLUMNS = [
-    "id",
-    "distance_rule_name",
-    "order_of_priority",
-    "zone_start_id",
-    "zone_end_id",
-    "waypoint1_id",
-    "waypoint2_id",
-    "waypoint3_id",
-    "waypoint4_id",
-    "waypoint5_id",
-    "waypoint6_id",
-    "discount_suez_ballast",
-    "discount_suez_laden",
-]
-
-SEGMENT_COLUMNS = [
-    "id",
-    "load_port_id",
-    "disch_port_id",
-    "total_distance",
-    "total_seca_distance",
-    "waypoint_data",
-    "updated_at",
-    "by_panama_canal_rp",
-    "by_gibraltar_strait_rp",
-    "by_cape_good_hope_rp",
-    "by_magellan_strait_rp",
-    "by_cape_horn_rp",
-    "by_singapore_strait_rp",
-    "by_torres_strait_rp",
-    "by_vitiaz_strait_rp",
-    "by_kiel_canal_rp",
-    "by_skaw_area_rp",
-    "by_suez_canal_rp",
-    "by_gulf_of_aden_rp",
-    "by_sunda_strait_rp",
-    "by_bosporus_strait_rp",
-    "by_malacca_strait_rp",
-]
-
-
-def _as_bool(value: str) -> bool:
-    return str(value).strip().lower() in {"true", "1", "yes", "y", "t"}
-
-
-def _as_number(value: str) -> float:
-    try:
-        return float(str(value).strip())
-    except (TypeError, ValueError):
-        return 0.0
-
-
-def _normalize_id(value: object) -> str:
-    if value is None:
-        return ""
-    raw = str(value).strip()
-    if raw == "":
-        return ""
-    try:
-        num = float(raw)
-        if num.is_integer():
-            return str(int(num))
-        return str(num)
-    except ValueError:
-        return raw
-
-
-def _effective_port_id(port: dict) -> str:
-    """ID to use for distance lookup: refer_port_id if set, else port id."""
-    ref = _normalize_id(port.get("refer_port_id", ""))
-    if ref:
-        return ref
-    return _normalize_id(port.get("id", ""))
-
-
-def _resolve_master_port(port: dict, ports_by_id: dict) -> dict:
-    """Return the final non-alias refer target; fallback to the given row."""
-    current = port
-    seen = set()
-    while True:
-        ref = _normalize_id(current.get("refer_port_id", ""))
-        if not ref or ref in seen or ref not in ports_by_id:
-            return current
-        seen.add(ref)
-        current = ports_by_id[ref]
-
-
-@dataclass
-class PortsData:
-    rows: list
-    load_ports: list
-    disch_ports: list
-    by_id: dict
-    by_effective_id: dict
-
 
 class ComplexDistanceAnalyzerApp:
     def __init__(self, root: tk.Tk) -> None:
@@ -141,6 +43,9 @@ class ComplexDistanceAnalyzerApp:
         self.rules_data: list | None = None
         self.segments_data: dict | None = None
         self.segments_rows = 0
+        self.rules_fingerprint = ""
+        self.segments_fingerprint = ""
+        self.result_cache = ResultCache()
 
         self.analysis_result = None
         self.analysis_thread = None
@@ -230,6 +135,26 @@ class ComplexDistanceAnalyzerApp:
         )
         inactive_chk.pack(side="left", padx=12)
 
+        self.first_routable_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            top,
+            text="Stop at first routable rule (priority order)",
+            variable=self.first_routable_var,
+        ).pack(side="left", padx=12)
+
+        self.profile_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            top,
+            text="Profile analysis (phase timings & counters)",
+            variable=self.profile_var,
+        ).pack(side="left", padx=12)
+
+        self.memory_budget_var = tk.StringVar(value="0")
+        ttk.Label(top, text="Memory budget MB (0 = off)").pack(side="left")
+        ttk.Entry(top, textvariable=self.memory_budget_var, width=7).pack(
+            side="left", padx=(4, 0)
+        )
+
         files = ttk.LabelFrame(self.root, text="CSV Inputs", padding=12)
         files.pack(fill="x", padx=12, pady=(0, 12))
 
@@ -294,6 +219,13 @@ class ComplexDistanceAnalyzerApp:
         )
         self.reset_btn.pack(side="left", padx=8)
 
+        ttk.Button(
+            actions, text="Region heatmap", command=self.show_region_heatmap
+        ).pack(side="left")
+
+        self.plan_status = tk.StringVar(value="")
+        ttk.Label(actions, textvariable=self.plan_status).pack(side="left", padx=12)
+
         self.progress = ttk.Progressbar(
             self.root, mode="determinate", maximum=100
         )
@@ -380,6 +312,7 @@ class ComplexDistanceAnalyzerApp:
     def _load_rules_from_path(self, path: str) -> None:
         try:
             self.rules_data = self._read_rules_csv(path)
+            self.rules_fingerprint = file_fingerprint(path)
         except Exception as exc:
             messagebox.showerror("Rules CSV Error", str(exc))
             return
@@ -390,6 +323,7 @@ class ComplexDistanceAnalyzerApp:
     def _load_segments_from_path(self, path: str) -> None:
         try:
             self.segments_data, self.segments_rows = self._read_segments_csv(path)
+            self.segments_fingerprint = file_fingerprint(path)
         except Exception as exc:
             messagebox.showerror("Segments CSV Error", str(exc))
             return
@@ -408,6 +342,7 @@ class ComplexDistanceAnalyzerApp:
     def remove_rules_csv(self) -> None:
         self.rules_csv_path = None
         self.rules_data = None
+        self.rules_fingerprint = ""
         self.rules_status.set("Distance Rules CSV: not loaded")
         self.reset_analysis()
 
@@ -415,16 +350,37 @@ class ComplexDistanceAnalyzerApp:
         self.segments_csv_path = None
         self.segments_data = None
         self.segments_rows = 0
+        self.segments_fingerprint = ""
         self.segments_status.set("Distances ARW (segments) CSV: not loaded")
         self.reset_analysis()
 
     def reset_analysis(self) -> None:
         self.analysis_result = None
+        self.plan_status.set("")
         self.output_text.delete("1.0", "end")
         self._set_result_buttons_state(enabled=False)
         self.progress.pack_forget()
         self.progress["value"] = 0
 
+    def show_region_heatmap(self) -> None:
+        if not self.ports_data or not self.rules_data or not self.segments_data:
+            messagebox.showwarning(
+                "Missing CSVs",
+                "Please load Ports, Distance Rules, and Distances ARW CSVs first.",
+            )
+            return
+        engine = ComplexDistanceEngine(
+            self.rules_data or [], self.segments_data or {}, self.segments_rows
+        )
+        try:
+            result = engine.region_coverage(self._read_ports_csv(self.ports_csv_path))
+        except Exception as exc:
+            messagebox.showerror("Region Heatmap Error", str(exc))
+            return
+        RegionHeatmapWindow(
+            self.root, result, "Region coverage: routable / unroutable / no rule"
+        )
+
     def start_analysis(self) -> None:
         if not self.ports_data or not self.rules_data or not self.segments_data:
             messagebox.showwarning(
@@ -464,45 +420,7 @@ class ComplexDistanceAnalyzerApp:
         self._set_result_buttons_state(enabled=True)
 
     def _build_output_table(self, result: dict) -> str:
-        summary = result["summary"]
-        missing_segments = result["missing_segments"]
-        missing_complete = result["missing_complete"]
-
-        lines = []
-        lines.append("Summary")
-        lines.append("Metric\tValue")
-        lines.append(f"Total ports CSV rows\t{summary['total_ports_rows']}")
-        lines.append(f"Total load ports\t{summary['total_load_ports']}")
-        lines.append(f"Total disch ports\t{summary['total_disch_ports']}")
-        lines.append(f"Total rules rows\t{summary['total_rules_rows']}")
-        lines.append(f"Total segments rows\t{summary['total_segments_rows']}")
-        lines.append(f"Expected complete distances\t{summary['expected_complete']}")
-        lines.append(f"Complete distances generated\t{summary['generated_complete']}")
-        lines.append(f"Missing distances (segments)\t{summary['missing_segments']}")
-        lines.append(f"Missing complete distances\t{summary['missing_complete']}")
-        lines.append("")
-        lines.append("Missing Distances ARW (segments)")
-        lines.append(
-            "From port name\tFrom port id\tTo port name\tTo port id\tRule name\tRule id"
-        )
-        for row in missing_segments:
-            lines.append(
-                f"{row['from_name']}\t{row['from_id']}\t{row['to_name']}\t"
-                f"{row['to_id']}\t{row['rule_name']}\t{row['rule_id']}"
-            )
-        lines.append("")
-        lines.append("Missing ARW Complete Distances")
-        lines.append(
-            "Disch port name\tDisch port id\tLoad port name\tLoad port id\t"
-            "Rule name\tPriority\tReason"
-        )
-        for row in missing_complete:
-            lines.append(
-                f"{row['disch_name']}\t{row['disch_id']}\t"
-                f"{row['load_name']}\t{row['load_id']}\t"
-                f"{row['rule_name']}\t{row['priority']}\t{row['reason']}"
-            )
-        return "\n".join(lines)
+        return build_complex_output_table(result)
 
     def copy_output(self) -> None:
         if not self.analysis_result:
@@ -528,337 +446,80 @@ class ComplexDistanceAnalyzerApp:
         messagebox.showinfo("Saved", f"Saved analysis to {path}")
 
     def _read_ports_csv(self, path: str) -> PortsData:
-        with open(path, newline="", encoding="utf-8-sig") as file:
-            reader = csv.DictReader(file)
-            self._validate_headers(reader.fieldnames, PORT_COLUMNS, "Ports CSV")
-            rows = list(reader)
-
-        load_ports = []
-        disch_ports = []
-        by_id = {}
-        include_inactive = self.include_inactive_var.get()
-
-        for row in rows:
-            port_id = _normalize_id(row["id"])
-            if not port_id:
-                continue
-            is_load = _as_bool(row["load"])
-            is_active = _as_bool(row["is_active_port"])
-            if not include_inactive and not is_active:
-                continue
-            by_id[port_id] = row
-            disch_ports.append(row)
-            if is_load:
-                load_ports.append(row)
-
-        by_effective_id = {}
-        for row in by_id.values():
-            eff = _effective_port_id(row)
-            # Prefer master row for display when aliases share same effective id.
-            if eff not in by_effective_id or _normalize_id(row.get("id")) == eff:
-                by_effective_id[eff] = row
-
-        return PortsData(
-            rows=rows,
-            load_ports=load_ports,
-            disch_ports=disch_ports,
-            by_id=by_id,
-            by_effective_id=by_effective_id,
-        )
+        return ComplexDistanceEngine.read_ports(path, self.include_inactive_var.get())
 
     def _read_rules_csv(self, path: str) -> list:
-        with open(path, newline="", encoding="utf-8-sig") as file:
-            reader = csv.DictReader(file)
-            self._validate_headers(reader.fieldnames, RULE_COLUMNS, "Distance Rules CSV")
-            rows = list(reader)
-
-        normalized = []
-        for row in rows:
-            normalized.append(
-                {
-                    "id": _normalize_id(row["id"]),
-                    "distance_rule_name": row["distance_rule_name"],
-                    "order_of_priority": int(_as_number(row["order_of_priority"])),
-                    "zone_start_id": _normalize_id(row["zone_start_id"]),
-                    "zone_end_id": _normalize_id(row["zone_end_id"]),
-                    "waypoints": [
-                        _normalize_id(row[f"waypoint{i}_id"])
-                        for i in range(1, 7)
-                        if _normalize_id(row.get(f"waypoint{i}_id", ""))
-                    ],
-                    "discount_suez_ballast": _as_number(row["discount_suez_ballast"]),
-                    "discount_suez_laden": _as_number(row["discount_suez_laden"]),
-                }
-            )
-        return normalized
+        return read_rules_csv(path)
 
     def _read_segments_csv(self, path: str) -> tuple[dict, int]:
-        with open(path, newline="", encoding="utf-8-sig") as file:
-            reader = csv.DictReader(file)
-            self._validate_headers(
-                reader.fieldnames, SEGMENT_COLUMNS, "Distances ARW (segments) CSV"
-            )
-            segments = {}
-            row_count = 0
-            for row in reader:
-                row_count += 1
-                load_id = _normalize_id(row["load_port_id"])
-                disch_id = _normalize_id(row["disch_port_id"])
-                if not load_id or not disch_id:
-                    continue
-                key = f"{load_id}:{disch_id}"
-                segments[key] = {
-                    "totalDistance": _as_number(row["total_distance"]),
-                    "secaDistance": _as_number(row["total_seca_distance"]),
-                    "byPanamaCanalRp": _as_bool(row["by_panama_canal_rp"]),
-                    "byCapeGoodHopeRp": _as_bool(row["by_cape_good_hope_rp"]),
-                    "byCapeHornRp": _as_bool(row["by_cape_horn_rp"]),
-                    "byTorresStraitRp": _as_bool(row["by_torres_strait_rp"]),
-                    "byBosporusStraitRp": _as_bool(row["by_bosporus_strait_rp"]),
-                    "bySkawAreaRp": _as_bool(row["by_skaw_area_rp"]),
-                    "byGulfOfAdenRp": _as_bool(row["by_gulf_of_aden_rp"]),
-                    "byGibraltarStraitRp": _as_bool(row["by_gibraltar_strait_rp"]),
-                    "byMagellanStraitRp": _as_bool(row["by_magellan_strait_rp"]),
-                    "bySingaporeStraitRp": _as_bool(row["by_singapore_strait_rp"]),
-                    "byVitiazStraitRp": _as_bool(row["by_vitiaz_strait_rp"]),
-                    "byKielCanalRp": _as_bool(row["by_kiel_canal_rp"]),
-                    "bySuezCanalRp": _as_bool(row["by_suez_canal_rp"]),
-                    "bySundaStraitRp": _as_bool(row["by_sunda_strait_rp"]),
-                }
-            return segments, row_count
-
-    def _validate_headers(self, actual, expected, label: str) -> None:
-        if not actual:
-            raise ValueError(f"{label} has no headers.")
-        actual_set = {str(h).strip() for h in actual if h is not None}
-        expected_set = set(expected)
-        missing = expected_set - actual_set
-        if missing:
-            raise ValueError(
-                f"{label} is missing required columns (order does not matter):\n"
-                f"Missing: {sorted(missing)}\n"
-                f"Required: {sorted(expected_set)}"
-            )
+        return load_segments(path)
 
-    def _find_rules_for_pair(self, disch_port: dict, load_port: dict) -> list:
-        disch_zone = _normalize_id(disch_port.get("region_id", ""))
-        load_zone = _normalize_id(load_port.get("region_id", ""))
-        if not disch_zone or not load_zone:
-            return []
-
-        matches = []
-        for rule in self.rules_data or []:
-            if rule["zone_start_id"] == disch_zone and rule["zone_end_id"] == load_zone:
-                matches.append({"rule": rule, "reversed": False})
-            elif rule["zone_start_id"] == load_zone and rule["zone_end_id"] == disch_zone:
-                matches.append({"rule": rule, "reversed": True})
-
-        return sorted(
-            matches,
-            key=lambda r: r["rule"].get("order_of_priority", 999),
-        )
+    def _report_progress(self, value: int) -> None:
+        self.root.after(0, self.progress.configure, {"value": value})
 
-    def _lookup_segment(self, from_id: str, to_id: str) -> dict | None:
-        if from_id == to_id:
-            return {
-                "totalDistance": 1.0,
-                "secaDistance": 0.0,
-                "byPanamaCanalRp": False,
-                "byCapeGoodHopeRp": False,
-                "byCapeHornRp": False,
-                "byTorresStraitRp": False,
-                "byBosporusStraitRp": False,
-                "bySkawAreaRp": False,
-                "byGulfOfAdenRp": False,
-                "byGibraltarStraitRp": False,
-                "byMagellanStraitRp": False,
-                "bySingaporeStraitRp": False,
-                "byVitiazStraitRp": False,
-                "byKielCanalRp": False,
-                "bySuezCanalRp": False,
-                "bySundaStraitRp": False,
-            }
-
-        segments = self.segments_data or {}
-        direct = segments.get(f"{from_id}:{to_id}")
-        if direct:
-            return direct
-        reverse = segments.get(f"{to_id}:{from_id}")
-        if reverse:
-            return reverse
-        return None
-
-    def _build_distance_for_rule(
-        self,
-        disch_port: dict,
-        load_port: dict,
-        rule: dict,
-        reversed_rule: bool,
-        ports_by_id: dict,
-    ) -> tuple[dict | None, list[tuple[str, str]]]:
-        waypoints = [
-            _resolve_master_port(ports_by_id.get(_normalize_id(wp)), ports_by_id)
-            for wp in rule["waypoints"]
-            if _normalize_id(wp) in ports_by_id
-        ]
-        if reversed_rule:
-            waypoints = list(reversed(waypoints))
-
-        if not waypoints:
-            load_eff = _effective_port_id(load_port)
-            disch_eff = _effective_port_id(disch_port)
-            seg = self._lookup_segment(load_eff, disch_eff)
-            if not seg:
-                seg = self._lookup_segment(disch_eff, load_eff)
-            if not seg:
-                return None, [(load_eff, disch_eff)]
-            return {"segment": seg}, []
-
-        route = [disch_port] + waypoints + [load_port]
-        filtered_route = []
-        for port in route:
-            if not filtered_route or _effective_port_id(port) != _effective_port_id(
-                filtered_route[-1]
-            ):
-                filtered_route.append(port)
-
-        missing_segments = []
-        for idx in range(len(filtered_route) - 1):
-            from_port = filtered_route[idx]
-            to_port = filtered_route[idx + 1]
-            from_eff = _effective_port_id(from_port)
-            to_eff = _effective_port_id(to_port)
-            seg = self._lookup_segment(from_eff, to_eff)
-            if not seg:
-                missing_segments.append((from_eff, to_eff))
-                return None, missing_segments
-
-        return {"segment": True}, []
+    def _memory_budget_mb(self) -> int:
+        try:
+            return max(int(self.memory_budget_var.get().strip() or 0), 0)
+        except ValueError:
+            return 0
+
+    def _instrumented_analysis(self, engine, budget_mb: int) -> dict:
+        profiler = Profiler()
+        budget = None
+        if budget_mb:
+            budget = MemoryBudget(budget_mb * 1024 * 1024)
+            budget.start()
+            engine.enable_memory_budget(budget)
+        engine.enable_profiling(profiler, counters=self.profile_var.get())
+        try:
+            with profile_phase(profiler, "parse_ports"):
+                ports = self._read_ports_csv(self.ports_csv_path)
+            result = engine.analyze_complete_distances(
+                ports, progress=self._report_progress
+            )
+            result["profile"] = profiler.report()
+            if budget is not None:
+                result["profile"]["memory_budget"] = budget.report(
+                    profiler.peak_bytes()
+                )
+        finally:
+            if budget is not None:
+                budget.stop()
+        return result
 
     def _analyze_complete_distances(self) -> dict:
-        ports = self._read_ports_csv(self.ports_csv_path)
-        rules = self.rules_data or []
-
-        load_ports = ports.load_ports
-        disch_ports = ports.disch_ports
-        ports_by_id = ports.by_id
-
-        total_ports_rows = len(ports.rows)
-        total_load = len(load_ports)
-        total_disch = len(disch_ports)
-        total_rules = len(rules)
-        total_segments_rows = self.segments_rows
-
-        missing_segments_set = set()
-        missing_segments_rows = []
-        missing_complete = []
-
-        expected_complete = 0
-        generated_complete = 0
-        processed_effective_pairs = set()
-
-        total_pairs = max(total_load * total_disch, 1)
-        checked = 0
-
-        for disch_port in disch_ports:
-            for load_port in load_ports:
-                disch_master = _resolve_master_port(disch_port, ports_by_id)
-                load_master = _resolve_master_port(load_port, ports_by_id)
-                disch_eff = _effective_port_id(disch_master)
-                load_eff = _effective_port_id(load_master)
-                pair_key = f"{disch_eff}:{load_eff}"
-                if pair_key in processed_effective_pairs:
-                    checked += 1
-                    if checked % 200 == 0 or checked == total_pairs:
-                        progress_value = int((checked / total_pairs) * 100)
-                        self.root.after(
-                            0, self.progress.configure, {"value": progress_value}
-                        )
-                    continue
-                processed_effective_pairs.add(pair_key)
-
-                rules_for_pair = self._find_rules_for_pair(disch_master, load_master)
-                if not rules_for_pair:
-                    missing_complete.append(
-                        {
-                            "disch_name": disch_master["port"],
-                            "disch_id": disch_master["id"],
-                            "load_name": load_master["port"],
-                            "load_id": load_master["id"],
-                            "rule_name": "",
-                            "priority": "",
-                            "reason": "no_rule",
-                        }
-                    )
-                else:
-                    for rule_info in rules_for_pair:
-                        expected_complete += 1
-                        rule = rule_info["rule"]
-                        dist, missing_segments = self._build_distance_for_rule(
-                            disch_master,
-                            load_master,
-                            rule,
-                            rule_info["reversed"],
-                            ports_by_id,
-                        )
-                        if dist:
-                            generated_complete += 1
-                        else:
-                            missing_complete.append(
-                                {
-                                    "disch_name": disch_master["port"],
-                                    "disch_id": disch_master["id"],
-                                    "load_name": load_master["port"],
-                                    "load_id": load_master["id"],
-                                    "rule_name": rule["distance_rule_name"],
-                                    "priority": rule["order_of_priority"],
-                                    "reason": "missing_segments",
-                                }
-                            )
-                            for from_id, to_id in missing_segments:
-                                key = f"{from_id}:{to_id}"
-                                if key in missing_segments_set:
-                                    continue
-                                missing_segments_set.add(key)
-                                from_port = _resolve_master_port(
-                                    ports_by_id.get(from_id, {}), ports_by_id
-                                )
-                                to_port = _resolve_master_port(
-                                    ports_by_id.get(to_id, {}), ports_by_id
-                                )
-                                missing_segments_rows.append(
-                                    {
-                                        "from_id": from_id,
-                                        "from_name": from_port.get("port", ""),
-                                        "to_id": to_id,
-                                        "to_name": to_port.get("port", ""),
-                                        "rule_name": rule["distance_rule_name"],
-                                        "rule_id": rule["id"],
-                                    }
-                                )
-
-                checked += 1
-                if checked % 200 == 0 or checked == total_pairs:
-                    progress_value = int((checked / total_pairs) * 100)
-                    self.root.after(
-                        0, self.progress.configure, {"value": progress_value}
-                    )
-
-        return {
-            "summary": {
-                "total_ports_rows": total_ports_rows,
-                "total_load_ports": total_load,
-                "total_disch_ports": total_disch,
-                "total_rules_rows": total_rules,
-                "total_segments_rows": total_segments_rows,
-                "expected_complete": expected_complete,
-                "generated_complete": generated_complete,
-                "missing_segments": len(missing_segments_rows),
-                "missing_complete": len(missing_complete),
-            },
-            "missing_segments": missing_segments_rows,
-            "missing_complete": missing_complete,
-        }
+        first_routable = self.first_routable_var.get()
+        engine = ComplexDistanceEngine(
+            self.rules_data or [],
+            self.segments_data or {},
+            self.segments_rows,
+            first_routable=first_routable,
+        )
+        budget_mb = self._memory_budget_mb()
+        if self.profile_var.get() or budget_mb:
+            return self._instrumented_analysis(engine, budget_mb)
+
+        def compute() -> dict:
+            ports = self._read_ports_csv(self.ports_csv_path)
+            plan = plan_analysis(engine, ports)
+            self.root.after(0, self.plan_status.set, f"Plan: {plan.describe()}")
+            return run_plan(engine, ports, plan, progress=self._report_progress)
+
+        options = {"include_inactive": self.include_inactive_var.get()}
+        if first_routable:
+            options["first_routable"] = True
+        result, _ = cached_analysis(
+            self.result_cache,
+            engine.mode,
+            [
+                file_fingerprint(self.ports_csv_path),
+                self.rules_fingerprint,
+                self.segments_fingerprint,
+            ],
+            options,
+            compute,
+        )
+        return result
 
 
 def main() -> None:
@@ -0,0 +1,370 @@
+"""Memory-mapped binary form of the parsed distances and segments tables.
+
+A CSV is parsed once, then written to ``<cache>/datasets/<sha256>.dstore``.
+Every later open of the same content (the other tool, a reopened window,
+batch worker processes) maps that file read-only instead of re-parsing it,
+so the pages are shared through the OS page cache rather than copied into
+each process. Stores are evicted least recently used first once the
+directory exceeds DEFAULT_STORE_MAX_BYTES.
+
+File layout (native byte order, recorded in the header)::
+
+    b"DSTORE01" | u32 header length | JSON header | pad to 8 | sections
+
+Sections: the interned port id string table, ``from``/``to`` index columns
+(uint32), distance columns (float64), a flag bitmask column (uint16) and an
+open-addressing hash table (int32 row index, -1 = empty) over the pairs.
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from collections.abc import Mapping
+from functools import lru_cache
+
+from analysis_cache import cache_root, file_fingerprint
+
+MAGIC = b"DSTORE01"
+STORE_SUFFIX = ".dstore"
+DEFAULT_STORE_MAX_BYTES = 1024 * 1024 * 1024
+# Decoded segment lookups kept per mapped store (hits and misses).
+MEMO_MAX_SEGMENTS = 1 << 16
+_EMPTY = -1
+
+
+def default_store_dir() -> str:
+    return os.path.join(cache_root(), "datasets")
+
+
+def _pair_hash(from_idx: int, to_idx: int) -> int:
+    return (from_idx * 2654435761) ^ (to_idx * 40503)
+
+
+def _slot_count(rows: int) -> int:
+    slots = 8
+    while slots < rows * 2:
+        slots *= 2
+    return slots
+
+
+def _align(value: int) -> int:
+    return (value + 7) & ~7
+
+
+def write_store(
+    path: str,
+    pairs: list[tuple[str, str]],
+    totals: list[float] | None = None,
+    secas: list[float] | None = None,
+    flags: list[int] | None = None,
+    flag_names: list[str] | None = None,
+    row_count: int = 0,
+) -> None:
+    """Write unique (from, to) pairs and optional per-pair values atomically."""
+    ids: dict[str, int] = {}
+    from_col = array("I")
+    to_col = array("I")
+    for from_id, to_id in pairs:
+        from_col.append(ids.setdefault(from_id, len(ids)))
+        to_col.append(ids.setdefault(to_id, len(ids)))
+
+    n_slots = _slot_count(len(pairs))
+    mask = n_slots - 1
+    slots = array("i", [_EMPTY]) * n_slots
+    for row, (from_idx, to_idx) in enumerate(zip(from_col, to_col)):
+        slot = _pair_hash(from_idx, to_idx) & mask
+        while slots[slot] != _EMPTY:
+            slot = (slot + 1) & mask
+        slots[slot] = row
+
+    sections = [
+        ("ids", "\n".join(ids).encode("utf-8")),
+        ("from", from_col.tobytes()),
+        ("to", to_col.tobytes()),
+        ("slots", slots.tobytes()),
+    ]
+    if totals is not None:
+        sections.append(("total", array("d", totals).tobytes()))
+        sections.append(("seca", array("d", secas or []).tobytes()))
+        sections.append(("flags", array("H", flags or []).tobytes()))
+
+    layout = {}
+    offset = 0
+    for name, data in sections:
+        layout[name] = [offset, len(data)]
+        offset = _align(offset + len(data))
+    header = json.dumps(
+        {
+            "byteorder": sys.byteorder,
+            "rows": len(pairs),
+            "ids": len(ids),
+            "slots": n_slots,
+            "row_count": row_count,
+            "flag_names": flag_names or [],
+            "sections": layout,
+        }
+    ).encode("utf-8")
+
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(MAGIC + struct.pack("<I", len(header)) + header)
+            file.write(b"\0" * (_align(file.tell()) - file.tell()))
+            start = file.tell()
+            for name, data in sections:
+                file.write(b"\0" * (start + layout[name][0] - file.tell()))
+                file.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class _MappedTable:
+    """Read-only view over a ``.dstore`` file; pickles as its path."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._map)
+        if bytes(view[:8]) != MAGIC:
+            raise ValueError(f"Not a dataset store: {path}")
+        (header_len,) = struct.unpack("<I", view[8:12])
+        self.header = json.loads(bytes(view[12 : 12 + header_len]))
+        if self.header["byteorder"] != sys.byteorder:
+            raise ValueError(f"Dataset store byte order mismatch: {path}")
+        start = _align(12 + header_len)
+
+        def section(name: str, fmt: str | None):
+            offset, length = self.header["sections"][name]
+            data = view[start + offset : start + offset + length]
+            return data.cast(fmt) if fmt else data
+
+        self._ids = bytes(section("ids", None)).decode("utf-8").split("\n")
+        if not self.header["ids"]:
+            self._ids = []
+        self._index = {port_id: idx for idx, port_id in enumerate(self._ids)}
+        self._from = section("from", "I")
+        self._to = section("to", "I")
+        self._slots = section("slots", "i")
+        self._mask = self.header["slots"] - 1
+        self.row_count = self.header["row_count"]
+        self._section = section
+
+    def __reduce__(self):
+        return (self.__class__, (self.path,))
+
+    def __len__(self) -> int:
+        return self.header["rows"]
+
+    def _find(self, from_id: str, to_id: str) -> int:
+        from_idx = self._index.get(from_id)
+        to_idx = self._index.get(to_id)
+        if from_idx is None or to_idx is None:
+            return _EMPTY
+        slots = self._slots
+        mask = self._mask
+        slot = _pair_hash(from_idx, to_idx) & mask
+        while True:
+            row = slots[slot]
+            if row == _EMPTY:
+                return _EMPTY
+            if self._from[row] == from_idx and self._to[row] == to_idx:
+                return row
+            slot = (slot + 1) & mask
+
+    def _pairs(self):
+        ids = self._ids
+        for from_idx, to_idx in zip(self._from, self._to):
+            yield ids[from_idx], ids[to_idx]
+
+    def port_ids(self) -> set[str]:
+        """Every port id appearing on either side of a pair."""
+        return set(self._ids)
+
+
+class MappedPairs(_MappedTable):
+    """Set-like ``(load_id, disch_id)`` pairs for the simple engine."""
+
+    def __contains__(self, pair) -> bool:
+        return self._find(pair[0], pair[1]) != _EMPTY
+
+    def __iter__(self):
+        return self._pairs()
+
+
+class MappedSegments(_MappedTable, Mapping):
+    """``"from:to"`` -> segment dict mapping for the complex engine."""
+
+    def __init__(self, path: str) -> None:
+        super().__init__(path)
+        self._total = self._section("total", "d")
+        self._seca = self._section("seca", "d")
+        self._flags = self._section("flags", "H")
+        self._flag_names = self.header["flag_names"]
+        self._memo = lru_cache(maxsize=MEMO_MAX_SEGMENTS)(self._load)
+
+    def _load(self, key: str) -> dict | None:
+        from_id, _, to_id = key.partition(":")
+        row = self._find(from_id, to_id)
+        if row == _EMPTY:
+            return None
+        bits = self._flags[row]
+        segment = {
+            "totalDistance": self._total[row],
+            "secaDistance": self._seca[row],
+        }
+        for bit, name in enumerate(self._flag_names):
+            segment[name] = bool(bits >> bit & 1)
+        return segment
+
+    def columns(self) -> tuple:
+        """Raw ``(port_ids, from, to, total, seca, flags, flag_names)`` columns."""
+        return (
+            self._ids,
+            self._from,
+            self._to,
+            self._total,
+            self._seca,
+            self._flags,
+            self._flag_names,
+        )
+
+    def trim_memo(self) -> None:
+        """Drop decoded lookups (memory-budget pressure hook)."""
+        self._memo.cache_clear()
+
+    def get(self, key: str, default=None):
+        segment = self._memo(key)
+        return default if segment is None else segment
+
+    def __getitem__(self, key: str) -> dict:
+        segment = self.get(key)
+        if segment is None:
+            raise KeyError(key)
+        return segment
+
+    def __contains__(self, key) -> bool:
+        return self.get(key) is not None
+
+    def __iter__(self):
+        return (f"{from_id}:{to_id}" for from_id, to_id in self._pairs())
+
+
+def store_path_for(csv_path: str, kind: str, store_dir: str | None = None) -> str:
+    digest = file_fingerprint(csv_path)
+    return os.path.join(store_dir or default_store_dir(), f"{digest}.{kind}{STORE_SUFFIX}")
+
+
+def _store_entries(store_dir: str) -> list[tuple[str, int, float]]:
+    try:
+        names = os.listdir(store_dir)
+    except OSError:
+        return []
+    entries = []
+    for name in names:
+        if not name.endswith(STORE_SUFFIX):
+            continue
+        try:
+            stat = os.stat(os.path.join(store_dir, name))
+        except OSError:
+            continue
+        entries.append((name, stat.st_size, stat.st_mtime))
+    return entries
+
+
+def evict_stores(
+    store_dir: str, keep: str, max_bytes: int = DEFAULT_STORE_MAX_BYTES
+) -> None:
+    """Remove the least recently used stores, never ``keep``, once the
+    directory exceeds ``max_bytes`` (mapped files that cannot be removed
+    are skipped)."""
+    entries = sorted(_store_entries(store_dir), key=lambda entry: entry[2])
+    total = sum(size for _, size, _ in entries)
+    for name, size, _ in entries:
+        if total <= max_bytes:
+            break
+        path = os.path.join(store_dir, name)
+        if os.path.abspath(path) == os.path.abspath(keep):
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+
+
+def _open_store(table_class, store_path: str):
+    table = table_class(store_path)
+    try:
+        os.utime(store_path)  # mtime is the LRU clock
+    except OSError:
+        pass
+    return table
+
+
+def open_distance_pairs(path: str, parse, store_dir: str | None = None):
+    """Return ``(pairs, row_count)``, mapping the store when it exists.
+
+    On a miss ``parse(path)`` builds ``(pairs_set, row_count)`` and the store
+    is written then mapped; the parsed set is returned as is when the store
+    cannot be written (read-only cache, ...).
+    """
+    store_path = store_path_for(path, "pairs", store_dir)
+    try:
+        mapped = _open_store(MappedPairs, store_path)
+        return mapped, mapped.row_count
+    except (OSError, ValueError):
+        pass
+    pairs, row_count = parse(path)
+    try:
+        write_store(store_path, sorted(pairs), row_count=row_count)
+        evict_stores(os.path.dirname(store_path), store_path)
+        return MappedPairs(store_path), row_count
+    except (OSError, ValueError):
+        return pairs, row_count
+
+
+def open_segments(path: str, parse, flag_names: list[str], store_dir: str | None = None):
+    """Return ``(segments, row_count)``, mapping the store when it exists.
+
+    ``parse(path)`` must return ``({"from:to": segment}, row_count)``; see
+    open_distance_pairs() for the miss path.
+    """
+    store_path = store_path_for(path, "segments", store_dir)
+    try:
+        mapped = _open_store(MappedSegments, store_path)
+        return mapped, mapped.row_count
+    except (OSError, ValueError):
+        pass
+    segments, row_count = parse(path)
+    pairs = []
+    totals = []
+    secas = []
+    flags = []
+    for key, segment in segments.items():
+        from_id, _, to_id = key.partition(":")
+        pairs.append((from_id, to_id))
+        totals.append(segment["totalDistance"])
+        secas.append(segment["secaDistance"])
+        bits = 0
+        for bit, name in enumerate(flag_names):
+            if segment[name]:
+                bits |= 1 << bit
+        flags.append(bits)
+    try:
+        write_store(store_path, pairs, totals, secas, flags, flag_names, row_count)
+        evict_stores(os.path.dirname(store_path), store_path)
+        return MappedSegments(store_path), row_count
+    except (OSError, ValueError):
+        return segments, row_count
@@ -0,0 +1,412 @@
+import argparse
+import sys
+import time
+
+from analysis_cache import ResultCache, cached_analysis, file_fingerprint
+from distances_engine import (
+    OUTPUT_FORMATS,
+    SEGMENT_BACKENDS,
+    ComplexDistanceEngine,
+    SimpleDistanceEngine,
+    analyze_port_snapshots,
+    load_distance_pairs,
+    load_segments,
+    read_pairs_csv,
+    read_rules_csv,
+    result_has_missing,
+    write_batch_result,
+    write_region_csv,
+    write_result,
+)
+from great_circle import add_great_circle_estimates
+from memory_budget import MemoryBudget
+from planner import STRATEGIES, plan_analysis, run_plan
+from profiling import Profiler, profile_phase
+from proxy_ports import DEFAULT_MIN_COVERAGE, suggest_proxies
+from segment_anomalies import DEFAULT_MIDPOINTS, DEFAULT_RATIO, add_segment_anomalies
+
+EXIT_OK = 0
+EXIT_MISSING = 1
+EXIT_INPUT_ERROR = 2
+
+PAIRS_HELP = (
+    "CSV of load_port_id,disch_port_id pairs: check only these pairs "
+    "(aliases resolved to their master port) instead of every load x disch."
+)
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Headless distances analysis (no Tk required).",
+    )
+    parser.add_argument(
+        "--include-inactive",
+        action="store_true",
+        help="Take inactive ports into account.",
+    )
+    parser.add_argument(
+        "--format",
+        choices=OUTPUT_FORMATS,
+        default="json",
+        help="Output format (default: json).",
+    )
+    parser.add_argument("--output", "-o", help="Output file path.")
+    parser.add_argument(
+        "--fail-on-missing",
+        action="store_true",
+        help=f"Exit with code {EXIT_MISSING} when distances are missing.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Worker processes for several --ports snapshots or a parallel "
+        "plan (default: CPU count).",
+    )
+    parser.add_argument(
+        "--strategy",
+        choices=STRATEGIES,
+        default="auto",
+        help="Execution strategy; auto plans it from the input sizes "
+        "(default: auto).",
+    )
+    parser.add_argument(
+        "--region-csv",
+        default=None,
+        help="Write pairs, found, missing and no_rule counts per disch x load "
+        "region pair to this CSV (counted without per-pair rows), then exit.",
+    )
+    parser.add_argument(
+        "--great-circle",
+        action="store_true",
+        help="Add a great_circle_nm lower bound, from the ports' coordinates, "
+        "to every missing distance, segment and pair row.",
+    )
+    parser.add_argument(
+        "--suggest-proxies",
+        type=int,
+        default=0,
+        metavar="K",
+        help="List the K nearest well-covered ports (refer_port_id candidates) "
+        "for every missing port (simple) or missing-segment endpoint (complex).",
+    )
+    parser.add_argument(
+        "--proxy-min-coverage",
+        type=float,
+        default=DEFAULT_MIN_COVERAGE,
+        help="Share of its possible partner ports a suggested port must have "
+        f"distances or segments with (default: {DEFAULT_MIN_COVERAGE}).",
+    )
+    parser.add_argument(
+        "--plan-only",
+        action="store_true",
+        help="Print the execution plan and estimates, then exit.",
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="Reuse results of earlier runs on identical inputs and options.",
+    )
+    parser.add_argument(
+        "--cache-dir", default=None, help="Result cache directory (implies --cache)."
+    )
+    parser.add_argument(
+        "--cache-max-mb",
+        type=int,
+        default=256,
+        help="Result cache size budget in MB (default: 256).",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Record phase timings and hot-path counters (bypasses the cache).",
+    )
+    parser.add_argument(
+        "--trace",
+        default=None,
+        help="Write a Chrome trace-event JSON file (implies --profile).",
+    )
+    parser.add_argument(
+        "--memory-budget-mb",
+        type=int,
+        default=0,
+        help="Track memory per phase with tracemalloc and spill result rows "
+        "to disk near this budget (implies --profile).",
+    )
+    sub = parser.add_subparsers(dest="mode", required=True)
+
+    simple = sub.add_parser("simple", help="Load x disch coverage check.")
+    simple.add_argument(
+        "--ports",
+        required=True,
+        nargs="+",
+        help="Ports CSV path; several paths produce a snapshot comparison table.",
+    )
+    simple.add_argument(
+        "--distances", required=True, help="Complete Distances CSV path."
+    )
+    simple.add_argument("--pairs", help=PAIRS_HELP)
+
+    complex_ = sub.add_parser("complex", help="A-Z rules & segments check.")
+    complex_.add_argument(
+        "--ports",
+        required=True,
+        nargs="+",
+        help="Ports CSV path; several paths produce a snapshot comparison table.",
+    )
+    complex_.add_argument("--rules", required=True, help="Distance Rules CSV path.")
+    complex_.add_argument(
+        "--segments", required=True, help="Distances ARW (segments) CSV path."
+    )
+    complex_.add_argument(
+        "--segment-backend",
+        choices=SEGMENT_BACKENDS,
+        default="auto",
+        help="Segment lookups: dense hub matrix, hash table, or auto by "
+        "store type and density (default: auto).",
+    )
+    complex_.add_argument("--pairs", help=PAIRS_HELP)
+    complex_.add_argument(
+        "--first-routable",
+        action="store_true",
+        help="Try rules in priority order and stop at the first that routes; "
+        "report the effective rule per pair and the unroutable pairs.",
+    )
+    complex_.add_argument(
+        "--segment-anomalies",
+        action="store_true",
+        help="Scan every segment for a distance below the great circle between "
+        "its ports or far above a path through a midpoint port (needs numpy).",
+    )
+    complex_.add_argument(
+        "--anomaly-midpoints",
+        type=int,
+        default=DEFAULT_MIDPOINTS,
+        help="Best connected ports tried as midpoints; 0 tries every port "
+        f"(default: {DEFAULT_MIDPOINTS}).",
+    )
+    complex_.add_argument(
+        "--anomaly-ratio",
+        type=float,
+        default=DEFAULT_RATIO,
+        help="Flag a segment longer than this times its best path through a "
+        f"midpoint (default: {DEFAULT_RATIO}).",
+    )
+    return parser
+
+
+def _load_engine(
+    args: argparse.Namespace,
+    profiler: Profiler | None = None,
+    budget: MemoryBudget | None = None,
+):
+    if args.mode == "simple":
+        with profile_phase(profiler, "load_distances"):
+            engine = SimpleDistanceEngine(*load_distance_pairs(args.distances))
+    else:
+        with profile_phase(profiler, "parse_rules"):
+            rules = read_rules_csv(args.rules)
+        with profile_phase(profiler, "load_segments"):
+            segments, segments_rows = load_segments(args.segments)
+        engine = ComplexDistanceEngine(
+            rules,
+            segments,
+            segments_rows,
+            args.segment_backend,
+            args.first_routable,
+        )
+    if profiler is not None:
+        engine.enable_profiling(profiler, counters=args.profile or bool(args.trace))
+    if budget is not None:
+        engine.enable_memory_budget(budget)
+    return engine
+
+
+def _input_paths(args: argparse.Namespace) -> list[str]:
+    if args.mode == "simple":
+        paths = [args.ports[0], args.distances]
+    else:
+        paths = [args.ports[0], args.rules, args.segments]
+    return paths + [args.pairs] if args.pairs else paths
+
+
+def _run(args: argparse.Namespace) -> tuple[dict, bool]:
+    budget = None
+    if args.memory_budget_mb:
+        budget = MemoryBudget(args.memory_budget_mb * 1024 * 1024)
+        budget.start()
+    profiler = Profiler() if args.profile or args.trace or budget else None
+    cache = None
+    if (args.cache or args.cache_dir) and profiler is None:
+        cache = ResultCache(args.cache_dir, args.cache_max_mb * 1024 * 1024)
+
+    def compute() -> dict:
+        engine = _load_engine(args, profiler, budget)
+        with profile_phase(profiler, "parse_ports"):
+            ports = engine.read_ports(args.ports[0], args.include_inactive)
+        if args.pairs:
+            with profile_phase(profiler, "parse_pairs"):
+                pairs = read_pairs_csv(args.pairs)
+            result = engine.check_pairs(ports, pairs)
+        elif profiler is None:
+            plan = plan_analysis(engine, ports, args.strategy, args.workers)
+            print(f"plan\t{plan.describe()}", file=sys.stderr)
+            result = run_plan(engine, ports, plan)
+        else:
+            result = engine.analyze(ports)
+        if args.great_circle:
+            with profile_phase(profiler, "great_circle"):
+                add_great_circle_estimates(result, ports, budget)
+        if args.suggest_proxies:
+            with profile_phase(profiler, "proxy_suggestions"):
+                suggest_proxies(
+                    result,
+                    ports,
+                    engine,
+                    args.suggest_proxies,
+                    args.proxy_min_coverage,
+                )
+        if getattr(args, "segment_anomalies", False):
+            with profile_phase(profiler, "segment_anomalies"):
+                add_segment_anomalies(
+                    result,
+                    engine.segments_data,
+                    ports,
+                    args.anomaly_midpoints,
+                    args.anomaly_ratio,
+                )
+        if profiler is not None:
+            result["profile"] = profiler.report()
+            if budget is not None:
+                result["profile"]["memory_budget"] = budget.report(
+                    profiler.peak_bytes()
+                )
+                budget.stop()
+            if args.trace:
+                profiler.write_chrome_trace(args.trace)
+        return result
+
+    fingerprints = [file_fingerprint(path) for path in _input_paths(args)]
+    options = {"include_inactive": args.include_inactive}
+    if getattr(args, "first_routable", False):
+        options["first_routable"] = True
+    if args.great_circle:
+        options["great_circle"] = True
+    if args.suggest_proxies:
+        options["suggest_proxies"] = [args.suggest_proxies, args.proxy_min_coverage]
+    if getattr(args, "segment_anomalies", False):
+        options["segment_anomalies"] = [args.anomaly_midpoints, args.anomaly_ratio]
+    return cached_analysis(cache, args.mode, fingerprints, options, compute)
+
+
+def _show_plan(args: argparse.Namespace) -> int:
+    try:
+        engine = _load_engine(args)
+        ports = engine.read_ports(args.ports[0], args.include_inactive)
+        plan = plan_analysis(engine, ports, args.strategy, args.workers)
+    except (OSError, ValueError) as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        return EXIT_INPUT_ERROR
+    print(plan.describe())
+    for key, value in plan.as_dict().items():
+        print(f"{key}\t{value}", file=sys.stderr)
+    return EXIT_OK
+
+
+def _run_regions(args: argparse.Namespace) -> int:
+    started = time.perf_counter()
+    try:
+        engine = _load_engine(args)
+        ports = engine.read_ports(args.ports[0], args.include_inactive)
+        result = engine.region_coverage(ports)
+        write_region_csv(result, args.region_csv)
+    except (OSError, ValueError) as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        return EXIT_INPUT_ERROR
+    for key, value in result["summary"].items():
+        print(f"{key}\t{value}", file=sys.stderr)
+    print(f"written\t{args.region_csv}", file=sys.stderr)
+    print(f"elapsed_seconds\t{time.perf_counter() - started:.3f}", file=sys.stderr)
+    summary = result["summary"]
+    if args.fail_on_missing and (summary["missing"] or summary["no_rule"]):
+        return EXIT_MISSING
+    return EXIT_OK
+
+
+def _run_batch(args: argparse.Namespace) -> int:
+    started = time.perf_counter()
+    try:
+        engine = _load_engine(args)
+        loaded = time.perf_counter()
+        rows = analyze_port_snapshots(
+            engine, args.ports, args.include_inactive, args.workers
+        )
+        written = write_batch_result(rows, args.output, args.format)
+    except (OSError, ValueError, RuntimeError) as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        return EXIT_INPUT_ERROR
+    finished = time.perf_counter()
+
+    for row in rows:
+        status = row["error"] or "ok"
+        print(f"{row['ports_csv']}\t{status}", file=sys.stderr)
+    for path in written:
+        print(f"written\t{path}", file=sys.stderr)
+    print(f"load_seconds\t{loaded - started:.3f}", file=sys.stderr)
+    print(f"analysis_seconds\t{finished - loaded:.3f}", file=sys.stderr)
+
+    if any(row["error"] for row in rows):
+        return EXIT_INPUT_ERROR
+    if args.fail_on_missing and any(
+        result_has_missing({"summary": row}, args.mode) for row in rows
+    ):
+        return EXIT_MISSING
+    return EXIT_OK
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = _build_parser()
+    args = parser.parse_args(argv)
+    if args.plan_only:
+        return _show_plan(args)
+    if args.region_csv:
+        return _run_regions(args)
+    if not args.output:
+        parser.error("the following arguments are required: --output/-o")
+    if args.suggest_proxies and args.pairs:
+        parser.error("--suggest-proxies does not apply to --pairs")
+    if getattr(args, "segment_anomalies", False) and args.pairs:
+        parser.error("--segment-anomalies does not apply to --pairs")
+    if len(args.ports) > 1:
+        if args.pairs:
+            parser.error("--pairs takes a single --ports file")
+        if args.great_circle:
+            parser.error("--great-circle takes a single --ports file")
+        if args.suggest_proxies:
+            parser.error("--suggest-proxies takes a single --ports file")
+        if getattr(args, "segment_anomalies", False):
+            parser.error("--segment-anomalies takes a single --ports file")
+        return _run_batch(args)
+    started = time.perf_counter()
+    try:
+        result, from_cache = _run(args)
+        written = write_result(result, args.mode, args.output, args.format)
+    except (OSError, ValueError, RuntimeError) as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        return EXIT_INPUT_ERROR
+    elapsed = time.perf_counter() - started
+
+    for key, value in result["summary"].items():
+        print(f"{key}\t{value}", file=sys.stderr)
+    for path in written:
+        print(f"written\t{path}", file=sys.stderr)
+    print(f"from_cache\t{from_cache}", file=sys.stderr)
+    print(f"elapsed_seconds\t{elapsed:.3f}", file=sys.stderr)
+
+    if args.fail_on_missing and result_has_missing(result, args.mode):
+        return EXIT_MISSING
+    return EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,7 @@
+import importlib.util
+import multiprocessing
 import os
 import runpy
-import subprocess
 import sys
 import tkinter as tk
 import tkinter.filedialog  # Ensure bundled in PyInstaller
@@ -8,26 +9,29 @@ import tkinter.messagebox  # Ensure bundled in PyInstaller
 import tkinter.ttk  # Ensure bundled in PyInstaller
 from tkinter import messagebox, ttk
 
+try:
+    from tkinterdnd2 import TkinterDnD
+except Exception:
+    TkinterDnD = None
+
+# tool key -> (script file, app class hosted in a Toplevel)
+TOOLS = {
+    "simple": ("simple-distances-analyzer.py", "DistanceAnalyzerApp"),
+    "complex": ("complex-distances-analyzer.py", "ComplexDistanceAnalyzerApp"),
+}
+
 
 def _resource_path(relative_path: str) -> str:
     base_dir = getattr(sys, "_MEIPASS", os.path.dirname(__file__))
     return os.path.join(base_dir, relative_path)
 
 
-def _launch_tool(root: tk.Tk, tool_key: str) -> None:
-    subprocess.Popen([sys.executable, "--tool", tool_key])
-    root.withdraw()
-
-
-def _run_tool(tool_key: str) -> None:
-    script_map = {
-        "simple": "simple-distances-analyzer.py",
-        "complex": "complex-distances-analyzer.py",
-    }
-    script_name = script_map.get(tool_key)
-    if not script_name:
+def _tool_script_path(tool_key: str) -> str | None:
+    entry = TOOLS.get(tool_key)
+    if not entry:
         messagebox.showerror("Unknown tool", f"Unknown tool: {tool_key}")
-        return
+        return None
+    script_name = entry[0]
     script_path = _resource_path(script_name)
     if not os.path.isfile(script_path):
         messagebox.showerror(
@@ -35,6 +39,61 @@ def _run_tool(tool_key: str) -> None:
             f"Could not find {script_name}.\n"
             "If you are running a packaged .exe, ensure the file is bundled.",
         )
+        return None
+    return script_path
+
+
+class ToolHost:
+    """Hosts both tools in the launcher process as Toplevel windows.
+
+    Tool modules are imported on first open only. Closing a tool window
+    hides it, so its loaded CSVs, mapped datasets and result cache stay warm
+    for the next switch back to it.
+    """
+
+    def __init__(self, root: tk.Tk) -> None:
+        self.root = root
+        self.modules = {}
+        self.windows = {}
+
+    def _load_module(self, tool_key: str):
+        module = self.modules.get(tool_key)
+        if module is not None:
+            return module
+        script_path = _tool_script_path(tool_key)
+        if not script_path:
+            return None
+        spec = importlib.util.spec_from_file_location(
+            f"{tool_key}_distances_analyzer", script_path
+        )
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        self.modules[tool_key] = module
+        return module
+
+    def open(self, tool_key: str) -> None:
+        window = self.windows.get(tool_key)
+        if window is None:
+            module = self._load_module(tool_key)
+            if module is None:
+                return
+            window = tk.Toplevel(self.root)
+            getattr(module, TOOLS[tool_key][1])(window)
+            window.protocol("WM_DELETE_WINDOW", lambda: self._hide(tool_key))
+            self.windows[tool_key] = window
+        else:
+            window.deiconify()
+            window.lift()
+        self.root.withdraw()
+
+    def _hide(self, tool_key: str) -> None:
+        self.windows[tool_key].withdraw()
+        self.root.deiconify()
+
+
+def _run_tool(tool_key: str) -> None:
+    script_path = _tool_script_path(tool_key)
+    if not script_path:
         return
     runpy.run_path(script_path, run_name="__main__")
 
@@ -44,9 +103,10 @@ def main() -> None:
         _run_tool(sys.argv[2])
         return
 
-    root = tk.Tk()
+    root = TkinterDnD.Tk() if TkinterDnD is not None else tk.Tk()
     root.title("Ship Port Distance Helper")
     root.geometry("520x260")
+    host = ToolHost(root)
 
     frame = ttk.Frame(root, padding=24)
     frame.pack(fill="both", expand=True)
@@ -57,14 +117,14 @@ def main() -> None:
     ttk.Button(
         frame,
         text="Simple Distances Analyzer: load to disch",
-        command=lambda: _launch_tool(root, "simple"),
+        command=lambda: host.open("simple"),
         width=46,
     ).pack(pady=6)
 
     ttk.Button(
         frame,
         text="Complex Distances Analyzer: A-Z & Segments",
-        command=lambda: _launch_tool(root, "complex"),
+        command=lambda: host.open("complex"),
         width=46,
     ).pack(pady=6)
 
@@ -74,4 +134,6 @@ def main() -> None:
 
 
 if __name__ == "__main__":
+    # Parallel analysis plans re-launch the frozen exe as pool workers.
+    multiprocessing.freeze_support()
     main()
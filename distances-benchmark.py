@@ -0,0 +1,262 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+from dataset_store import open_distance_pairs, open_segments
+from distances_engine import (
+    SEGMENT_FLAGS,
+    ComplexDistanceEngine,
+    SimpleDistanceEngine,
+    read_distances_csv,
+    read_rules_csv,
+    read_segments_csv,
+)
+from proxy_ports import suggest_proxies
+from synthetic_data import SyntheticConfig, generate
+
+DEFAULT_SIZES = [1000, 5000, 20000]
+EXIT_OK = 0
+EXIT_REGRESSION = 1
+EXIT_NO_PROXIES = 2
+
+
+def _timed(timings: dict, phase: str, func, repeat: int):
+    """Run ``func`` ``repeat`` times, keep the best wall time, return its value."""
+    best = None
+    value = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        value = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    timings[phase] = round(best, 6)
+    return value
+
+
+def _bench_size(config: SyntheticConfig, data_dir: str, repeat: int) -> dict:
+    info = generate(config, data_dir)
+    paths = info["paths"]
+    store_dir = os.path.join(data_dir, "stores")
+    timings = {}
+
+    simple_ports = _timed(
+        timings,
+        "parse_ports",
+        lambda: SimpleDistanceEngine.read_ports(paths["ports"]),
+        repeat,
+    )
+    complex_ports = ComplexDistanceEngine.read_ports(paths["ports"])
+    pairs, distance_rows = _timed(
+        timings,
+        "parse_distances",
+        lambda: read_distances_csv(paths["distances"]),
+        repeat,
+    )
+    rules = _timed(
+        timings, "parse_rules", lambda: read_rules_csv(paths["rules"]), repeat
+    )
+    segments, segments_rows = _timed(
+        timings,
+        "parse_segments",
+        lambda: read_segments_csv(paths["segments"]),
+        repeat,
+    )
+
+    def index_distances():
+        shutil.rmtree(store_dir, ignore_errors=True)
+        return open_distance_pairs(
+            paths["distances"], lambda _: (pairs, distance_rows), store_dir
+        )
+
+    def index_segments():
+        shutil.rmtree(store_dir, ignore_errors=True)
+        return open_segments(
+            paths["segments"],
+            lambda _: (segments, segments_rows),
+            list(SEGMENT_FLAGS),
+            store_dir,
+        )
+
+    _timed(timings, "index_distances", index_distances, repeat)
+    _timed(timings, "index_segments", index_segments, repeat)
+
+    simple = SimpleDistanceEngine(pairs, distance_rows)
+    complex_engine = ComplexDistanceEngine(rules, segments, segments_rows)
+    simple_result = _timed(
+        timings,
+        "analysis_simple",
+        lambda: simple.analyze(simple_ports),
+        repeat,
+    )
+    complex_result = _timed(
+        timings,
+        "analysis_complex",
+        lambda: complex_engine.analyze(complex_ports),
+        repeat,
+    )
+    _timed(
+        timings,
+        "proxies_simple",
+        lambda: suggest_proxies(simple_result, simple_ports, simple),
+        repeat,
+    )
+    _timed(
+        timings,
+        "proxies_complex",
+        lambda: suggest_proxies(complex_result, complex_ports, complex_engine),
+        repeat,
+    )
+    return {
+        "rows": info["rows"],
+        "config": info["config"],
+        "phases": timings,
+        "summaries": {
+            "simple": simple_result["summary"],
+            "complex": complex_result["summary"],
+        },
+    }
+
+
+def _compare(results: dict, baseline: dict, tolerance: float, min_delta: float) -> list:
+    regressions = []
+    print("size\tphase\tbaseline_s\tcurrent_s\tratio", file=sys.stderr)
+    for size, current in results["sizes"].items():
+        base = baseline.get("sizes", {}).get(size)
+        if not base:
+            continue
+        for phase, seconds in current["phases"].items():
+            base_seconds = base["phases"].get(phase)
+            if base_seconds is None:
+                continue
+            ratio = seconds / base_seconds if base_seconds else float("inf")
+            flag = ""
+            if seconds > base_seconds * (1 + tolerance) and seconds - base_seconds > min_delta:
+                regressions.append((size, phase, base_seconds, seconds))
+                flag = "\tREGRESSION"
+            print(
+                f"{size}\t{phase}\t{base_seconds:.4f}\t{seconds:.4f}\t{ratio:.2f}{flag}",
+                file=sys.stderr,
+            )
+    return regressions
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Time parse, index and analysis phases on synthetic data.",
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=DEFAULT_SIZES,
+        help="Port counts to benchmark (default: 1000 5000 20000).",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1, help="Best of N runs.")
+    parser.add_argument("--regions", type=int, default=SyntheticConfig.regions)
+    parser.add_argument("--rules", type=int, default=SyntheticConfig.rules)
+    parser.add_argument("--hubs", type=int, default=SyntheticConfig.hubs)
+    parser.add_argument("--load-ratio", type=float, default=SyntheticConfig.load_ratio)
+    parser.add_argument(
+        "--segments-per-port", type=float, default=SyntheticConfig.segments_per_port
+    )
+    parser.add_argument(
+        "--hub-coverage", type=float, default=SyntheticConfig.hub_coverage
+    )
+    parser.add_argument(
+        "--distance-coverage", type=float, default=SyntheticConfig.distance_coverage
+    )
+    parser.add_argument(
+        "--output", "-o", default="benchmark-results.json", help="Results JSON path."
+    )
+    parser.add_argument("--baseline", help="Baseline JSON to compare against.")
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Write the results to --baseline instead of comparing.",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Allowed slowdown ratio before flagging a regression (default: 0.25).",
+    )
+    parser.add_argument(
+        "--min-delta",
+        type=float,
+        default=0.05,
+        help="Ignore regressions smaller than this many seconds (default: 0.05).",
+    )
+    parser.add_argument(
+        "--keep-data", help="Generate the CSVs into this directory and keep them."
+    )
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = _build_parser().parse_args(argv)
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "sizes": {},
+    }
+    root_dir = args.keep_data or tempfile.mkdtemp(prefix="distances-bench-")
+    try:
+        for size in args.sizes:
+            config = SyntheticConfig(
+                ports=size,
+                regions=args.regions,
+                rules=args.rules,
+                hubs=args.hubs,
+                load_ratio=args.load_ratio,
+                segments_per_port=args.segments_per_port,
+                hub_coverage=args.hub_coverage,
+                distance_coverage=args.distance_coverage,
+                seed=args.seed,
+            )
+            data_dir = os.path.join(root_dir, str(size))
+            entry = _bench_size(config, data_dir, args.repeat)
+            results["sizes"][str(size)] = entry
+            phases = "\t".join(f"{k}={v:.3f}" for k, v in entry["phases"].items())
+            print(f"{size}\t{phases}", file=sys.stderr)
+    finally:
+        if not args.keep_data:
+            shutil.rmtree(root_dir, ignore_errors=True)
+
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+
+    # Sanity check: well-covered ports exist on the synthetic data, so a mode
+    # without a single proxy candidate means the coverage measure is off.
+    no_proxies = [
+        f"{size}/{mode}"
+        for size, entry in results["sizes"].items()
+        for mode, summary in entry["summaries"].items()
+        if not summary["proxy_candidates"]
+    ]
+    if no_proxies:
+        print(f"no proxy candidates: {', '.join(no_proxies)}", file=sys.stderr)
+        return EXIT_NO_PROXIES
+
+    if args.baseline and args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+        return EXIT_OK
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+        regressions = _compare(results, baseline, args.tolerance, args.min_delta)
+        if regressions:
+            print(f"{len(regressions)} phase(s) regressed", file=sys.stderr)
+            return EXIT_REGRESSION
+    return EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,556 @@
+"""Randomized differential check of the engines' optimized paths.
+
+Every case is a small random dataset built to hit the awkward corners:
+alias chains, cycles and dangling ``refer_port_id`` values, ``"7.0"``-style
+ids, inactive ports, reversed zone rules, waypoints that are the load/disch
+port itself (the ``from_id == to_id`` pseudo-segment) or unknown, and rules
+that share missing segments (the ``missing_segments_set`` dedup).
+
+The reference is the plain engine on parsed in-memory sets and dicts, with
+hash segment lookups only; each variant runs the same CSVs through one
+optimized path. Summaries, sorted missing-port lists and the row multisets
+must match exactly. The great_circle variant also checks the estimates
+added to the scan rows and to a ``--pairs`` list. A failing case is
+shrunk row by row to a minimal counter-example and written out as CSVs;
+each variant reports its first counter-example only.
+"""
+
+import argparse
+import csv
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+from collections import Counter
+
+from dataset_store import open_distance_pairs, open_segments
+from distances_engine import (
+    COMPLEX_ROW_SECTIONS,
+    DIST_COLUMNS,
+    PORT_COLUMNS,
+    RULE_COLUMNS,
+    SEGMENT_COLUMNS,
+    SEGMENT_FLAGS,
+    SIMPLE_ROW_SECTIONS,
+    ComplexDistanceEngine,
+    SimpleDistanceEngine,
+    _effective_port_id,
+    _normalize_id,
+    read_distances_csv,
+    read_rules_csv,
+    read_segments_csv,
+)
+from great_circle import (
+    ESTIMATE_FIELD,
+    ESTIMATE_SECTIONS,
+    _haversine_nm_scalar,
+    add_great_circle_estimates,
+    parse_coordinates,
+)
+from memory_budget import MemoryBudget
+from planner import plan_analysis, run_plan
+from profiling import Profiler
+
+EXIT_OK = 0
+EXIT_MISMATCH = 1
+
+CASE_FILES = {
+    "ports": ("ports.csv", PORT_COLUMNS),
+    "distances": ("distances.csv", DIST_COLUMNS),
+    "rules": ("rules.csv", RULE_COLUMNS),
+    "segments": ("segments.csv", SEGMENT_COLUMNS),
+}
+# "priority" is the complex engine in first-routable mode.
+ROW_SECTIONS = {
+    "simple": SIMPLE_ROW_SECTIONS,
+    "complex": COMPLEX_ROW_SECTIONS,
+    "priority": COMPLEX_ROW_SECTIONS,
+}
+
+
+# -- case generation --------------------------------------------------------
+
+
+def _id_text(value: int, rnd: random.Random) -> str:
+    roll = rnd.random()
+    if roll < 0.1:
+        return f"{value}.0"
+    if roll < 0.15:
+        return f" {value} "
+    return str(value)
+
+
+def _flags(columns: list[str], rnd: random.Random) -> dict:
+    return {
+        column: "TRUE" if rnd.random() < 0.2 else "FALSE"
+        for column in columns
+        if column.startswith("by_")
+    }
+
+
+def _coordinates_text(rnd: random.Random) -> str:
+    roll = rnd.random()
+    if roll < 0.15:
+        return ""
+    if roll < 0.2:
+        return rnd.choice(["n/a", "91,0", "12.5"])
+    return f"{rnd.uniform(-90.0, 90.0):.4f},{rnd.uniform(-180.0, 180.0):.4f}"
+
+
+def random_case(rnd: random.Random, max_ports: int) -> dict:
+    """One random dataset as CSV-ready rows plus the include_inactive flag."""
+    n = rnd.randint(1, max_ports)
+    regions = rnd.randint(1, 4)
+    alias_ratio = rnd.choice([0.0, 0.2, 0.5])
+
+    ports = []
+    for idx in range(1, n + 1):
+        row = {column: "" for column in PORT_COLUMNS}
+        refer = ""
+        roll = rnd.random()
+        if roll < alias_ratio:
+            refer = _id_text(rnd.randint(1, n), rnd)
+        elif roll < alias_ratio + 0.05:
+            refer = str(n + rnd.randint(1, 3))
+        row.update(
+            {
+                "id": _id_text(idx, rnd),
+                "port": f"PORT {idx}",
+                "load": "TRUE" if rnd.random() < 0.4 else "FALSE",
+                "mgo_at_port": "FALSE",
+                "is_archived": "FALSE",
+                "region_id": (
+                    "" if rnd.random() < 0.05 else str(rnd.randint(1, regions))
+                ),
+                "is_active_port": "FALSE" if rnd.random() < 0.15 else "TRUE",
+                "coordinates": _coordinates_text(rnd),
+                "refer_port_id": refer,
+            }
+        )
+        ports.append(row)
+
+    def port_ref() -> str:
+        return _id_text(rnd.randint(1, n + 2), rnd)
+
+    rules = []
+    for idx in range(1, rnd.randint(0, 6) + 1):
+        row = {column: "" for column in RULE_COLUMNS}
+        row.update(
+            {
+                "id": str(idx),
+                "distance_rule_name": f"RULE {idx}",
+                "order_of_priority": str(rnd.randint(1, 3)),
+                "zone_start_id": str(rnd.randint(1, regions)),
+                "zone_end_id": str(rnd.randint(1, regions)),
+                "discount_suez_ballast": "0",
+                "discount_suez_laden": "0",
+            }
+        )
+        for wp in range(1, rnd.randint(0, 3) + 1):
+            row[f"waypoint{wp}_id"] = port_ref()
+        rules.append(row)
+
+    segment_density = rnd.random()
+    segments = []
+    for a in range(1, n + 2):
+        for b in range(1, n + 2):
+            if rnd.random() >= segment_density / 2:
+                continue
+            row = {column: "" for column in SEGMENT_COLUMNS}
+            row.update(_flags(SEGMENT_COLUMNS, rnd))
+            row.update(
+                {
+                    "id": str(len(segments) + 1),
+                    "load_port_id": _id_text(a, rnd),
+                    "disch_port_id": _id_text(b, rnd),
+                    "total_distance": (
+                        "nan"
+                        if rnd.random() < 0.02
+                        else f"{rnd.uniform(0.0, 9000.0):.3f}"
+                    ),
+                    "total_seca_distance": f"{rnd.uniform(0.0, 90.0):.3f}",
+                }
+            )
+            segments.append(row)
+
+    distance_density = rnd.random()
+    distances = []
+    for a in range(1, n + 2):
+        for b in range(1, n + 2):
+            if rnd.random() >= distance_density / 2:
+                continue
+            row = {column: "" for column in DIST_COLUMNS}
+            row.update(_flags(DIST_COLUMNS, rnd))
+            row.update(
+                {
+                    "id": str(len(distances) + 1),
+                    "load_port_id": _id_text(a, rnd),
+                    "disch_port_id": _id_text(b, rnd),
+                    "total_distance": "100",
+                    "total_seca_distance": "0",
+                    "discount_suez_ballast": "0",
+                    "complete_distance_priority": "1",
+                }
+            )
+            distances.append(row)
+
+    return {
+        "include_inactive": rnd.random() < 0.3,
+        "ports": ports,
+        "distances": distances,
+        "rules": rules,
+        "segments": segments,
+    }
+
+
+def write_case(case: dict, directory: str) -> dict:
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for table, (name, columns) in CASE_FILES.items():
+        path = os.path.join(directory, name)
+        with open(path, "w", newline="", encoding="utf-8") as file:
+            writer = csv.DictWriter(file, columns)
+            writer.writeheader()
+            writer.writerows(case[table])
+        paths[table] = path
+    return paths
+
+
+# -- reference and variants -------------------------------------------------
+
+
+def _reference_simple(paths: dict, include_inactive: bool, work_dir: str) -> dict:
+    pairs, rows = read_distances_csv(paths["distances"])
+    ports = SimpleDistanceEngine.read_ports(paths["ports"], include_inactive)
+    return SimpleDistanceEngine(pairs, rows).analyze(ports)
+
+
+def _reference_complex(mode: str):
+    def run(paths: dict, include_inactive: bool, work_dir: str) -> dict:
+        engine = _plain_engine(mode, paths, "hash")
+        return engine.analyze(engine.read_ports(paths["ports"], include_inactive))
+
+    return run
+
+
+def _mapped_engine(mode: str, paths: dict, work_dir: str):
+    store_dir = os.path.join(work_dir, "stores")
+    if mode == "simple":
+        pairs, rows = open_distance_pairs(
+            paths["distances"], read_distances_csv, store_dir
+        )
+        return SimpleDistanceEngine(pairs, rows)
+    segments, rows = open_segments(
+        paths["segments"], read_segments_csv, list(SEGMENT_FLAGS), store_dir
+    )
+    return ComplexDistanceEngine(
+        read_rules_csv(paths["rules"]),
+        segments,
+        rows,
+        first_routable=mode == "priority",
+    )
+
+
+def _plain_engine(mode: str, paths: dict, segment_backend: str = "auto"):
+    if mode == "simple":
+        return SimpleDistanceEngine(*read_distances_csv(paths["distances"]))
+    segments, rows = read_segments_csv(paths["segments"])
+    return ComplexDistanceEngine(
+        read_rules_csv(paths["rules"]),
+        segments,
+        rows,
+        segment_backend,
+        first_routable=mode == "priority",
+    )
+
+
+def _variant_mapped(mode: str):
+    def run(paths: dict, include_inactive: bool, work_dir: str) -> dict:
+        engine = _mapped_engine(mode, paths, work_dir)
+        return engine.analyze(engine.read_ports(paths["ports"], include_inactive))
+
+    return run
+
+
+def _variant_profiled(mode: str):
+    def run(paths: dict, include_inactive: bool, work_dir: str) -> dict:
+        engine = _mapped_engine(mode, paths, work_dir)
+        engine.enable_profiling(Profiler())
+        return engine.analyze(engine.read_ports(paths["ports"], include_inactive))
+
+    return run
+
+
+def _variant_spilled(mode: str):
+    """Zero budget: every row list is forced to disk before it is read back."""
+
+    def run(paths: dict, include_inactive: bool, work_dir: str) -> dict:
+        engine = _plain_engine(mode, paths)
+        budget = MemoryBudget(0, spill_dir=work_dir)
+        budget.start()
+        try:
+            engine.enable_memory_budget(budget)
+            result = engine.analyze(engine.read_ports(paths["ports"], include_inactive))
+            budget.check()
+        finally:
+            budget.stop()
+        return result
+
+    return run
+
+
+def _variant_parallel(mode: str):
+    """Pair scan split over two worker processes, several chunks each."""
+
+    def run(paths: dict, include_inactive: bool, work_dir: str) -> dict:
+        engine = _mapped_engine(mode, paths, work_dir)
+        ports = engine.read_ports(paths["ports"], include_inactive)
+        plan = plan_analysis(engine, ports, "parallel", max_workers=2)
+        return run_plan(engine, ports, plan)
+
+    return run
+
+
+def _variant_dense(mode: str):
+    """Every segment port gets a dense matrix row (hub rows answer all legs)."""
+
+    def run(paths: dict, include_inactive: bool, work_dir: str) -> dict:
+        engine = _plain_engine(mode, paths, "dense")
+        return engine.analyze(engine.read_ports(paths["ports"], include_inactive))
+
+    return run
+
+
+def _expected_estimate(ports, from_id: str, to_id: str):
+    """Haversine of two port ids, an alias without coordinates taking its
+    master's (active or not); None when either end is unknown or has none."""
+    all_rows = {}
+    for row in ports.rows:
+        all_rows.setdefault(_normalize_id(row.get("id")), row)
+    points = []
+    for port_id in (from_id, to_id):
+        row = ports.by_id.get(port_id)
+        if row is None:
+            return None
+        point = parse_coordinates(row.get("coordinates"))
+        master = all_rows.get(_effective_port_id(row))
+        if point is None and master is not None:
+            point = parse_coordinates(master.get("coordinates"))
+        if point is None:
+            return None
+        points.append(point)
+    return round(_haversine_nm_scalar(*points[0], *points[1]), 1)
+
+
+def _check_estimates(result: dict, ports) -> None:
+    for section, from_key, to_key in ESTIMATE_SECTIONS:
+        for row in result.get(section, ()):
+            want = _expected_estimate(ports, row[from_key], row[to_key])
+            got = row[ESTIMATE_FIELD]
+            if (want is None) != (got is None) or (
+                want is not None and not math.isclose(want, got, abs_tol=0.11)
+            ):
+                raise AssertionError(
+                    f"{section} {row[from_key]}->{row[to_key]}: "
+                    f"great circle {got!r}, expected {want!r}"
+                )
+
+
+def _variant_great_circle(mode: str):
+    """Estimates on the scan rows and on a pair list (every port id pair,
+    unknown ids included) match a per-row haversine; stripped afterwards."""
+
+    def run(paths: dict, include_inactive: bool, work_dir: str) -> dict:
+        engine = _plain_engine(mode, paths)
+        ports = engine.read_ports(paths["ports"], include_inactive)
+        ids = sorted({_normalize_id(row["id"]) for row in ports.rows} | {"0"})
+        pairs = [(load_id, disch_id) for load_id in ids for disch_id in ids]
+        checked = add_great_circle_estimates(engine.check_pairs(ports, pairs), ports)
+        _check_estimates(checked, ports)
+        result = add_great_circle_estimates(engine.analyze(ports), ports)
+        _check_estimates(result, ports)
+        del result["summary"]["great_circle_estimates"]
+        for section, _, _ in ESTIMATE_SECTIONS:
+            for row in result.get(section, ()):
+                del row[ESTIMATE_FIELD]
+        return result
+
+    return run
+
+
+REFERENCES = {
+    "simple": _reference_simple,
+    "complex": _reference_complex("complex"),
+    "priority": _reference_complex("priority"),
+}
+
+# mode -> variant name -> runner(paths, include_inactive, work_dir) -> result
+VARIANTS = {
+    mode: {
+        "mapped": _variant_mapped(mode),
+        "profiled": _variant_profiled(mode),
+        "spilled": _variant_spilled(mode),
+        "parallel": _variant_parallel(mode),
+        "great_circle": _variant_great_circle(mode),
+    }
+    for mode in REFERENCES
+}
+VARIANTS["complex"]["dense"] = _variant_dense("complex")
+VARIANTS["priority"]["dense"] = _variant_dense("priority")
+
+
+
+# -- comparison and shrinking -----------------------------------------------
+
+
+def _row_multiset(rows) -> Counter:
+    return Counter(json.dumps(row, sort_keys=True, default=str) for row in rows)
+
+
+def compare_results(mode: str, expected: dict, actual: dict) -> list[str]:
+    """Human-readable differences; empty when the results are identical."""
+    diffs = []
+    for key in sorted(set(expected["summary"]) | set(actual["summary"])):
+        want = expected["summary"].get(key)
+        got = actual["summary"].get(key)
+        if want != got:
+            diffs.append(f"summary.{key}: expected {want!r}, got {got!r}")
+    if mode == "simple" and list(expected["missing_ports"]) != list(
+        actual["missing_ports"]
+    ):
+        diffs.append(
+            f"missing_ports: expected {list(expected['missing_ports'])}, "
+            f"got {list(actual['missing_ports'])}"
+        )
+    for section in ROW_SECTIONS[mode]:
+        if section == "missing_ports":
+            continue
+        want = _row_multiset(expected.get(section, []))
+        got = _row_multiset(actual.get(section, []))
+        for row in sorted((want - got).keys()):
+            diffs.append(f"{section}: only in reference {row}")
+        for row in sorted((got - want).keys()):
+            diffs.append(f"{section}: only in variant {row}")
+    return diffs
+
+
+def check_case(mode: str, variant: str, case: dict, work_dir: str) -> list[str]:
+    """Run reference and one variant on ``case``; return the differences."""
+    shutil.rmtree(work_dir, ignore_errors=True)
+    paths = write_case(case, work_dir)
+    include_inactive = case["include_inactive"]
+    try:
+        expected = REFERENCES[mode](paths, include_inactive, work_dir)
+    except (OSError, ValueError):
+        return []
+    try:
+        actual = VARIANTS[mode][variant](paths, include_inactive, work_dir)
+    except Exception as exc:
+        return [f"variant raised {type(exc).__name__}: {exc}"]
+    return compare_results(mode, expected, actual)
+
+
+def shrink_case(case: dict, still_fails) -> dict:
+    """Drop row chunks (halving down to single rows) while the case fails."""
+    changed = True
+    while changed:
+        changed = False
+        if case["include_inactive"]:
+            candidate = dict(case, include_inactive=False)
+            if still_fails(candidate):
+                case = candidate
+                changed = True
+        for table in CASE_FILES:
+            chunk = max(len(case[table]) // 2, 1)
+            while chunk >= 1:
+                start = 0
+                while start < len(case[table]):
+                    rows = case[table]
+                    kept = rows[:start] + rows[start + chunk :]
+                    candidate = dict(case, **{table: kept})
+                    if still_fails(candidate):
+                        case = candidate
+                        changed = True
+                    else:
+                        start += chunk
+                chunk //= 2
+    return case
+
+
+# -- command line -----------------------------------------------------------
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Differential check of optimized engine paths against the "
+        "reference loops on random datasets.",
+    )
+    parser.add_argument("--cases", type=int, default=200, help="Cases per mode.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-ports", type=int, default=12)
+    parser.add_argument(
+        "--mode", choices=[*REFERENCES, "all"], default="all"
+    )
+    parser.add_argument(
+        "--variant",
+        action="append",
+        help="Only run this variant (repeatable; default: all).",
+    )
+    parser.add_argument(
+        "--failures-dir",
+        default="oracle-failures",
+        help="Where shrunk counter-examples are written as CSVs.",
+    )
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = _build_parser().parse_args(argv)
+    modes = list(REFERENCES) if args.mode == "all" else [args.mode]
+    rnd = random.Random(args.seed)
+    root_dir = tempfile.mkdtemp(prefix="distances-oracle-")
+    work_dir = os.path.join(root_dir, "case")
+    failed = set()
+    try:
+        for case_no in range(args.cases):
+            case = random_case(rnd, args.max_ports)
+            for mode in modes:
+                for variant in args.variant or VARIANTS[mode]:
+                    if variant not in VARIANTS[mode] or (mode, variant) in failed:
+                        continue
+                    if not check_case(mode, variant, case, work_dir):
+                        continue
+                    failed.add((mode, variant))
+                    small = shrink_case(
+                        case, lambda c: bool(check_case(mode, variant, c, work_dir))
+                    )
+                    target = os.path.join(
+                        args.failures_dir, f"{mode}-{variant}-case{case_no}"
+                    )
+                    write_case(small, target)
+                    with open(
+                        os.path.join(target, "case.json"), "w", encoding="utf-8"
+                    ) as file:
+                        json.dump(small, file, indent=1)
+                    print(
+                        f"FAIL {mode}/{variant} case {case_no} -> {target}",
+                        file=sys.stderr,
+                    )
+                    for line in check_case(mode, variant, small, work_dir):
+                        print(f"  {line}", file=sys.stderr)
+    finally:
+        shutil.rmtree(root_dir, ignore_errors=True)
+
+    print(
+        f"{args.cases} cases x {', '.join(modes)}: "
+        f"{len(failed)} failing variant(s)",
+        file=sys.stderr,
+    )
+    return EXIT_MISMATCH if failed else EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
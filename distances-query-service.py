@@ -0,0 +1,155 @@
+"""Serve pair coverage queries over HTTP/JSON, or query a running service."""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+
+from query_service import (
+    DEFAULT_HOST,
+    DEFAULT_POLL_SECONDS,
+    DEFAULT_PORT,
+    QueryClient,
+    QueryService,
+    make_server,
+)
+
+EXIT_OK = 0
+EXIT_NOT_COVERED = 1
+EXIT_INPUT_ERROR = 2
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Local query service keeping the distance indexes loaded."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="Load the CSVs and serve queries.")
+    serve.add_argument("--ports", required=True, help="Ports CSV")
+    serve.add_argument("--distances", help="Complete distances CSV (simple check)")
+    serve.add_argument("--rules", help="Distance rules CSV (complex check)")
+    serve.add_argument("--segments", help="ARW segments CSV (complex check)")
+    serve.add_argument(
+        "--include-inactive",
+        action="store_true",
+        help="Take inactive ports into account",
+    )
+    serve.add_argument("--host", default=DEFAULT_HOST)
+    serve.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve.add_argument(
+        "--poll-seconds",
+        type=float,
+        default=DEFAULT_POLL_SECONDS,
+        help="Input file check interval; 0 disables automatic reloads.",
+    )
+    serve.add_argument("--verbose", action="store_true", help="Log every request")
+
+    query = commands.add_parser("query", help="Ask a running service.")
+    query.add_argument("--url", default=f"http://{DEFAULT_HOST}:{DEFAULT_PORT}")
+    query.add_argument(
+        "pairs",
+        nargs="*",
+        metavar="DISCH:LOAD",
+        help="Port id pairs; several are sent as one batch.",
+    )
+    query.add_argument("--health", action="store_true", help="Show service status")
+    query.add_argument("--reload", action="store_true", help="Reload the inputs now")
+    query.add_argument(
+        "--repeat",
+        type=int,
+        default=1,
+        help="Send the query N times and report round-trip latency.",
+    )
+    return parser
+
+
+def _parse_pair(text: str) -> tuple[str, str]:
+    disch, sep, load = text.partition(":")
+    if not sep or not disch or not load:
+        raise ValueError(f"Expected DISCH:LOAD, got {text!r}")
+    return disch, load
+
+
+def _serve(args: argparse.Namespace) -> int:
+    paths = {
+        "ports": args.ports,
+        "distances": args.distances,
+        "rules": args.rules,
+        "segments": args.segments,
+    }
+    started = time.perf_counter()
+    try:
+        service = QueryService(paths, args.include_inactive, args.poll_seconds)
+    except (OSError, ValueError) as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        return EXIT_INPUT_ERROR
+    print(f"load_seconds\t{time.perf_counter() - started:.3f}", file=sys.stderr)
+    if args.poll_seconds > 0:
+        service.watch()
+    server = make_server(service, args.host, args.port, args.verbose)
+    host, port = server.server_address[:2]
+    print(f"serving\thttp://{host}:{port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+        server.server_close()
+    return EXIT_OK
+
+
+def _query(args: argparse.Namespace) -> int:
+    client = QueryClient(args.url)
+    try:
+        if args.reload:
+            print(json.dumps(client.reload(), indent=1))
+        if args.health:
+            print(json.dumps(client.health(), indent=1))
+        if not args.pairs:
+            return EXIT_OK
+        pairs = [_parse_pair(text) for text in args.pairs]
+        timings = []
+        for _ in range(max(args.repeat, 1)):
+            started = time.perf_counter()
+            if len(pairs) == 1:
+                answers = [client.pair(*pairs[0])]
+            else:
+                answers = client.pairs(pairs)["results"]
+            timings.append(time.perf_counter() - started)
+    except (OSError, ValueError) as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        return EXIT_INPUT_ERROR
+    finally:
+        client.close()
+
+    print(json.dumps(answers, indent=1, ensure_ascii=False))
+    if args.repeat > 1:
+        print(
+            f"round_trip_ms\tmedian {statistics.median(timings) * 1000:.3f}, "
+            f"max {max(timings) * 1000:.3f}",
+            file=sys.stderr,
+        )
+    # An answer with an error (unknown port id) covers nothing.
+    covered = all(
+        "error" not in answer
+        and all(
+            answer.get(check, {}).get("covered", True)
+            for check in ("simple", "complex")
+        )
+        for answer in answers
+    )
+    return EXIT_OK if covered else EXIT_NOT_COVERED
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = _build_parser().parse_args(argv)
+    if args.command == "serve":
+        return _serve(args)
+    return _query(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
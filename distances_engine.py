@@ -0,0 +1,1960 @@
+"""GUI-free parsing and analysis shared by the analyzers and the CLI.
+
+Both Tk tools and ``distances-analyzer-cli.py`` go through this module, so
+an analysis run headless gives exactly the same rows as the GUI.
+"""
+
+import csv
+import json
+import os
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+
+from dataset_store import open_distance_pairs, open_segments
+from memory_budget import new_rows
+from profiling import build_profile_lines, profile_phase
+from segment_matrix import DENSE_MIN_DENSITY, UNCOVERED, build_segment_matrix
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except Exception:
+    pa = None
+    pq = None
+
+PORT_COLUMNS = [
+    "id",
+    "port",
+    "load",
+    "mgo_at_port",
+    "is_archived",
+    "region_id",
+    "port_country_id",
+    "port_code",
+    "port_type",
+    "is_active_port",
+    "coordinates",
+    "port_nickname",
+    "refer_port_id",
+]
+
+DIST_COLUMNS = [
+    "id",
+    "load_port_id",
+    "disch_port_id",
+    "total_distance",
+    "total_seca_distance",
+    "by_panama_canal_rp",
+    "by_gibraltar_strait_rp",
+    "by_cape_good_hope_rp",
+    "by_magellan_strait_rp",
+    "by_cape_horn_rp",
+    "by_singapore_strait_rp",
+    "by_torres_strait_rp",
+    "by_vitiaz_strait_rp",
+    "by_malacca_strait_rp",
+    "by_kiel_canal_rp",
+    "by_skaw_area_rp",
+    "by_suez_canal_rp",
+    "by_gulf_of_aden_rp",
+    "by_sunda_strait_rp",
+    "discount_suez_ballast",
+    "complete_distance_priority",
+    "by_bosporus_strait_rp",
+]
+
+RULE_COLUMNS = [
+    "id",
+    "distance_rule_name",
+    "order_of_priority",
+    "zone_start_id",
+    "zone_end_id",
+    "waypoint1_id",
+    "waypoint2_id",
+    "waypoint3_id",
+    "waypoint4_id",
+    "waypoint5_id",
+    "waypoint6_id",
+    "discount_suez_ballast",
+    "discount_suez_laden",
+]
+
+SEGMENT_COLUMNS = [
+    "id",
+    "load_port_id",
+    "disch_port_id",
+    "total_distance",
+    "total_seca_distance",
+    "waypoint_data",
+    "updated_at",
+    "by_panama_canal_rp",
+    "by_gibraltar_strait_rp",
+    "by_cape_good_hope_rp",
+    "by_magellan_strait_rp",
+    "by_cape_horn_rp",
+    "by_singapore_strait_rp",
+    "by_torres_strait_rp",
+    "by_vitiaz_strait_rp",
+    "by_kiel_canal_rp",
+    "by_skaw_area_rp",
+    "by_suez_canal_rp",
+    "by_gulf_of_aden_rp",
+    "by_sunda_strait_rp",
+    "by_bosporus_strait_rp",
+    "by_malacca_strait_rp",
+]
+
+# Segment flag key -> segments CSV column, in the generator's field order.
+SEGMENT_FLAGS = {
+    "byPanamaCanalRp": "by_panama_canal_rp",
+    "byCapeGoodHopeRp": "by_cape_good_hope_rp",
+    "byCapeHornRp": "by_cape_horn_rp",
+    "byTorresStraitRp": "by_torres_strait_rp",
+    "byBosporusStraitRp": "by_bosporus_strait_rp",
+    "bySkawAreaRp": "by_skaw_area_rp",
+    "byGulfOfAdenRp": "by_gulf_of_aden_rp",
+    "byGibraltarStraitRp": "by_gibraltar_strait_rp",
+    "byMagellanStraitRp": "by_magellan_strait_rp",
+    "bySingaporeStraitRp": "by_singapore_strait_rp",
+    "byVitiazStraitRp": "by_vitiaz_strait_rp",
+    "byKielCanalRp": "by_kiel_canal_rp",
+    "bySuezCanalRp": "by_suez_canal_rp",
+    "bySundaStraitRp": "by_sunda_strait_rp",
+}
+
+# Pseudo-segment used when a route leg starts and ends on the same port.
+SAME_PORT_SEGMENT = {
+    "totalDistance": 1.0,
+    "secaDistance": 0.0,
+    **{flag: False for flag in SEGMENT_FLAGS},
+}
+
+SEGMENT_BACKENDS = ("auto", "dense", "hash")
+
+SIMPLE_ROW_SECTIONS = ("missing", "missing_ports")
+COMPLEX_ROW_SECTIONS = ("missing_segments", "missing_complete", "effective_rules")
+PAIR_ROW_SECTIONS = ("pairs",)
+# Optional report sections any mode may carry.
+REPORT_ROW_SECTIONS = ("proxy_suggestions", "segment_anomalies")
+PARQUET_BATCH_ROWS = 1 << 16
+# Pair list input: any CSV with these columns (extra columns are ignored).
+PAIR_COLUMNS = ["load_port_id", "disch_port_id"]
+# Statuses of a checked pair per mode: (covered, not covered).
+SIMPLE_PAIR_STATUSES = (("found", "same_port"), ("missing",))
+COMPLEX_PAIR_STATUSES = (("routed",), ("missing_segments", "no_rule"))
+PORT_PAIR_STATUSES = ("unknown_port", "inactive_port")
+REGION_COLUMNS = [
+    "disch_region_id",
+    "load_region_id",
+    "pairs",
+    "found",
+    "missing",
+    "no_rule",
+]
+OUTPUT_FORMATS = ("json", "tsv", "parquet")
+
+
+def _as_bool(value: str) -> bool:
+    return str(value).strip().lower() in {"true", "1", "yes", "y", "t"}
+
+
+def _as_number(value: str) -> float:
+    try:
+        return float(str(value).strip())
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _normalize_id(value: object) -> str:
+    if value is None:
+        return ""
+    raw = str(value).strip()
+    if raw == "":
+        return ""
+    try:
+        num = float(raw)
+        if num.is_integer():
+            return str(int(num))
+        return str(num)
+    except ValueError:
+        return raw
+
+
+def _effective_port_id(port: dict) -> str:
+    """ID to use for distance lookup: refer_port_id if set, else port id."""
+    ref = _normalize_id(port.get("refer_port_id", ""))
+    if ref:
+        return ref
+    return _normalize_id(port.get("id", ""))
+
+
+def _resolve_master_port(port: dict, ports_by_id: dict) -> dict:
+    """Return the final non-alias refer target; fallback to the given row."""
+    current = port
+    seen = set()
+    while True:
+        ref = _normalize_id(current.get("refer_port_id", ""))
+        if not ref or ref in seen or ref not in ports_by_id:
+            return current
+        seen.add(ref)
+        current = ports_by_id[ref]
+
+
+def _alias_depth(port: dict, ports_by_id: dict) -> int:
+    """Number of refer_port_id hops _resolve_master_port follows."""
+    depth = 0
+    current = port
+    seen = set()
+    while True:
+        ref = _normalize_id(current.get("refer_port_id", ""))
+        if not ref or ref in seen or ref not in ports_by_id:
+            return depth
+        seen.add(ref)
+        depth += 1
+        current = ports_by_id[ref]
+
+
+def _report_progress(progress, checked: int, total: int) -> None:
+    if progress is not None and (checked % 200 == 0 or checked == total):
+        progress(int((checked / total) * 100))
+
+
+@dataclass
+class PortsData:
+    rows: list
+    load_ports: list
+    disch_ports: list
+    by_id: dict
+    by_effective_id: dict
+
+
+def validate_headers(actual, expected, label: str, strict_order: bool = True) -> None:
+    """Raise ValueError when a CSV header does not match the expected columns.
+
+    The simple tool requires the exact header order; the complex tool only
+    requires every column to be present (``strict_order=False``).
+    """
+    if not actual:
+        raise ValueError(f"{label} has no headers.")
+    if strict_order:
+        trimmed = [h.strip() for h in actual]
+        if trimmed != expected:
+            raise ValueError(
+                f"{label} header mismatch.\nExpected:\n{expected}\nGot:\n{trimmed}"
+            )
+        return
+    actual_set = {str(h).strip() for h in actual if h is not None}
+    expected_set = set(expected)
+    missing = expected_set - actual_set
+    if missing:
+        raise ValueError(
+            f"{label} is missing required columns (order does not matter):\n"
+            f"Missing: {sorted(missing)}\n"
+            f"Required: {sorted(expected_set)}"
+        )
+
+
+def read_ports_csv(
+    path: str,
+    include_inactive: bool = False,
+    strict_order: bool = True,
+    prefer_master: bool = False,
+) -> PortsData:
+    """Parse the Ports CSV and split it into load and disch port lists.
+
+    With ``prefer_master`` the master row wins ``by_effective_id`` when
+    aliases share the same effective id (complex tool display rule).
+    """
+    with open(path, newline="", encoding="utf-8-sig") as file:
+        reader = csv.DictReader(file)
+        validate_headers(reader.fieldnames, PORT_COLUMNS, "Ports CSV", strict_order)
+        rows = list(reader)
+
+    load_ports = []
+    disch_ports = []
+    by_id = {}
+
+    for row in rows:
+        port_id = _normalize_id(row["id"])
+        if not port_id:
+            continue
+        is_load = _as_bool(row["load"])
+        is_active = _as_bool(row["is_active_port"])
+        if not include_inactive and not is_active:
+            continue
+        by_id[port_id] = row
+        disch_ports.append(row)
+        if is_load:
+            load_ports.append(row)
+
+    by_effective_id = {}
+    for row in by_id.values():
+        eff = _effective_port_id(row)
+        if (
+            not prefer_master
+            or eff not in by_effective_id
+            or _normalize_id(row.get("id")) == eff
+        ):
+            by_effective_id[eff] = row
+
+    return PortsData(
+        rows=rows,
+        load_ports=load_ports,
+        disch_ports=disch_ports,
+        by_id=by_id,
+        by_effective_id=by_effective_id,
+    )
+
+
+def read_distances_csv(path: str) -> tuple[set[tuple[str, str]], int]:
+    """Parse the Complete Distances CSV into unique (load, disch) pairs."""
+    with open(path, newline="", encoding="utf-8-sig") as file:
+        reader = csv.DictReader(file)
+        validate_headers(reader.fieldnames, DIST_COLUMNS, "Complete Distances CSV")
+        pairs = set()
+        row_count = 0
+        for row in reader:
+            row_count += 1
+            load_id = _normalize_id(row["load_port_id"])
+            disch_id = _normalize_id(row["disch_port_id"])
+            if load_id and disch_id:
+                pairs.add((load_id, disch_id))
+        return pairs, row_count
+
+
+def read_rules_csv(path: str) -> list:
+    with open(path, newline="", encoding="utf-8-sig") as file:
+        reader = csv.DictReader(file)
+        validate_headers(
+            reader.fieldnames, RULE_COLUMNS, "Distance Rules CSV", strict_order=False
+        )
+        rows = list(reader)
+
+    normalized = []
+    for row in rows:
+        normalized.append(
+            {
+                "id": _normalize_id(row["id"]),
+                "distance_rule_name": row["distance_rule_name"],
+                "order_of_priority": int(_as_number(row["order_of_priority"])),
+                "zone_start_id": _normalize_id(row["zone_start_id"]),
+                "zone_end_id": _normalize_id(row["zone_end_id"]),
+                "waypoints": [
+                    _normalize_id(row[f"waypoint{i}_id"])
+                    for i in range(1, 7)
+                    if _normalize_id(row.get(f"waypoint{i}_id", ""))
+                ],
+                "discount_suez_ballast": _as_number(row["discount_suez_ballast"]),
+                "discount_suez_laden": _as_number(row["discount_suez_laden"]),
+            }
+        )
+    return normalized
+
+
+def read_segments_csv(path: str) -> tuple[dict, int]:
+    """Parse the Distances ARW CSV into a ``"from:to"`` keyed segment dict."""
+    with open(path, newline="", encoding="utf-8-sig") as file:
+        reader = csv.DictReader(file)
+        validate_headers(
+            reader.fieldnames,
+            SEGMENT_COLUMNS,
+            "Distances ARW (segments) CSV",
+            strict_order=False,
+        )
+        segments = {}
+        row_count = 0
+        for row in reader:
+            row_count += 1
+            load_id = _normalize_id(row["load_port_id"])
+            disch_id = _normalize_id(row["disch_port_id"])
+            if not load_id or not disch_id:
+                continue
+            key = f"{load_id}:{disch_id}"
+            segment = {
+                "totalDistance": _as_number(row["total_distance"]),
+                "secaDistance": _as_number(row["total_seca_distance"]),
+            }
+            for flag, column in SEGMENT_FLAGS.items():
+                segment[flag] = _as_bool(row[column])
+            segments[key] = segment
+        return segments, row_count
+
+
+def read_pairs_csv(path: str) -> list[tuple[str, str]]:
+    """Parse a pair list CSV into ``(load_id, disch_id)`` tuples, in order."""
+    with open(path, newline="", encoding="utf-8-sig") as file:
+        reader = csv.DictReader(file)
+        validate_headers(
+            reader.fieldnames, PAIR_COLUMNS, "Pairs CSV", strict_order=False
+        )
+        return [
+            (_normalize_id(row["load_port_id"]), _normalize_id(row["disch_port_id"]))
+            for row in reader
+        ]
+
+
+def load_distance_pairs(path: str) -> tuple[set[tuple[str, str]], int]:
+    """Distances CSV pairs, memory-mapped from the shared dataset store."""
+    return open_distance_pairs(path, read_distances_csv)
+
+
+def load_segments(path: str) -> tuple[dict, int]:
+    """Segments CSV mapping, memory-mapped from the shared dataset store."""
+    return open_segments(path, read_segments_csv, list(SEGMENT_FLAGS))
+
+
+def _pair_port_ids(distance_pairs) -> set[str]:
+    if hasattr(distance_pairs, "port_ids"):
+        return distance_pairs.port_ids()
+    port_ids = set()
+    for load_id, disch_id in distance_pairs:
+        port_ids.add(load_id)
+        port_ids.add(disch_id)
+    return port_ids
+
+
+def _resolve_pair_ports(ports: PortsData, pairs) -> dict:
+    """Master row of every distinct id in ``pairs``, resolved once; ids
+    outside ``ports.by_id`` map to "unknown_port" or "inactive_port"."""
+    resolved = {}
+    all_ids = None
+    for pair in pairs:
+        for port_id in pair:
+            if port_id in resolved:
+                continue
+            row = ports.by_id.get(port_id)
+            if row is not None:
+                resolved[port_id] = _resolve_master_port(row, ports.by_id)
+                continue
+            if all_ids is None:
+                all_ids = {_normalize_id(row["id"]) for row in ports.rows}
+            resolved[port_id] = (
+                "inactive_port" if port_id in all_ids else "unknown_port"
+            )
+    return resolved
+
+
+def _check_pair_list(
+    pairs, resolved: dict, decide, statuses: tuple, blank: dict | None = None
+) -> dict:
+    """Rows for ``pairs`` in input order; ``decide(disch, load)`` runs once
+    per distinct pair of master ports. Rows of unknown or inactive ports
+    take the decision columns from ``blank``."""
+    covered_statuses, missing_statuses = statuses
+    decisions = {}
+    counts = dict.fromkeys(
+        covered_statuses + missing_statuses + PORT_PAIR_STATUSES, 0
+    )
+    rows = []
+    for load_id, disch_id in pairs:
+        load = resolved[load_id]
+        disch = resolved[disch_id]
+        row = {"load_id": load_id, "disch_id": disch_id}
+        if isinstance(load, str) or isinstance(disch, str):
+            row["load_name"] = "" if isinstance(load, str) else load["port"]
+            row["disch_name"] = "" if isinstance(disch, str) else disch["port"]
+            row.update(blank or {})
+            row["status"] = disch if isinstance(disch, str) else load
+        else:
+            key = (id(disch), id(load))
+            decision = decisions.get(key)
+            if decision is None:
+                decision = decisions[key] = decide(disch, load)
+            row["load_name"] = load["port"]
+            row["disch_name"] = disch["port"]
+            row.update(decision)
+        counts[row["status"]] += 1
+        rows.append(row)
+    covered = sum(counts[status] for status in covered_statuses)
+    return {
+        "summary": {
+            "total_pairs": len(rows),
+            "distinct_pairs": len(decisions),
+            "covered": covered,
+            "not_covered": len(rows) - covered,
+            **counts,
+        },
+        "pairs": rows,
+    }
+
+
+def _region_result(counts: dict) -> dict:
+    """Rows and totals from ``(disch_region, load_region) -> [pairs, found,
+    no_rule]`` counts; missing is what is neither found nor without rule."""
+    rows = []
+    for (disch_region, load_region), (pairs, found, no_rule) in sorted(
+        counts.items()
+    ):
+        rows.append(
+            {
+                "disch_region_id": disch_region,
+                "load_region_id": load_region,
+                "pairs": pairs,
+                "found": found,
+                "missing": pairs - found - no_rule,
+                "no_rule": no_rule,
+            }
+        )
+    return {
+        "summary": {
+            "region_pairs": len(rows),
+            "pairs": sum(row["pairs"] for row in rows),
+            "found": sum(row["found"] for row in rows),
+            "missing": sum(row["missing"] for row in rows),
+            "no_rule": sum(row["no_rule"] for row in rows),
+        },
+        "regions": rows,
+    }
+
+
+def write_region_csv(result: dict, path: str) -> None:
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.DictWriter(file, REGION_COLUMNS)
+        writer.writeheader()
+        writer.writerows(result["regions"])
+
+
+class SimpleDistanceEngine:
+    """Load x disch coverage check against the complete distances pairs."""
+
+    mode = "simple"
+    profiler = None
+    memory_budget = None
+
+    def __init__(self, distance_pairs: set, distance_rows: int = 0) -> None:
+        self.distance_pairs = distance_pairs
+        self.distance_rows = distance_rows
+
+    def enable_profiling(self, profiler, counters: bool = True) -> None:
+        self.profiler = profiler
+
+    def enable_memory_budget(self, budget) -> None:
+        """Collect missing rows in spill-to-disk lists under ``budget``."""
+        self.memory_budget = budget
+
+    @classmethod
+    def from_csv(cls, distances_path: str) -> "SimpleDistanceEngine":
+        pairs, rows = load_distance_pairs(distances_path)
+        return cls(pairs, rows)
+
+    @staticmethod
+    def read_ports(path: str, include_inactive: bool = False) -> PortsData:
+        return read_ports_csv(path, include_inactive)
+
+    def analyze(
+        self, ports: PortsData, progress=None, workers: int | None = None
+    ) -> dict:
+        return self.analyze_missing_distances(ports, progress, workers)
+
+    def check_pairs(self, ports: PortsData, pairs) -> dict:
+        """Coverage of each ``(load_id, disch_id)`` in ``pairs``, aliases
+        resolved to their master port, without the load x disch scan."""
+        distance_pairs = self.distance_pairs or set()
+
+        def decide(disch: dict, load: dict) -> dict:
+            load_eff = _effective_port_id(load)
+            disch_eff = _effective_port_id(disch)
+            if load_eff == disch_eff:
+                return {"status": "same_port"}
+            if (load_eff, disch_eff) in distance_pairs or (
+                disch_eff,
+                load_eff,
+            ) in distance_pairs:
+                return {"status": "found"}
+            return {"status": "missing"}
+
+        with profile_phase(self.profiler, "resolve_pair_ports"):
+            resolved = _resolve_pair_ports(ports, pairs)
+        with profile_phase(self.profiler, "check_pairs"):
+            return _check_pair_list(pairs, resolved, decide, SIMPLE_PAIR_STATUSES)
+
+    def region_coverage(self, ports: PortsData) -> dict:
+        """Found / missing load x disch pairs per (disch region, load region).
+
+        Counted, not scanned: ports are grouped by effective id and region,
+        each region pair's product minus its same-port pairs is the number
+        of checked pairs, and each distinct distance pair adds the product
+        of its two ports' counts to the found cells. Time is proportional
+        to ports plus distance pairs (plus regions squared).
+        """
+        load_regions = Counter()
+        disch_regions = Counter()
+        load_by_eff = defaultdict(Counter)
+        disch_by_eff = defaultdict(Counter)
+        for rows, regions, by_eff in (
+            (ports.load_ports, load_regions, load_by_eff),
+            (ports.disch_ports, disch_regions, disch_by_eff),
+        ):
+            for row in rows:
+                region = _normalize_id(row.get("region_id", ""))
+                regions[region] += 1
+                by_eff[_effective_port_id(row)][region] += 1
+
+        counts = {
+            (disch_region, load_region): [disch_count * load_count, 0, 0]
+            for disch_region, disch_count in disch_regions.items()
+            for load_region, load_count in load_regions.items()
+        }
+
+        def add(load_eff: str, disch_eff: str, index: int, sign: int) -> None:
+            for load_region, load_count in load_by_eff[load_eff].items():
+                for disch_region, disch_count in disch_by_eff[disch_eff].items():
+                    counts[(disch_region, load_region)][index] += (
+                        sign * load_count * disch_count
+                    )
+
+        with profile_phase(self.profiler, "region_counts"):
+            # Same effective id on both sides: skipped by the scan.
+            for eff in load_by_eff.keys() & disch_by_eff.keys():
+                add(eff, eff, 0, -1)
+            seen = set()
+            for first, second in self.distance_pairs or ():
+                if first == second:
+                    continue
+                key = (first, second) if first < second else (second, first)
+                if key in seen:
+                    continue
+                for load_eff, disch_eff in ((first, second), (second, first)):
+                    if load_eff in load_by_eff and disch_eff in disch_by_eff:
+                        seen.add(key)
+                        add(load_eff, disch_eff, 1, 1)
+        return _region_result(counts)
+
+    def analyze_missing_distances(
+        self, ports: PortsData, progress=None, workers: int | None = None
+    ) -> dict:
+        """Check every load x disch pair; ``workers`` > 1 scans contiguous
+        load-port chunks in a process pool (same rows, same order)."""
+        distance_pairs = self.distance_pairs or set()
+
+        load_ports = ports.load_ports
+        disch_ports = ports.disch_ports
+
+        total_pairs = len(distance_pairs)
+        total_distance_rows = self.distance_rows
+        total_ports_rows = len(ports.rows)
+        total_load = len(load_ports)
+        total_disch = len(disch_ports)
+
+        missing = new_rows(self.memory_budget)
+
+        with profile_phase(self.profiler, "index_pair_ports"):
+            distance_port_ids = _pair_port_ids(distance_pairs)
+
+        with profile_phase(self.profiler, "scan_pairs"):
+            if workers and workers > 1:
+                found, checked = 0, 0
+                for chunk_found, chunk_checked, rows in _scan_in_pool(
+                    self, ports, _chunks(load_ports, workers), workers, progress
+                ):
+                    found += chunk_found
+                    checked += chunk_checked
+                    missing.extend(rows)
+            else:
+                found, checked = self._scan_pairs(
+                    load_ports, disch_ports, distance_pairs, missing, progress
+                )
+
+        with profile_phase(self.profiler, "missing_ports"):
+            effective_ids = {
+                _effective_port_id(row) for row in load_ports + disch_ports
+            }
+            missing_ports = sorted(
+                eid for eid in effective_ids if eid and eid not in distance_port_ids
+            )
+
+        if self.profiler is not None:
+            self.profiler.count("pair_checks", checked)
+            self.profiler.count("pair_hits", found)
+            self.profiler.count("pair_misses", len(missing))
+            self.profiler.count("same_effective_skips", checked - found - len(missing))
+
+        return {
+            "summary": {
+                "total_ports_rows": total_ports_rows,
+                "total_load_ports": total_load,
+                "total_disch_ports": total_disch,
+                "total_distance_rows": total_distance_rows,
+                "total_distances": total_pairs,
+                "found": found,
+                "missing": len(missing),
+                "missing_ports_count": len(missing_ports),
+            },
+            "missing": missing,
+            "missing_ports": missing_ports,
+        }
+
+    def _scan_pairs(
+        self, load_ports, disch_ports, distance_pairs, missing, progress
+    ) -> tuple[int, int]:
+        """Fill ``missing`` and return ``(found, checked)``."""
+        found = 0
+        total_checks = max(len(load_ports) * len(disch_ports), 1)
+        checked = 0
+        for load in load_ports:
+            load_eff = _effective_port_id(load)
+            load_id = _normalize_id(load["id"])
+            load_name = load["port"]
+            for disch in disch_ports:
+                disch_eff = _effective_port_id(disch)
+                disch_id = _normalize_id(disch["id"])
+                if load_eff == disch_eff:
+                    checked += 1
+                    continue
+                if (load_eff, disch_eff) in distance_pairs or (
+                    disch_eff,
+                    load_eff,
+                ) in distance_pairs:
+                    found += 1
+                else:
+                    missing.append(
+                        {
+                            "load_name": load_name,
+                            "load_id": load_id,
+                            "disch_name": disch["port"],
+                            "disch_id": disch_id,
+                        }
+                    )
+                checked += 1
+                _report_progress(progress, checked, total_checks)
+        return found, checked
+
+
+class ComplexDistanceEngine:
+    """Rule-based complete distance generation check over ARW segments."""
+
+    mode = "complex"
+    profiler = None
+    memory_budget = None
+    segment_matrix = None
+    _resolve_master_port = staticmethod(_resolve_master_port)
+
+    def __init__(
+        self,
+        rules: list,
+        segments: dict,
+        segments_rows: int = 0,
+        segment_backend: str = "auto",
+        first_routable: bool = False,
+    ) -> None:
+        if segment_backend not in SEGMENT_BACKENDS:
+            raise ValueError(f"Unknown segment backend: {segment_backend}")
+        self.rules_data = rules
+        self.segments_data = segments
+        self.segments_rows = segments_rows
+        self.segment_backend = segment_backend
+        self.first_routable = first_routable
+        self._matrix_ready = segment_backend == "hash"
+
+    def prepare_segment_matrix(self):
+        """Build the dense hub matrix once.
+
+        "auto" builds it for mapped segment stores only, with rows picked by
+        density: a matrix cell beats their probe-and-decode, but not a plain
+        dict of already decoded segments. "dense" gives every segment port a
+        row, within the size cap.
+        """
+        if not self._matrix_ready and (
+            self.segment_backend == "dense" or hasattr(self.segments_data, "columns")
+        ):
+            self.segment_matrix = build_segment_matrix(
+                self.segments_data or {},
+                list(SEGMENT_FLAGS),
+                0.0 if self.segment_backend == "dense" else DENSE_MIN_DENSITY,
+            )
+            self._matrix_ready = True
+        return self.segment_matrix
+
+    def enable_memory_budget(self, budget) -> None:
+        """Spill result rows to disk and trim segment memos under ``budget``."""
+        self.memory_budget = budget
+        if hasattr(self.segments_data, "trim_memo"):
+            budget.add_listener(self.segments_data.trim_memo)
+
+    def enable_profiling(self, profiler, counters: bool = True) -> None:
+        """Record phases; with ``counters`` also shadow the hot methods on
+        this instance with counting wrappers."""
+        self.profiler = profiler
+        if not counters:
+            return
+        find_rules = self._find_rules_for_pair
+        lookup_segment = self._lookup_segment
+        resolve_master = self._resolve_master_port
+
+        def find_rules_observed(disch_port: dict, load_port: dict) -> list:
+            matches = find_rules(disch_port, load_port)
+            profiler.observe("rules_per_pair", len(matches))
+            return matches
+
+        def lookup_segment_observed(from_id: str, to_id: str) -> dict | None:
+            segment = lookup_segment(from_id, to_id)
+            if from_id == to_id:
+                profiler.count("segment_same_port")
+            elif segment:
+                profiler.count("segment_hits")
+            else:
+                profiler.count("segment_misses")
+            return segment
+
+        def resolve_master_observed(port: dict, ports_by_id: dict) -> dict:
+            profiler.observe("alias_depth", _alias_depth(port, ports_by_id))
+            return resolve_master(port, ports_by_id)
+
+        self._find_rules_for_pair = profiler.instrument(
+            "_find_rules_for_pair", find_rules_observed
+        )
+        self._lookup_segment = profiler.instrument(
+            "_lookup_segment", lookup_segment_observed
+        )
+        self._resolve_master_port = profiler.instrument(
+            "_resolve_master_port", resolve_master_observed
+        )
+        self._build_distance_for_rule = profiler.instrument(
+            "_build_distance_for_rule", self._build_distance_for_rule
+        )
+
+    @classmethod
+    def from_csv(cls, rules_path: str, segments_path: str) -> "ComplexDistanceEngine":
+        rules = read_rules_csv(rules_path)
+        segments, rows = load_segments(segments_path)
+        return cls(rules, segments, rows)
+
+    @staticmethod
+    def read_ports(path: str, include_inactive: bool = False) -> PortsData:
+        return read_ports_csv(
+            path, include_inactive, strict_order=False, prefer_master=True
+        )
+
+    def _find_rules_for_pair(self, disch_port: dict, load_port: dict) -> list:
+        disch_zone = _normalize_id(disch_port.get("region_id", ""))
+        load_zone = _normalize_id(load_port.get("region_id", ""))
+        if not disch_zone or not load_zone:
+            return []
+
+        matches = []
+        for rule in self.rules_data or []:
+            if rule["zone_start_id"] == disch_zone and rule["zone_end_id"] == load_zone:
+                matches.append({"rule": rule, "reversed": False})
+            elif rule["zone_start_id"] == load_zone and rule["zone_end_id"] == disch_zone:
+                matches.append({"rule": rule, "reversed": True})
+
+        return sorted(
+            matches,
+            key=lambda r: r["rule"].get("order_of_priority", 999),
+        )
+
+    def _lookup_segment(self, from_id: str, to_id: str) -> dict | None:
+        if from_id == to_id:
+            return dict(SAME_PORT_SEGMENT)
+
+        if self.segment_matrix is not None:
+            segment = self.segment_matrix.lookup(from_id, to_id)
+            if segment is not UNCOVERED:
+                return segment
+
+        segments = self.segments_data or {}
+        direct = segments.get(f"{from_id}:{to_id}")
+        if direct:
+            return direct
+        reverse = segments.get(f"{to_id}:{from_id}")
+        if reverse:
+            return reverse
+        return None
+
+    def _rule_waypoint_ids(
+        self, rule: dict, reversed_rule: bool, ports_by_id: dict
+    ) -> list[str]:
+        """Effective ids of ``rule``'s known waypoints, in route order."""
+        waypoint_ids = [
+            _effective_port_id(
+                self._resolve_master_port(ports_by_id[_normalize_id(wp)], ports_by_id)
+            )
+            for wp in rule["waypoints"]
+            if _normalize_id(wp) in ports_by_id
+        ]
+        return waypoint_ids[::-1] if reversed_rule else waypoint_ids
+
+    def _rule_legs(
+        self,
+        disch_port: dict,
+        load_port: dict,
+        rule: dict,
+        reversed_rule: bool,
+        ports_by_id: dict,
+        waypoint_ids: list[str] | None = None,
+    ) -> list[tuple[str, str]]:
+        """Effective-id legs of ``rule``'s route between the two ports;
+        ``waypoint_ids`` may come from the caller's memo."""
+        if waypoint_ids is None:
+            waypoint_ids = self._rule_waypoint_ids(rule, reversed_rule, ports_by_id)
+        load_eff = _effective_port_id(load_port)
+        disch_eff = _effective_port_id(disch_port)
+        if not waypoint_ids:
+            return [(load_eff, disch_eff)]
+
+        route_ids = [disch_eff]
+        for eff in waypoint_ids + [load_eff]:
+            if eff != route_ids[-1]:
+                route_ids.append(eff)
+        return list(zip(route_ids, route_ids[1:]))
+
+    def _build_distance_for_rule(
+        self,
+        disch_port: dict,
+        load_port: dict,
+        rule: dict,
+        reversed_rule: bool,
+        ports_by_id: dict,
+    ) -> tuple[dict | None, list[tuple[str, str]]]:
+        for from_eff, to_eff in self._rule_legs(
+            disch_port, load_port, rule, reversed_rule, ports_by_id
+        ):
+            if not self._lookup_segment(from_eff, to_eff):
+                return None, [(from_eff, to_eff)]
+        return {"segment": True}, []
+
+    def explain_pair(self, disch_port: dict, load_port: dict, ports_by_id: dict) -> dict:
+        """Every matching rule of one pair with its legs, in priority order.
+
+        ``rule`` is the first routable one (what first-routable mode keeps);
+        each leg reports whether a segment covers it and its distance.
+        ``disch_id`` / ``load_id`` are the master ports' ids, as in the scan
+        rows; leg ids are effective ids, the keys segments are stored under.
+        """
+        disch_master = self._resolve_master_port(disch_port, ports_by_id)
+        load_master = self._resolve_master_port(load_port, ports_by_id)
+        rules = []
+        routed = None
+        for rule_info in self._find_rules_for_pair(disch_master, load_master):
+            rule = rule_info["rule"]
+            legs = []
+            for from_eff, to_eff in self._rule_legs(
+                disch_master, load_master, rule, rule_info["reversed"], ports_by_id
+            ):
+                segment = self._lookup_segment(from_eff, to_eff)
+                total = segment["totalDistance"] if segment else None
+                legs.append(
+                    {
+                        "from_id": from_eff,
+                        "to_id": to_eff,
+                        "found": bool(segment),
+                        "total_distance": (
+                            None if total is None or total != total else round(total, 3)
+                        ),
+                    }
+                )
+            entry = {
+                "rule_name": rule["distance_rule_name"],
+                "rule_id": rule["id"],
+                "priority": rule["order_of_priority"],
+                "reversed": rule_info["reversed"],
+                "routable": all(leg["found"] for leg in legs),
+                "legs": legs,
+            }
+            rules.append(entry)
+            if routed is None and entry["routable"]:
+                routed = entry
+        if routed is not None:
+            reason = "routed"
+        else:
+            reason = "missing_segments" if rules else "no_rule"
+        return {
+            "disch_id": _normalize_id(disch_master["id"]),
+            "disch_name": disch_master["port"],
+            "load_id": _normalize_id(load_master["id"]),
+            "load_name": load_master["port"],
+            "covered": routed is not None,
+            "reason": reason,
+            "rule": routed,
+            "rules": rules,
+        }
+
+    def analyze(
+        self, ports: PortsData, progress=None, workers: int | None = None
+    ) -> dict:
+        return self.analyze_complete_distances(ports, progress, workers)
+
+    def _zone_rule_index(self) -> dict:
+        """``(position, rule)`` by ``(zone_start_id, zone_end_id)``."""
+        index = {}
+        for position, rule in enumerate(self.rules_data or []):
+            key = (rule["zone_start_id"], rule["zone_end_id"])
+            index.setdefault(key, []).append((position, rule))
+        return index
+
+    @staticmethod
+    def _zone_rules(rule_index: dict, disch_zone: str, load_zone: str) -> list:
+        """The matches _find_rules_for_pair builds, in file order (unsorted)."""
+        matches = [
+            (position, {"rule": rule, "reversed": False})
+            for position, rule in rule_index.get((disch_zone, load_zone), [])
+        ]
+        if disch_zone != load_zone:
+            matches += [
+                (position, {"rule": rule, "reversed": True})
+                for position, rule in rule_index.get((load_zone, disch_zone), [])
+            ]
+        matches.sort(key=lambda match: match[0])
+        return [match for _, match in matches]
+
+    def region_coverage(self, ports: PortsData) -> dict:
+        """Routable / unroutable / no-rule effective pairs per (disch region,
+        load region), with first-routable semantics and without rows.
+
+        A rule with waypoints routes a pair when its first leg (disch port
+        to first waypoint), its waypoint legs and its last leg (last
+        waypoint to load port) all exist; only the first and last legs
+        depend on the pair. So each port gets one bit per candidate route
+        of a region pair, ports are grouped by those bits and two groups
+        route each other when their bits intersect. Rules without
+        waypoints need the direct segment, so they are counted in one pass
+        over the segments. Time is proportional to ports x rules per
+        region pair plus segments, never to the pair product.
+        """
+        by_id = ports.by_id
+        disch_ports = {}
+        load_ports = {}
+        for rows, masters in (
+            (ports.disch_ports, disch_ports),
+            (ports.load_ports, load_ports),
+        ):
+            for row in rows:
+                master = self._resolve_master_port(row, by_id)
+                masters.setdefault(_effective_port_id(master), master)
+        disch_zone = {
+            eff: _normalize_id(port.get("region_id", ""))
+            for eff, port in disch_ports.items()
+        }
+        load_zone = {
+            eff: _normalize_id(port.get("region_id", ""))
+            for eff, port in load_ports.items()
+        }
+        disch_by_zone = defaultdict(list)
+        for eff, zone in disch_zone.items():
+            disch_by_zone[zone].append(eff)
+        load_by_zone = defaultdict(list)
+        for eff, zone in load_zone.items():
+            load_by_zone[zone].append(eff)
+
+        self.prepare_segment_matrix()
+        rule_index = self._zone_rule_index()
+        legs_found = {}
+
+        def leg_found(from_id: str, to_id: str) -> bool:
+            key = (from_id, to_id) if from_id <= to_id else (to_id, from_id)
+            found = legs_found.get(key)
+            if found is None:
+                found = legs_found[key] = bool(self._lookup_segment(from_id, to_id))
+            return found
+
+        counts = {}
+        # (disch zone, load zone) -> route bits of its ports, for the zone
+        # pairs that also have a rule without waypoints.
+        direct_zones = {}
+        with profile_phase(self.profiler, "region_counts"):
+            for d_zone, d_effs in disch_by_zone.items():
+                for l_zone, l_effs in load_by_zone.items():
+                    pairs = len(d_effs) * len(l_effs)
+                    matches = []
+                    if d_zone and l_zone:
+                        matches = self._zone_rules(rule_index, d_zone, l_zone)
+                    if not matches:
+                        counts[(d_zone, l_zone)] = [pairs, 0, pairs]
+                        continue
+                    routes = {}
+                    direct = False
+                    for match in matches:
+                        ids = self._rule_waypoint_ids(
+                            match["rule"], match["reversed"], by_id
+                        )
+                        if not ids:
+                            direct = True
+                        elif all(leg_found(*leg) for leg in zip(ids, ids[1:])):
+                            routes.setdefault((ids[0], ids[-1]), len(routes))
+                    d_bits = {
+                        eff: sum(
+                            1 << bit
+                            for (first, _), bit in routes.items()
+                            if leg_found(eff, first)
+                        )
+                        for eff in d_effs
+                    }
+                    l_bits = {
+                        eff: sum(
+                            1 << bit
+                            for (_, last), bit in routes.items()
+                            if leg_found(last, eff)
+                        )
+                        for eff in l_effs
+                    }
+                    l_groups = Counter(l_bits.values())
+                    found = sum(
+                        d_count * l_count
+                        for d_key, d_count in Counter(d_bits.values()).items()
+                        for l_key, l_count in l_groups.items()
+                        if d_key & l_key
+                    )
+                    counts[(d_zone, l_zone)] = [pairs, found, 0]
+                    if direct:
+                        direct_zones[(d_zone, l_zone)] = (d_bits, l_bits)
+
+            counted = set()
+
+            def add_direct(d_eff: str, l_eff: str) -> None:
+                if d_eff not in disch_zone or l_eff not in load_zone:
+                    return
+                zones = (disch_zone[d_eff], load_zone[l_eff])
+                bits = direct_zones.get(zones)
+                if bits is None or bits[0][d_eff] & bits[1][l_eff]:
+                    return
+                if (d_eff, l_eff) not in counted:
+                    counted.add((d_eff, l_eff))
+                    counts[zones][1] += 1
+
+            if direct_zones:
+                # Same-port legs always exist; any other needs a segment.
+                for eff in disch_zone.keys() & load_zone.keys():
+                    add_direct(eff, eff)
+                for key in self.segments_data or {}:
+                    from_id, _, to_id = key.partition(":")
+                    add_direct(from_id, to_id)
+                    add_direct(to_id, from_id)
+        if self.profiler is not None:
+            self.profiler.count("region_legs_looked_up", len(legs_found))
+        return _region_result(counts)
+
+    def check_pairs(self, ports: PortsData, pairs) -> dict:
+        """First routable rule of each ``(load_id, disch_id)`` in ``pairs``.
+
+        Same rule matching, priority order and legs as the full scan, but
+        rules come from a zone-pair index, each zone pair's candidates are
+        ordered once and each leg is looked up once for the whole list.
+        A pair no rule routes reports its top-priority rule and the first
+        missing leg of that rule.
+        """
+        self.prepare_segment_matrix()
+        blank = dict.fromkeys(
+            ("status", "rule_name", "rule_id", "priority", "reversed", "missing_leg"),
+            "",
+        )
+        rule_index = self._zone_rule_index()
+        ordered = {}
+        legs_found = {}
+        waypoints = {}
+        zones = {}
+
+        def rules_for(disch_zone: str, load_zone: str) -> list:
+            matches = ordered.get((disch_zone, load_zone))
+            if matches is None:
+                matches = self._zone_rules(rule_index, disch_zone, load_zone)
+                matches.sort(key=lambda r: r["rule"].get("order_of_priority", 999))
+                ordered[(disch_zone, load_zone)] = matches
+            return matches
+
+        def leg_found(from_id: str, to_id: str) -> bool:
+            # Lookups answer both directions, so one entry per port pair.
+            key = (from_id, to_id) if from_id <= to_id else (to_id, from_id)
+            found = legs_found.get(key)
+            if found is None:
+                found = legs_found[key] = bool(self._lookup_segment(from_id, to_id))
+            return found
+
+        def zone(port: dict) -> str:
+            key = id(port)
+            if key not in zones:
+                zones[key] = _normalize_id(port.get("region_id", ""))
+            return zones[key]
+
+        def rule_legs(disch: dict, load: dict, rule_info: dict) -> list:
+            rule = rule_info["rule"]
+            key = (id(rule), rule_info["reversed"])
+            if key not in waypoints:
+                waypoints[key] = self._rule_waypoint_ids(
+                    rule, rule_info["reversed"], ports.by_id
+                )
+            return self._rule_legs(
+                disch, load, rule, rule_info["reversed"], ports.by_id, waypoints[key]
+            )
+
+        def decide(disch: dict, load: dict) -> dict:
+            disch_zone = zone(disch)
+            load_zone = zone(load)
+            matches = []
+            if disch_zone and load_zone:
+                matches = rules_for(disch_zone, load_zone)
+            if not matches:
+                return {**blank, "status": "no_rule"}
+            first_missing = None
+            for rule_info in matches:
+                legs = rule_legs(disch, load, rule_info)
+                missing = next((leg for leg in legs if not leg_found(*leg)), None)
+                if missing is None:
+                    status, chosen = "routed", rule_info
+                    break
+                if first_missing is None:
+                    first_missing = missing
+            else:
+                status, chosen = "missing_segments", matches[0]
+            rule = chosen["rule"]
+            return {
+                "status": status,
+                "rule_name": rule["distance_rule_name"],
+                "rule_id": rule["id"],
+                "priority": rule["order_of_priority"],
+                "reversed": chosen["reversed"],
+                "missing_leg": ":".join(first_missing) if status != "routed" else "",
+            }
+
+        with profile_phase(self.profiler, "resolve_pair_ports"):
+            resolved = _resolve_pair_ports(ports, pairs)
+        with profile_phase(self.profiler, "check_pairs"):
+            result = _check_pair_list(
+                pairs, resolved, decide, COMPLEX_PAIR_STATUSES, blank
+            )
+        if self.profiler is not None:
+            self.profiler.count("pair_legs_looked_up", len(legs_found))
+            self.profiler.count("pair_zone_pairs", len(ordered))
+        return result
+
+    def analyze_complete_distances(
+        self, ports: PortsData, progress=None, workers: int | None = None
+    ) -> dict:
+        """Check every rule of every effective pair; ``workers`` > 1 scans
+        disch-port chunks in a process pool (same rows, same order).
+
+        With ``first_routable`` the rules of a pair are tried in priority
+        order up to the first one that routes: the result then counts pairs
+        rather than rules, lists that rule per pair in ``effective_rules``
+        and one ``missing_complete`` row per pair no rule routes.
+        """
+        rules = self.rules_data or []
+
+        load_ports = ports.load_ports
+        disch_ports = ports.disch_ports
+        ports_by_id = ports.by_id
+
+        total_ports_rows = len(ports.rows)
+        total_load = len(load_ports)
+        total_disch = len(disch_ports)
+        total_rules = len(rules)
+        total_segments_rows = self.segments_rows
+
+        missing_segments_rows = new_rows(self.memory_budget)
+        missing_complete = new_rows(self.memory_budget)
+        effective_rules = new_rows(self.memory_budget)
+
+        with profile_phase(self.profiler, "segment_matrix"):
+            matrix = self.prepare_segment_matrix()
+        if self.profiler is not None and matrix is not None:
+            self.profiler.count("segment_matrix_rows", len(matrix.rows))
+            self.profiler.count("segment_matrix_bytes", matrix.nbytes)
+
+        with profile_phase(self.profiler, "analyze_pairs"):
+            if workers and workers > 1:
+                counts = self._scan_parallel(
+                    ports,
+                    missing_complete,
+                    missing_segments_rows,
+                    effective_rules,
+                    workers,
+                    progress,
+                )
+            else:
+                counts = self._scan_pairs(
+                    disch_ports,
+                    load_ports,
+                    ports_by_id,
+                    missing_complete,
+                    missing_segments_rows,
+                    effective_rules,
+                    progress,
+                )
+        expected_complete, generated_complete, effective_pairs = counts[:3]
+        matched, evaluated = counts[3:]
+
+        if self.profiler is not None:
+            self.profiler.count("pairs_checked", total_load * total_disch)
+            self.profiler.count("effective_pairs", effective_pairs)
+            self.profiler.count("rules_evaluated", evaluated)
+
+        if self.first_routable:
+            return {
+                "summary": {
+                    "total_ports_rows": total_ports_rows,
+                    "total_load_ports": total_load,
+                    "total_disch_ports": total_disch,
+                    "total_rules_rows": total_rules,
+                    "total_segments_rows": total_segments_rows,
+                    "expected_complete": expected_complete,
+                    "generated_complete": generated_complete,
+                    "missing_segments": len(missing_segments_rows),
+                    "missing_complete": len(missing_complete),
+                    "rules_evaluated": evaluated,
+                    "rules_skipped": matched - evaluated,
+                },
+                "missing_segments": missing_segments_rows,
+                "missing_complete": missing_complete,
+                "effective_rules": effective_rules,
+            }
+        return {
+            "summary": {
+                "total_ports_rows": total_ports_rows,
+                "total_load_ports": total_load,
+                "total_disch_ports": total_disch,
+                "total_rules_rows": total_rules,
+                "total_segments_rows": total_segments_rows,
+                "expected_complete": expected_complete,
+                "generated_complete": generated_complete,
+                "missing_segments": len(missing_segments_rows),
+                "missing_complete": len(missing_complete),
+            },
+            "missing_segments": missing_segments_rows,
+            "missing_complete": missing_complete,
+        }
+
+    def _scan_pairs(
+        self,
+        disch_ports,
+        load_ports,
+        ports_by_id,
+        missing_complete,
+        missing_segments_rows,
+        effective_rules,
+        progress=None,
+    ) -> tuple[int, int, int, int, int]:
+        """Fill the row lists; return ``(expected, generated,
+        effective_pairs, rules_matched, rules_evaluated)``.
+
+        Every pair of one effective disch port is decided at its first disch
+        row, so disjoint disch subsets can be scanned independently.
+        """
+        missing_segments_set = set()
+        expected_complete = 0
+        generated_complete = 0
+        rules_matched = 0
+        rules_evaluated = 0
+        processed_effective_pairs = set()
+        total_pairs = max(len(load_ports) * len(disch_ports), 1)
+        checked = 0
+
+        for disch_port in disch_ports:
+            for load_port in load_ports:
+                disch_master = self._resolve_master_port(disch_port, ports_by_id)
+                load_master = self._resolve_master_port(load_port, ports_by_id)
+                disch_eff = _effective_port_id(disch_master)
+                load_eff = _effective_port_id(load_master)
+                pair_key = f"{disch_eff}:{load_eff}"
+                if pair_key in processed_effective_pairs:
+                    checked += 1
+                    _report_progress(progress, checked, total_pairs)
+                    continue
+                processed_effective_pairs.add(pair_key)
+
+                rules_for_pair = self._find_rules_for_pair(disch_master, load_master)
+                if not rules_for_pair:
+                    missing_complete.append(
+                        {
+                            "disch_name": disch_master["port"],
+                            "disch_id": disch_master["id"],
+                            "load_name": load_master["port"],
+                            "load_id": load_master["id"],
+                            "rule_name": "",
+                            "priority": "",
+                            "reason": "no_rule",
+                        }
+                    )
+                elif self.first_routable:
+                    expected_complete += 1
+                    rules_matched += len(rules_for_pair)
+                    for rule_info in rules_for_pair:
+                        rules_evaluated += 1
+                        rule = rule_info["rule"]
+                        dist, missing_segments = self._build_distance_for_rule(
+                            disch_master,
+                            load_master,
+                            rule,
+                            rule_info["reversed"],
+                            ports_by_id,
+                        )
+                        if dist:
+                            generated_complete += 1
+                            effective_rules.append(
+                                {
+                                    "disch_name": disch_master["port"],
+                                    "disch_id": disch_master["id"],
+                                    "load_name": load_master["port"],
+                                    "load_id": load_master["id"],
+                                    "rule_name": rule["distance_rule_name"],
+                                    "rule_id": rule["id"],
+                                    "priority": rule["order_of_priority"],
+                                    "reversed": rule_info["reversed"],
+                                }
+                            )
+                            break
+                        self._add_missing_segments(
+                            missing_segments,
+                            rule,
+                            ports_by_id,
+                            missing_segments_set,
+                            missing_segments_rows,
+                        )
+                    else:
+                        top_rule = rules_for_pair[0]["rule"]
+                        missing_complete.append(
+                            {
+                                "disch_name": disch_master["port"],
+                                "disch_id": disch_master["id"],
+                                "load_name": load_master["port"],
+                                "load_id": load_master["id"],
+                                "rule_name": top_rule["distance_rule_name"],
+                                "priority": top_rule["order_of_priority"],
+                                "reason": "no_routable_rule",
+                            }
+                        )
+                else:
+                    rules_matched += len(rules_for_pair)
+                    for rule_info in rules_for_pair:
+                        expected_complete += 1
+                        rules_evaluated += 1
+                        rule = rule_info["rule"]
+                        dist, missing_segments = self._build_distance_for_rule(
+                            disch_master,
+                            load_master,
+                            rule,
+                            rule_info["reversed"],
+                            ports_by_id,
+                        )
+                        if dist:
+                            generated_complete += 1
+                        else:
+                            missing_complete.append(
+                                {
+                                    "disch_name": disch_master["port"],
+                                    "disch_id": disch_master["id"],
+                                    "load_name": load_master["port"],
+                                    "load_id": load_master["id"],
+                                    "rule_name": rule["distance_rule_name"],
+                                    "priority": rule["order_of_priority"],
+                                    "reason": "missing_segments",
+                                }
+                            )
+                            self._add_missing_segments(
+                                missing_segments,
+                                rule,
+                                ports_by_id,
+                                missing_segments_set,
+                                missing_segments_rows,
+                            )
+
+                checked += 1
+                _report_progress(progress, checked, total_pairs)
+        return (
+            expected_complete,
+            generated_complete,
+            len(processed_effective_pairs),
+            rules_matched,
+            rules_evaluated,
+        )
+
+    def _add_missing_segments(
+        self, missing_segments, rule, ports_by_id, seen: set, rows
+    ) -> None:
+        """Append one row per not yet reported missing segment of ``rule``."""
+        for from_id, to_id in missing_segments:
+            key = f"{from_id}:{to_id}"
+            if key in seen:
+                continue
+            seen.add(key)
+            resolve = self._resolve_master_port
+            from_port = resolve(ports_by_id.get(from_id, {}), ports_by_id)
+            to_port = resolve(ports_by_id.get(to_id, {}), ports_by_id)
+            rows.append(
+                {
+                    "from_id": from_id,
+                    "from_name": from_port.get("port", ""),
+                    "to_id": to_id,
+                    "to_name": to_port.get("port", ""),
+                    "rule_name": rule["distance_rule_name"],
+                    "rule_id": rule["id"],
+                }
+            )
+
+    def _scan_parallel(
+        self,
+        ports,
+        missing_complete,
+        missing_segments_rows,
+        effective_rules,
+        workers,
+        progress,
+    ) -> tuple[int, int, int, int, int]:
+        # One chunk entry per effective disch port (its first row), so no
+        # effective pair spans two chunks; segment rows are re-deduplicated
+        # in chunk order to keep the first rule that reported them.
+        seen = set()
+        first_disch = []
+        for port in ports.disch_ports:
+            eff = _effective_port_id(_resolve_master_port(port, ports.by_id))
+            if eff not in seen:
+                seen.add(eff)
+                first_disch.append(port)
+        totals = [0] * 5
+        segment_keys = set()
+        for counts, complete_rows, segment_rows, effective_rows in _scan_in_pool(
+            self, ports, _chunks(first_disch, workers), workers, progress
+        ):
+            totals = [total + count for total, count in zip(totals, counts)]
+            missing_complete.extend(complete_rows)
+            effective_rules.extend(effective_rows)
+            for row in segment_rows:
+                key = (row["from_id"], row["to_id"])
+                if key not in segment_keys:
+                    segment_keys.add(key)
+                    missing_segments_rows.append(row)
+        return tuple(totals)
+
+
+# Engine shared by batch worker processes; set once by _init_batch_worker.
+_BATCH_ENGINE = None
+
+
+def _init_batch_worker(engine) -> None:
+    global _BATCH_ENGINE
+    _BATCH_ENGINE = engine
+
+
+def _analyze_snapshot(ports_path: str, include_inactive: bool) -> dict:
+    row = {"ports_csv": ports_path}
+    try:
+        ports = _BATCH_ENGINE.read_ports(ports_path, include_inactive)
+        row.update(_BATCH_ENGINE.analyze(ports)["summary"])
+        row["error"] = ""
+    except (OSError, ValueError) as exc:
+        row["error"] = str(exc).splitlines()[0]
+    return row
+
+
+def analyze_port_snapshots(
+    engine,
+    ports_paths: list[str],
+    include_inactive: bool = False,
+    workers: int | None = None,
+) -> list[dict]:
+    """Run one loaded engine against several Ports CSV snapshots.
+
+    Rules/segments (or distance pairs) are parsed once; each worker process
+    receives the engine once through the pool initializer and only the
+    coverage summary travels back. Returns one comparison row per snapshot,
+    in input order.
+    """
+    workers = workers or min(len(ports_paths), os.cpu_count() or 1)
+    if workers <= 1 or len(ports_paths) <= 1:
+        _init_batch_worker(engine)
+        return [_analyze_snapshot(path, include_inactive) for path in ports_paths]
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_batch_worker, initargs=(engine,)
+    ) as pool:
+        return list(
+            pool.map(
+                _analyze_snapshot,
+                ports_paths,
+                [include_inactive] * len(ports_paths),
+            )
+        )
+
+
+# Ports shared by pair-scan worker processes; set by _init_scan_worker.
+_SCAN_PORTS = None
+
+
+def _init_scan_worker(engine, ports: PortsData) -> None:
+    global _BATCH_ENGINE, _SCAN_PORTS
+    _BATCH_ENGINE = engine
+    _SCAN_PORTS = ports
+
+
+def _scan_chunk(chunk: list) -> tuple:
+    engine = _BATCH_ENGINE
+    ports = _SCAN_PORTS
+    if engine.mode == "simple":
+        missing = []
+        found, checked = engine._scan_pairs(
+            chunk, ports.disch_ports, engine.distance_pairs or set(), missing, None
+        )
+        return found, checked, missing
+    complete_rows = []
+    segment_rows = []
+    effective_rows = []
+    counts = engine._scan_pairs(
+        chunk,
+        ports.load_ports,
+        ports.by_id,
+        complete_rows,
+        segment_rows,
+        effective_rows,
+    )
+    return counts, complete_rows, segment_rows, effective_rows
+
+
+def _chunks(items: list, workers: int) -> list[list]:
+    """Contiguous chunks, a few per worker so slow chunks balance out."""
+    size = max(-(-len(items) // (workers * 4)), 1)
+    return [items[start : start + size] for start in range(0, len(items), size)]
+
+
+def _scan_in_pool(engine, ports: PortsData, chunks: list, workers: int, progress):
+    """Scan ``chunks`` in worker processes; return their results in order."""
+    results = [None] * len(chunks)
+    if not chunks:
+        return results
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(chunks)),
+        initializer=_init_scan_worker,
+        initargs=(engine, ports),
+    ) as pool:
+        futures = {
+            pool.submit(_scan_chunk, chunk): idx for idx, chunk in enumerate(chunks)
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            results[futures[future]] = future.result()
+            if progress is not None:
+                progress(int(done / len(chunks) * 100))
+    return results
+
+
+def _batch_columns(rows: list[dict]) -> list[str]:
+    columns = ["ports_csv"]
+    for row in rows:
+        columns.extend(key for key in row if key not in columns and key != "error")
+    return columns + ["error"]
+
+
+def build_batch_output_table(rows: list[dict]) -> str:
+    columns = _batch_columns(rows)
+    lines = ["Snapshot comparison", "\t".join(columns)]
+    for row in rows:
+        lines.append("\t".join(str(row.get(column, "")) for column in columns))
+    return "\n".join(lines)
+
+
+def write_batch_result(rows: list[dict], path: str, fmt: str) -> list[str]:
+    if fmt == "json":
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({"snapshots": rows}, file, indent=2, ensure_ascii=False)
+        return [path]
+    if fmt == "tsv":
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(build_batch_output_table(rows))
+        return [path]
+    if fmt == "parquet":
+        if pa is None:
+            raise RuntimeError(
+                "Parquet output requires pyarrow (pip install pyarrow)."
+            )
+        columns = _batch_columns(rows)
+        table = pa.Table.from_pylist(
+            [{column: row.get(column) for column in columns} for row in rows]
+        )
+        pq.write_table(table, path)
+        return [path]
+    raise ValueError(f"Unknown output format: {fmt}")
+
+
+def _estimate_cell(row: dict) -> str:
+    value = row.get("great_circle_nm")
+    return "" if value is None else str(value)
+
+
+def _iter_proxy_lines(result: dict):
+    if "proxy_suggestions" not in result:
+        return
+    yield ""
+    yield "Proxy port suggestions"
+    yield (
+        "Port id\tPort name\tRank\tSuggested port id\tSuggested port name\t"
+        "Great circle (nm)\tCoverage"
+    )
+    for row in result["proxy_suggestions"]:
+        yield (
+            f"{row['port_id']}\t{row['port_name']}\t{row['rank']}\t"
+            f"{row['suggested_id']}\t{row['suggested_name']}\t"
+            f"{row['great_circle_nm']}\t{row['coverage']}"
+        )
+
+
+def _iter_anomaly_lines(result: dict):
+    if "segment_anomalies" not in result:
+        return
+    yield ""
+    yield "Segment anomalies"
+    yield "From port id\tTo port id\tCheck\tDistance\tBound\tVia port id\tSeverity"
+    for row in result["segment_anomalies"]:
+        yield (
+            f"{row['from_id']}\t{row['to_id']}\t{row['check']}\t"
+            f"{row['total_distance']}\t{row['bound']}\t{row['via_id']}\t"
+            f"{row['severity']}"
+        )
+
+
+def build_simple_output_table(result: dict) -> str:
+    return "\n".join(iter_simple_output_lines(result))
+
+
+def iter_simple_output_lines(result: dict):
+    summary = result["summary"]
+    missing = result["missing"]
+
+    lines = []
+    lines.append("Summary")
+    lines.append("Metric\tValue")
+    lines.append(f"Total ports CSV rows\t{summary['total_ports_rows']}")
+    lines.append(f"Total load ports\t{summary['total_load_ports']}")
+    lines.append(f"Total disch ports\t{summary['total_disch_ports']}")
+    lines.append(f"Total distance CSV rows\t{summary['total_distance_rows']}")
+    lines.append(f"Total distances (pairs)\t{summary['total_distances']}")
+    lines.append(f"Number of distances found\t{summary['found']}")
+    lines.append(f"Number of distances missing\t{summary['missing']}")
+    lines.append(
+        "Number of missing ports from distances\t"
+        f"{summary['missing_ports_count']}"
+    )
+    estimates = "great_circle_estimates" in summary
+    if estimates:
+        lines.append(f"Great-circle estimates\t{summary['great_circle_estimates']}")
+    if "profile" in result:
+        lines.extend(build_profile_lines(result["profile"]))
+    lines.append("")
+    lines.append("Missing distances")
+    lines.append(
+        "Load port name\tLoad port id\tDisch port name\tDisch port id"
+        + ("\tGreat circle (nm)" if estimates else "")
+    )
+    yield from lines
+    for row in missing:
+        line = (
+            f"{row['load_name']}\t{row['load_id']}\t{row['disch_name']}\t{row['disch_id']}"
+        )
+        yield f"{line}\t{_estimate_cell(row)}" if estimates else line
+    yield ""
+    yield "Missing ports from distances"
+    yield "Port id"
+    yield from result["missing_ports"]
+    yield from _iter_proxy_lines(result)
+
+
+def build_complex_output_table(result: dict) -> str:
+    return "\n".join(iter_complex_output_lines(result))
+
+
+def iter_complex_output_lines(result: dict):
+    summary = result["summary"]
+    missing_segments = result["missing_segments"]
+    missing_complete = result["missing_complete"]
+
+    lines = []
+    lines.append("Summary")
+    lines.append("Metric\tValue")
+    lines.append(f"Total ports CSV rows\t{summary['total_ports_rows']}")
+    lines.append(f"Total load ports\t{summary['total_load_ports']}")
+    lines.append(f"Total disch ports\t{summary['total_disch_ports']}")
+    lines.append(f"Total rules rows\t{summary['total_rules_rows']}")
+    lines.append(f"Total segments rows\t{summary['total_segments_rows']}")
+    lines.append(f"Expected complete distances\t{summary['expected_complete']}")
+    lines.append(f"Complete distances generated\t{summary['generated_complete']}")
+    lines.append(f"Missing distances (segments)\t{summary['missing_segments']}")
+    lines.append(f"Missing complete distances\t{summary['missing_complete']}")
+    if "rules_evaluated" in summary:
+        lines.append("Priority mode\tfirst routable rule per pair")
+        lines.append(f"Rules evaluated\t{summary['rules_evaluated']}")
+        lines.append(f"Rules skipped\t{summary['rules_skipped']}")
+    if "anomaly_segments_checked" in summary:
+        lines.append(f"Segments scanned\t{summary['anomaly_segments_checked']}")
+        lines.append(
+            "Segments below great circle\t"
+            f"{summary['anomalies_below_great_circle']}"
+        )
+        lines.append(f"Triangle anomalies\t{summary['anomalies_triangle']}")
+    estimates = "great_circle_estimates" in summary
+    if estimates:
+        lines.append(f"Great-circle estimates\t{summary['great_circle_estimates']}")
+    estimate_header = "\tGreat circle (nm)" if estimates else ""
+    if "profile" in result:
+        lines.extend(build_profile_lines(result["profile"]))
+    lines.append("")
+    lines.append("Missing Distances ARW (segments)")
+    lines.append(
+        "From port name\tFrom port id\tTo port name\tTo port id\tRule name\tRule id"
+        + estimate_header
+    )
+    yield from lines
+    for row in missing_segments:
+        line = (
+            f"{row['from_name']}\t{row['from_id']}\t{row['to_name']}\t"
+            f"{row['to_id']}\t{row['rule_name']}\t{row['rule_id']}"
+        )
+        yield f"{line}\t{_estimate_cell(row)}" if estimates else line
+    yield ""
+    yield "Missing ARW Complete Distances"
+    yield (
+        "Disch port name\tDisch port id\tLoad port name\tLoad port id\t"
+        "Rule name\tPriority\tReason" + estimate_header
+    )
+    for row in missing_complete:
+        line = (
+            f"{row['disch_name']}\t{row['disch_id']}\t"
+            f"{row['load_name']}\t{row['load_id']}\t"
+            f"{row['rule_name']}\t{row['priority']}\t{row['reason']}"
+        )
+        yield f"{line}\t{_estimate_cell(row)}" if estimates else line
+    yield from _iter_proxy_lines(result)
+    yield from _iter_anomaly_lines(result)
+    if "effective_rules" not in result:
+        return
+    yield ""
+    yield "Effective rules"
+    yield (
+        "Disch port name\tDisch port id\tLoad port name\tLoad port id\t"
+        "Rule name\tRule id\tPriority\tReversed"
+    )
+    for row in result["effective_rules"]:
+        yield (
+            f"{row['disch_name']}\t{row['disch_id']}\t"
+            f"{row['load_name']}\t{row['load_id']}\t"
+            f"{row['rule_name']}\t{row['rule_id']}\t"
+            f"{row['priority']}\t{row['reversed']}"
+        )
+
+
+def iter_pairs_output_lines(result: dict):
+    """Summary and one row per checked pair, in input order."""
+    yield "Summary"
+    yield "Metric\tValue"
+    for key, value in result["summary"].items():
+        yield f"{key}\t{value}"
+    if "profile" in result:
+        yield from build_profile_lines(result["profile"])
+    yield ""
+    yield "Pairs"
+    rows = result["pairs"]
+    if not rows:
+        return
+    columns = list(rows[0])
+    yield "\t".join(columns)
+    for row in rows:
+        yield "\t".join(
+            "" if row[column] is None else str(row[column]) for column in columns
+        )
+
+
+def _parquet_rows(section: str, rows: list) -> list:
+    if section == "missing_ports":
+        return [{"port_id": port_id} for port_id in rows]
+    return [{key: str(value) for key, value in row.items()} for row in rows]
+
+
+def _write_parquet_section(path: str, section: str, rows, metadata: dict) -> None:
+    """One row group per PARQUET_BATCH_ROWS rows, so spilled sections are
+    read back one batch at a time instead of whole."""
+    writer = None
+    schema = None
+    batch = []
+
+    def flush() -> None:
+        nonlocal writer, schema
+        table = pa.Table.from_pylist(_parquet_rows(section, batch), schema=schema)
+        if writer is None:
+            table = table.replace_schema_metadata(metadata)
+            schema = table.schema
+            writer = pq.ParquetWriter(path, schema)
+        writer.write_table(table)
+        batch.clear()
+
+    try:
+        for row in rows:
+            batch.append(row)
+            if len(batch) == PARQUET_BATCH_ROWS:
+                flush()
+        if batch or writer is None:
+            flush()
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def _dump_result_json(result: dict, file) -> None:
+    """json.dump equivalent that streams row sections one row at a time."""
+    file.write("{")
+    for idx, (key, value) in enumerate(result.items()):
+        file.write(",\n  " if idx else "\n  ")
+        file.write(f"{json.dumps(key)}: ")
+        if key not in (
+            SIMPLE_ROW_SECTIONS
+            + COMPLEX_ROW_SECTIONS
+            + PAIR_ROW_SECTIONS
+            + REPORT_ROW_SECTIONS
+        ):
+            encoded = json.dumps(value, indent=2, ensure_ascii=False)
+            file.write(encoded.replace("\n", "\n  "))
+            continue
+        file.write("[")
+        for row_idx, row in enumerate(value):
+            file.write(",\n    " if row_idx else "\n    ")
+            encoded = json.dumps(row, indent=2, ensure_ascii=False)
+            file.write(encoded.replace("\n", "\n    "))
+        file.write("\n  ]" if value else "]")
+    file.write("\n}")
+
+
+def write_result(result: dict, mode: str, path: str, fmt: str) -> list[str]:
+    """Write an analysis result as JSON, TSV or Parquet; return written paths.
+
+    Parquet writes one file per row section (``<stem>.<section>.parquet``)
+    with the summary stored as JSON in the file metadata.
+    """
+    if fmt == "json":
+        with open(path, "w", encoding="utf-8") as file:
+            _dump_result_json(result, file)
+        return [path]
+    if fmt == "tsv":
+        if "pairs" in result:
+            lines = iter_pairs_output_lines(result)
+        elif mode == "simple":
+            lines = iter_simple_output_lines(result)
+        else:
+            lines = iter_complex_output_lines(result)
+        with open(path, "w", encoding="utf-8") as file:
+            for idx, line in enumerate(lines):
+                file.write(f"\n{line}" if idx else line)
+        return [path]
+    if fmt == "parquet":
+        if pa is None:
+            raise RuntimeError(
+                "Parquet output requires pyarrow (pip install pyarrow)."
+            )
+        stem, _ = os.path.splitext(path)
+        if "pairs" in result:
+            sections = PAIR_ROW_SECTIONS
+        elif mode == "simple":
+            sections = SIMPLE_ROW_SECTIONS
+        else:
+            sections = COMPLEX_ROW_SECTIONS
+        metadata = {b"summary": json.dumps(result["summary"]).encode("utf-8")}
+        written = []
+        for section in sections + REPORT_ROW_SECTIONS:
+            if section not in result:
+                continue
+            section_path = f"{stem}.{section}.parquet"
+            _write_parquet_section(section_path, section, result[section], metadata)
+            written.append(section_path)
+        return written
+    raise ValueError(f"Unknown output format: {fmt}")
+
+
+def result_has_missing(result: dict, mode: str) -> bool:
+    summary = result["summary"]
+    if "not_covered" in summary:
+        return bool(summary["not_covered"])
+    if mode == "simple":
+        return bool(summary["missing"] or summary["missing_ports_count"])
+    return bool(summary["missing_segments"] or summary["missing_complete"])
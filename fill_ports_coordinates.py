@@ -1,25 +1,84 @@
 import pandas as pd
+from geopy.exc import GeocoderRateLimited, GeocoderTimedOut, GeocoderUnavailable
 from geopy.geocoders import Nominatim
 from tqdm import tqdm
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import csv
+import json
+import os
+import random
+import threading
 import time
 import re
+import sqlite3
 import unicodedata
 
+try:
+    import pycountry
+except Exception:
+    pycountry = None
+
 # Nom du fichier d'entrée
 input_file = "DryManager_Port_Table - Ports sans coordonnees.csv"
+# Sortie : les colonnes de l'entrée recopiées telles quelles (texte brut, voir
+# read_chunks) et la colonne coordinates complétée
 output_file = "ports_with_coordinates.csv"
 
-# Lecture du CSV
-df = pd.read_csv(input_file)
+# Cache des réponses du géocodeur, partagé entre les exécutions
+cache_file = "geocoding_cache.sqlite"
+CACHE_TTL_FOUND = 180 * 24 * 3600  # secondes
+CACHE_TTL_MISSING = 30 * 24 * 3600  # un échec est retenté plus tôt
+
+# Ordre des variantes appris des exécutions précédentes (même fichier SQLite)
+MIN_SCOPE_ATTEMPTS = 10  # essais avant de se fier aux stats d'un pays/région
+PRUNE_MIN_ATTEMPTS = 30  # variante jamais trouvée après autant d'essais : écartée
+
+# Gazetteer local consulté avant le géocodeur : CSV avec en-tête (name,
+# country, region, coordinates "lat,lon" ou latitude/longitude) ou export
+# UN/LOCODE sans en-tête. None = pas de gazetteer.
+gazetteer_file = None
+GAZETTEER_MIN_SIMILARITY = 0.8  # Dice sur les trigrammes des noms
+
+# Reprise après interruption : lignes terminées et taille du fichier de sortie
+checkpoint_file = output_file + ".checkpoint"
+CHUNK_ROWS = 500  # lignes lues, écrites et validées à la fois
+PLAN_CHUNK_ROWS = 50_000  # lignes par bloc pour la planification (3 colonnes)
+
+# Lecture de l'en-tête seulement ; les lignes sont lues par blocs
+columns = pd.read_csv(input_file, nrows=0).columns.tolist()
 
 # Vérifie les colonnes disponibles
-print("Colonnes trouvées :", df.columns.tolist())
+print("Colonnes trouvées :", columns)
 
 # Nom de la colonne contenant le nom du port
 port_column = "port"   # à modifier si besoin
 
-# Géocodeur OpenStreetMap
-geolocator = Nominatim(user_agent="port_locator_matthieu")
+# Géocodeur OpenStreetMap. Pour un Nominatim auto-hébergé, renseigner son
+# adresse (ex: "localhost:8080") et relever le débit : les requêtes partent
+# alors en parallèle sur GEOCODING_WORKERS threads.
+NOMINATIM_DOMAIN = None
+NOMINATIM_SCHEME = "https"
+GEOCODING_WORKERS = 4
+REQUESTS_PER_SECOND = 1.25  # 0.8 s entre deux requêtes ; None = sans limite
+MAX_RETRIES = 5  # nouvelles tentatives après un timeout ou un 429
+RETRY_BASE_SECONDS = 2.0
+
+
+def make_geocoder():
+    """Le géocodeur utilisé ; tout objet ayant ``geocode(query, timeout=...)``
+    qui renvoie un résultat avec ``latitude``/``longitude`` ou None convient."""
+    if NOMINATIM_DOMAIN:
+        return Nominatim(
+            user_agent="port_locator_matthieu",
+            domain=NOMINATIM_DOMAIN,
+            scheme=NOMINATIM_SCHEME,
+        )
+    return Nominatim(user_agent="port_locator_matthieu")
+
+
+geolocator = make_geocoder()
 
 COUNTRY_ALIASES = {
     "U.A.E": "United Arab Emirates",
@@ -50,16 +109,148 @@ REGION_ALIASES_BY_COUNTRY = {
 IGNORED_REGION_TOKENS = {"ISLAND", "ISLANDS"}
 
 
+class TokenBucket:
+    """Limite de débit partagée par tous les threads du géocodage."""
+
+    def __init__(self, rate, burst: float = 1.0) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self) -> None:
+        if not self.rate:
+            return
+        with self.lock:
+            self._refill()
+            self.tokens -= 1
+            wait = -self.tokens / self.rate
+        # Le jeton est réservé : les threads suivants attendent leur tour
+        if wait > 0:
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """Suspend tous les threads, ex: après un 429 du serveur."""
+        if not self.rate:
+            return
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+
+rate_limiter = TokenBucket(REQUESTS_PER_SECOND)
+
+
+class GeocodingCache:
+    """Réponses du géocodeur (trouvées ou non) par requête normalisée, avec TTL."""
+
+    def __init__(self, path: str) -> None:
+        # Partagé entre les threads du géocodage, sous verrou
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS geocode ("
+            " query TEXT PRIMARY KEY,"
+            " coordinates TEXT NOT NULL,"  # "" = introuvable
+            " fetched_at REAL NOT NULL)"
+        )
+        self.connection.commit()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(query: str) -> str:
+        return SPACES_RE.sub(" ", query).strip().casefold()
+
+    def get(self, query: str):
+        """Coordonnées en cache ("" si introuvable), None si absente ou expirée."""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT coordinates, fetched_at FROM geocode WHERE query = ?",
+                (self.key(query),),
+            ).fetchone()
+            if row is not None:
+                coordinates, fetched_at = row
+                ttl = CACHE_TTL_FOUND if coordinates else CACHE_TTL_MISSING
+                if time.time() - fetched_at < ttl:
+                    self.hits += 1
+                    return coordinates
+            self.misses += 1
+            return None
+
+    def put(self, query: str, coordinates: str) -> None:
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO geocode VALUES (?, ?, ?)",
+                (self.key(query), coordinates, time.time()),
+            )
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+
+geocoding_cache = GeocodingCache(cache_file)
+
+
+def geocode_with_retries(query: str):
+    """Appel au géocodeur sous la limite de débit, avec backoff exponentiel."""
+    for attempt in range(MAX_RETRIES + 1):
+        rate_limiter.acquire()
+        try:
+            return geolocator.geocode(query, timeout=10)
+        except GeocoderRateLimited as exc:
+            if attempt == MAX_RETRIES:
+                raise
+            delay = exc.retry_after or RETRY_BASE_SECONDS * 2**attempt
+            rate_limiter.pause(delay)
+        except (GeocoderTimedOut, GeocoderUnavailable):
+            if attempt == MAX_RETRIES:
+                raise
+            # Jitter : les threads ne repartent pas tous au même instant
+            delay = RETRY_BASE_SECONDS * 2**attempt
+            time.sleep(delay * random.uniform(0.5, 1.5))
+
+
+def geocode(query: str) -> str:
+    """Coordonnées "lat,lon" de la requête ("" si introuvable), via le cache."""
+    cached = geocoding_cache.get(query)
+    if cached is not None:
+        return cached
+    location = geocode_with_retries(query)
+    coordinates = (
+        f"{location.latitude:.7f},{location.longitude:.7f}" if location else ""
+    )
+    geocoding_cache.put(query, coordinates)
+    return coordinates
+
+
+SEPARATORS_RE = re.compile(r"[_.]+")
+PARENTHESES_RE = re.compile(r"\s*\([^)]*\)")
+PARENTHESIZED_RE = re.compile(r"\(([^)]*)\)")
+SPACES_RE = re.compile(r"\s+")
+AUSTRALIA_REGION_RE = re.compile(r"^(Australia)\s+(.+)$", flags=re.IGNORECASE)
+
+
+# Mémoïsées : les mêmes ports et pays reviennent des milliers de fois
+@lru_cache(maxsize=None)
 def normalize_text(value: str) -> str:
     """Nettoie une chaîne pour améliorer les chances de géocodage."""
     text = str(value).strip()
     text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
-    text = re.sub(r"[_.]+", " ", text)   # ex: MU.S.A -> MU S A
-    text = re.sub(r"\s*\([^)]*\)", "", text)  # supprime les parenthèses
-    text = re.sub(r"\s+", " ", text).strip(" ,")
+    text = SEPARATORS_RE.sub(" ", text)  # ex: MU.S.A -> MU S A
+    text = PARENTHESES_RE.sub("", text)  # supprime les parenthèses
+    text = SPACES_RE.sub(" ", text).strip(" ,")
     return text
 
 
+@lru_cache(maxsize=None)
 def normalize_country(value):
     if pd.isna(value):
         return "", ""
@@ -69,8 +260,8 @@ def normalize_country(value):
         return "", ""
 
     # Ex: "Australia (Island)" -> region_candidate="Island"
-    parenthesized_parts = re.findall(r"\(([^)]*)\)", raw)
-    without_parentheses = re.sub(r"\s*\([^)]*\)", "", raw).strip()
+    parenthesized_parts = PARENTHESIZED_RE.findall(raw)
+    without_parentheses = PARENTHESES_RE.sub("", raw).strip()
 
     country_candidate = without_parentheses
     region_candidate = ""
@@ -82,7 +273,7 @@ def normalize_country(value):
         region_candidate = right.strip()
     else:
         # Ex: "Australia Queensl"
-        match = re.match(r"^(Australia)\s+(.+)$", without_parentheses, flags=re.IGNORECASE)
+        match = AUSTRALIA_REGION_RE.match(without_parentheses)
         if match:
             country_candidate = match.group(1).strip()
             region_candidate = match.group(2).strip()
@@ -113,93 +304,527 @@ def normalize_country(value):
     return country_clean, region_clean
 
 
-def build_queries(port_name: str, country_name: str, region_name: str) -> list[str]:
+# Variantes de requête, dans l'ordre par défaut : (nom, modèle)
+REGION_VARIANTS = [
+    ("port_region", "{port} port, {region}, {country}"),
+    ("harbor_region", "{port} harbor, {region}, {country}"),
+    ("terminal_region", "{port} terminal, {region}, {country}"),
+    ("bare_region", "{port}, {region}, {country}"),
+]
+COUNTRY_VARIANTS = [
+    ("port_country", "{port} port, {country}"),
+    ("harbor_country", "{port} harbor, {country}"),
+    ("terminal_country", "{port} terminal, {country}"),
+    ("bare_country", "{port}, {country}"),
+]
+PORT_VARIANTS = [
+    ("port", "{port} port"),
+    ("bare", "{port}"),
+]
+
+
+def build_variant_queries(
+    port_name: str, country_name: str, region_name: str
+) -> list[tuple[str, str]]:
+    """(variante, requête) dans l'ordre par défaut."""
     port_clean = normalize_text(port_name)
     country_clean = normalize_text(country_name) if country_name else ""
     region_clean = normalize_text(region_name) if region_name else ""
 
-    queries = []
-
+    variants = []
     if country_clean and region_clean:
-        queries.extend(
-            [
-                f"{port_clean} port, {region_clean}, {country_clean}",
-                f"{port_clean} harbor, {region_clean}, {country_clean}",
-                f"{port_clean} terminal, {region_clean}, {country_clean}",
-                f"{port_clean}, {region_clean}, {country_clean}",
-            ]
-        )
-
+        variants.extend(REGION_VARIANTS)
     if country_clean:
-        queries.extend(
-            [
-                f"{port_clean} port, {country_clean}",
-                f"{port_clean} harbor, {country_clean}",
-                f"{port_clean} terminal, {country_clean}",
-                f"{port_clean}, {country_clean}",
-            ]
+        variants.extend(COUNTRY_VARIANTS)
+    variants.extend(PORT_VARIANTS)
+
+    queries = {}
+    for name, template in variants:
+        query = template.format(
+            port=port_clean, region=region_clean, country=country_clean
         )
+        # Déduplique tout en gardant l'ordre
+        if query and query not in queries:
+            queries[query] = name
+    return [(name, query) for query, name in queries.items()]
 
-    queries.extend(
-        [
-            f"{port_clean} port",
-            port_clean,
-        ]
-    )
 
-    # Déduplique tout en gardant l'ordre
-    return list(dict.fromkeys([q for q in queries if q]))
+def build_queries(port_name: str, country_name: str, region_name: str) -> list[str]:
+    return [
+        query
+        for _, query in build_variant_queries(port_name, country_name, region_name)
+    ]
 
 
-# Détection des colonnes sans dépendre de la casse
-columns_map = {c.lower(): c for c in df.columns}
-country_column = columns_map.get("country")
-coordinates_column = columns_map.get("coordinates")
+def input_signature(path: str) -> list:
+    stat = os.stat(path)
+    return [os.path.abspath(path), stat.st_size, stat.st_mtime_ns]
 
-coords = []
 
-for _, row in tqdm(df.iterrows(), total=len(df)):
+def load_checkpoint() -> tuple[int, int]:
+    """(lignes déjà écrites, taille valide de la sortie), (0, 0) sans reprise."""
     try:
-        port_name = str(row[port_column]).strip()
-        existing_coords = ""
-        if coordinates_column and pd.notna(row[coordinates_column]):
-            existing_coords = str(row[coordinates_column]).strip()
-
-        # Garde les coordonnées existantes
-        if existing_coords:
-            coords.append(existing_coords)
-            print(f"{port_name} -> coordonnées déjà présentes")
-            continue
-
-        if country_column:
-            country_name, region_name = normalize_country(row[country_column])
+        with open(checkpoint_file, encoding="utf-8") as handle:
+            checkpoint = json.load(handle)
+    except (OSError, ValueError):
+        return 0, 0
+    if checkpoint.get("input") != input_signature(input_file):
+        print("Fichier d'entrée modifié : reprise ignorée, on recommence")
+        return 0, 0
+    if not os.path.exists(output_file):
+        return 0, 0
+    return checkpoint["rows_done"], checkpoint["output_bytes"]
+
+
+def save_checkpoint(rows_done: int, output_bytes: int) -> None:
+    temporary = checkpoint_file + ".tmp"
+    with open(temporary, "w", encoding="utf-8") as handle:
+        json.dump(
+            {
+                "input": input_signature(input_file),
+                "rows_done": rows_done,
+                "output_bytes": output_bytes,
+            },
+            handle,
+        )
+    os.replace(temporary, checkpoint_file)
+
+
+class VariantStats:
+    """Succès de chaque variante par pays/région, gardés d'une exécution à
+    l'autre. L'ordre d'une exécution se base sur les stats de départ, ce qui
+    rend les résultats reproductibles ; les essais du jour s'y ajoutent à la fin.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.lock = threading.Lock()
+        self.known = {}
+        self.new = {}
+        with sqlite3.connect(path) as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS variant_stats ("
+                " scope TEXT, variant TEXT, attempts INTEGER, successes INTEGER,"
+                " PRIMARY KEY (scope, variant))"
+            )
+            for scope, variant, attempts, successes in connection.execute(
+                "SELECT scope, variant, attempts, successes FROM variant_stats"
+            ):
+                self.known.setdefault(scope, {})[variant] = [attempts, successes]
+        connection.close()
+
+    @staticmethod
+    def scopes(country_name: str, region_name: str) -> list[str]:
+        """Du plus précis au plus général ; "" = tous pays confondus."""
+        country = country_name.upper()
+        scopes = [f"{country}|{region_name.upper()}"] if region_name else []
+        return scopes + [country, ""] if country else [""]
+
+    def order(self, country_name: str, region_name: str, variants: list) -> list:
+        """Variantes triées par taux de succès, les causes perdues écartées."""
+        for scope in self.scopes(country_name, region_name):
+            stats = self.known.get(scope, {})
+            if sum(attempts for attempts, _ in stats.values()) >= MIN_SCOPE_ATTEMPTS:
+                break
         else:
-            country_name, region_name = "", ""
+            return variants
+
+        def score(item):
+            position, (name, _) = item
+            attempts, successes = stats.get(name, (0, 0))
+            # Lissage : une variante peu essayée garde une chance moyenne
+            return (-(successes + 0.5) / (attempts + 1), position)
+
+        ranked = [variant for _, variant in sorted(enumerate(variants), key=score)]
+        kept = [
+            (name, query)
+            for name, query in ranked
+            if stats.get(name, (0, 0))[0] < PRUNE_MIN_ATTEMPTS
+            or stats[name][1]
+        ]
+        return kept or ranked
+
+    def record(
+        self, country_name: str, region_name: str, variant: str, found: bool
+    ) -> None:
+        with self.lock:
+            for scope in self.scopes(country_name, region_name):
+                counts = self.new.setdefault((scope, variant), [0, 0])
+                counts[0] += 1
+                counts[1] += found
+
+    def save(self) -> None:
+        with self.lock, sqlite3.connect(self.path) as connection:
+            connection.executemany(
+                "INSERT INTO variant_stats VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (scope, variant) DO UPDATE SET"
+                " attempts = attempts + excluded.attempts,"
+                " successes = successes + excluded.successes",
+                [(*key, *counts) for key, counts in self.new.items()],
+            )
+            self.new.clear()
+        connection.close()
+
+    def attempts(self) -> int:
+        return sum(counts[0] for (scope, _), counts in self.new.items() if not scope)
+
+
+variant_stats = VariantStats(cache_file)
+
+
+# Colonnes d'un export UN/LOCODE (fichiers CSV sans en-tête)
+UNLOCODE_COLUMNS = [
+    "change",
+    "country",
+    "location",
+    "name",
+    "namewodiacritics",
+    "subdivision",
+    "status",
+    "function",
+    "date",
+    "iata",
+    "coordinates",
+    "remarks",
+]
+
+
+def parse_unlocode_coordinates(text: str) -> str:
+    """"4930N 00006E" -> "49.5000000,0.1000000" ; "" si illisible."""
+    match = re.fullmatch(r"(\d{2})(\d{2})([NS])\s+(\d{3})(\d{2})([EW])", text.strip())
+    if not match:
+        return ""
+    lat_deg, lat_min, lat_hem, lon_deg, lon_min, lon_hem = match.groups()
+    latitude = int(lat_deg) + int(lat_min) / 60
+    longitude = int(lon_deg) + int(lon_min) / 60
+    latitude = -latitude if lat_hem == "S" else latitude
+    longitude = -longitude if lon_hem == "W" else longitude
+    return f"{latitude:.7f},{longitude:.7f}"
+
+
+def trigrams(name: str) -> set[str]:
+    padded = f"  {name} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class Gazetteer:
+    """Index en mémoire des lieux d'un gazetteer, par pays puis par nom
+    normalisé, avec recherche approchée sur les trigrammes."""
+
+    def __init__(self, path: str) -> None:
+        # pays -> {"names": nom -> [entrées], "trigrams": trigramme -> {noms}}
+        self.countries = {}
+        self.entries = 0
+        for record in self._read(path):
+            self._add(record)
+        if pycountry is None and any(len(country) == 2 for country in self.countries):
+            print(
+                "Gazetteer : codes pays ISO sans le module pycountry, "
+                "ces lieux ne correspondront à aucun pays"
+            )
 
-        queries = build_queries(port_name, country_name, region_name)
+    @staticmethod
+    def _read(path: str):
+        try:
+            with open(path, encoding="utf-8-sig") as handle:
+                rows = list(csv.reader(handle))
+        except UnicodeDecodeError:
+            # Les exports UN/LOCODE sont en ISO 8859-1
+            with open(path, encoding="latin-1") as handle:
+                rows = list(csv.reader(handle))
+        if not rows:
+            return
+        header = [column.strip().lower() for column in rows[0]]
+        if "name" in header or "namewodiacritics" in header:
+            rows = rows[1:]
+        elif len(rows[0]) == len(UNLOCODE_COLUMNS):
+            header = UNLOCODE_COLUMNS
+        else:
+            raise ValueError(f"Colonnes du gazetteer non reconnues : {rows[0]}")
+        for row in rows:
+            yield dict(zip(header, row))
+
+    @staticmethod
+    def _country_name(value: str) -> str:
+        value = value.strip()
+        if pycountry is not None and len(value) == 2:
+            country = pycountry.countries.get(alpha_2=value.upper())
+            if country is not None:
+                return country.name
+        return normalize_country(value)[0]
+
+    @staticmethod
+    def _coordinates(record: dict) -> str:
+        text = (record.get("coordinates") or "").strip()
+        if text:
+            if re.fullmatch(r"-?[\d.]+\s*,\s*-?[\d.]+", text):
+                latitude, longitude = (float(part) for part in text.split(","))
+                return f"{latitude:.7f},{longitude:.7f}"
+            return parse_unlocode_coordinates(text)
+        if record.get("latitude") and record.get("longitude"):
+            latitude = float(record["latitude"])
+            longitude = float(record["longitude"])
+            return f"{latitude:.7f},{longitude:.7f}"
+        return ""
+
+    def _add(self, record: dict) -> None:
+        coordinates = self._coordinates(record)
+        name = record.get("namewodiacritics") or record.get("name") or ""
+        if not coordinates or not name.strip():
+            return
+        country = self._country_name(record.get("country", "")).upper()
+        region = normalize_text(
+            record.get("region") or record.get("subdivision") or ""
+        ).upper()
+        # Un lieu de fonction "1..." est un port (UN/LOCODE)
+        is_port = record.get("function", "1").startswith("1")
+        index = self.countries.setdefault(country, {"names": {}, "trigrams": {}})
+        # "Antwerpen (Antwerp)" est indexé sous les deux noms
+        for alias in [name, *PARENTHESIZED_RE.findall(name)]:
+            key = normalize_text(alias).upper()
+            if not key:
+                continue
+            if key not in index["names"]:
+                for trigram in trigrams(key):
+                    index["trigrams"].setdefault(trigram, set()).add(key)
+            index["names"].setdefault(key, []).append((is_port, region, coordinates))
+        self.entries += 1
+
+    def lookup(self, port_name: str, country_name: str, region_name: str) -> str:
+        """Coordonnées du lieu le plus ressemblant dans le pays, la région
+        départageant les homonymes ; "" si rien d'assez proche."""
+        index = self.countries.get(country_name.upper())
+        key = normalize_text(port_name).upper()
+        if index is None or not key:
+            return ""
+        names = index["names"]
+        if key in names:
+            candidates = [(1.0, key)]
+        else:
+            wanted = trigrams(key)
+            shared = Counter()
+            for trigram in wanted:
+                shared.update(index["trigrams"].get(trigram, ()))
+            candidates = []
+            for name, count in shared.items():
+                score = 2 * count / (len(wanted) + len(trigrams(name)))
+                if score >= GAZETTEER_MIN_SIMILARITY:
+                    candidates.append((score, name))
+        if not candidates:
+            return ""
+        region = normalize_text(region_name).upper() if region_name else ""
+        _, _, _, coordinates = max(
+            (
+                (bool(region) and entry_region == region, score, is_port, found)
+                for score, name in candidates
+                for is_port, entry_region, found in names[name]
+            ),
+            key=lambda candidate: candidate[:3],
+        )
+        return coordinates
+
+
+gazetteer = Gazetteer(gazetteer_file) if gazetteer_file else None
+if gazetteer is not None:
+    print(f"Gazetteer : {gazetteer.entries} lieux indexés")
+
+
+class SingleFlight:
+    """Chaque requête distincte n'est envoyée qu'une fois par exécution, même
+    demandée en même temps par plusieurs threads."""
+
+    def __init__(self, resolve) -> None:
+        self.resolve = resolve
+        self.lock = threading.Lock()
+        self.results = {}
+        self.pending = {}
+
+    def __call__(self, query: str) -> str:
+        key = GeocodingCache.key(query)
+        with self.lock:
+            if key in self.results:
+                return self.results[key]
+            waiting = self.pending.get(key)
+            if waiting is None:
+                self.pending[key] = threading.Event()
+        if waiting is not None:
+            waiting.wait()
+            with self.lock:
+                if key in self.results:
+                    return self.results[key]
+            # L'appel de l'autre thread a échoué : on retente ici
+            return self(query)
+        try:
+            coordinates = self.resolve(query)
+            with self.lock:
+                self.results[key] = coordinates
+            return coordinates
+        finally:
+            with self.lock:
+                self.pending.pop(key).set()
+
+
+resolve_query = SingleFlight(geocode)
+offline_ports = []
+
+
+def map_unique(series: pd.Series, function) -> pd.Series:
+    """``function`` appliquée une fois par valeur distincte de la colonne."""
+    uniques = series.unique()
+    return series.map(dict(zip(uniques, map(function, uniques))))
+
+
+def chunk_keys(chunk: pd.DataFrame) -> tuple[list, list]:
+    """Coordonnées existantes et clé (port, pays, région) normalisée de
+    chaque ligne du bloc ; clé None si les coordonnées sont déjà là."""
+    if coordinates_column:
+        existing = chunk[coordinates_column].str.strip().tolist()
+    else:
+        existing = [""] * len(chunk)
+    ports = map_unique(chunk[port_column], normalize_text).tolist()
+    if country_column:
+        countries = map_unique(chunk[country_column], normalize_country).tolist()
+    else:
+        countries = [("", "")] * len(chunk)
+    keys = [
+        None if coordinates else (port, *country)
+        for coordinates, port, country in zip(existing, ports, countries)
+    ]
+    return existing, keys
 
-        found_coordinates = ""
-        for query in queries:
-            location = geolocator.geocode(query, timeout=10)
-            time.sleep(0.8)  # limite de débit Nominatim
-            if location:
-                found_coordinates = f"{location.latitude:.7f},{location.longitude:.7f}"
-                print(f"{query} -> {found_coordinates}")
-                break
 
-        if found_coordinates:
-            coords.append(found_coordinates)
-        else:
-            coords.append("")
-            print(
-                f"{port_name} (country={country_name or 'N/A'}, region={region_name or 'N/A'}) -> introuvable"
+def resolve_key(key) -> str:
+    """Coordonnées d'un port (première variante trouvée), "" si introuvable."""
+    port_name, country_name, region_name = key
+    try:
+        if gazetteer is not None:
+            found_coordinates = gazetteer.lookup(port_name, country_name, region_name)
+            if found_coordinates:
+                offline_ports.append(key)
+                print(f"{port_name} -> {found_coordinates} (gazetteer)")
+                return found_coordinates
+
+        variants = variant_stats.order(
+            country_name,
+            region_name,
+            build_variant_queries(port_name, country_name, region_name),
+        )
+        for variant, query in variants:
+            found_coordinates = resolve_query(query)
+            variant_stats.record(
+                country_name, region_name, variant, bool(found_coordinates)
             )
+            if found_coordinates:
+                print(f"{query} -> {found_coordinates}")
+                return found_coordinates
 
+        print(
+            f"{port_name} (country={country_name or 'N/A'}, "
+            f"region={region_name or 'N/A'}) -> introuvable"
+        )
     except Exception as e:
-        coords.append("")
         print(f"Erreur pour {port_name}: {e}")
+    return ""
+
+
+def read_chunks(usecols=None, chunksize: int = CHUNK_ROWS):
+    # Texte brut : des types déduits bloc par bloc changeraient la sortie.
+    # Les cellules sont donc recopiées telles quelles (« 2 » reste « 2 »,
+    # là où l'ancien to_csv du fichier entier écrivait « 2.0 » dans une
+    # colonne numérique avec des vides)
+    return pd.read_csv(
+        input_file,
+        usecols=usecols,
+        chunksize=chunksize,
+        dtype=str,
+        keep_default_na=False,
+    )
+
 
-df["coordinates"] = coords
-df.to_csv(output_file, index=False, encoding="utf-8-sig")
+def remaining_chunks(chunks, rows_done: int):
+    """Les blocs privés des ``rows_done`` premières lignes."""
+    row_index = 0
+    for chunk in chunks:
+        chunk_start = row_index
+        row_index += len(chunk)
+        if row_index > rows_done:
+            yield chunk.iloc[max(rows_done - chunk_start, 0) :]
 
-print(f"\nFichier généré : {output_file}")
\ No newline at end of file
+
+# Détection des colonnes sans dépendre de la casse
+columns_map = {c.lower(): c for c in columns}
+country_column = columns_map.get("country")
+coordinates_column = columns_map.get("coordinates")
+
+rows_done, output_bytes = load_checkpoint()
+if rows_done:
+    print(f"Reprise après {rows_done} lignes déjà traitées")
+    with open(output_file, "r+b") as handle:
+        # Écarte ce qui a été écrit après le dernier point de reprise
+        handle.truncate(output_bytes)
+else:
+    open(output_file, "wb").close()
+
+# 1. Planification : les ports distincts à géocoder, sans lire tout le fichier
+key_columns = [c for c in (port_column, country_column, coordinates_column) if c]
+total_rows = rows_done
+planned = {}
+plan_chunks = read_chunks(key_columns, PLAN_CHUNK_ROWS)
+for chunk in remaining_chunks(plan_chunks, rows_done):
+    total_rows += len(chunk)
+    _, keys = chunk_keys(chunk)
+    planned.update(dict.fromkeys(filter(None, keys), ""))
+print(
+    f"{total_rows - rows_done} lignes à traiter, {len(planned)} ports distincts "
+    "à géocoder"
+)
+
+# 2. Géocodage de chaque port distinct, en parallèle
+pool = ThreadPoolExecutor(max_workers=GEOCODING_WORKERS)
+try:
+    keys = list(planned)
+    for key, found in zip(keys, tqdm(pool.map(resolve_key, keys), total=len(keys))):
+        planned[key] = found
+except KeyboardInterrupt:
+    print("\nInterrompu ; relancer pour reprendre (réponses obtenues en cache)")
+    # Attend les requêtes en cours (bornées par le timeout) avant de fermer
+    # la connexion SQLite qu'elles utilisent
+    pool.shutdown(wait=True, cancel_futures=True)
+    geocoding_cache.close()
+    variant_stats.save()
+    raise SystemExit(1)
+pool.shutdown()
+geocoding_cache.close()
+if planned:
+    if gazetteer is not None:
+        print(f"{len(offline_ports)} ports trouvés dans le gazetteer")
+    average = variant_stats.attempts() / len(planned)
+    print(f"{average:.2f} requêtes essayées par port")
+variant_stats.save()
+
+
+# 3. Écriture par blocs, avec un point de reprise après chacun.
+# Sortie en UTF-8 avec BOM, comme un to_csv(encoding="utf-8-sig") d'un bloc
+with open(output_file, "a", encoding="utf-8", newline="") as output:
+    if not output_bytes:
+        output.write("\ufeff")
+    for chunk in remaining_chunks(read_chunks(), rows_done):
+        chunk = chunk.copy()
+        existing, keys = chunk_keys(chunk)
+        chunk["coordinates"] = [
+            coordinates or planned[key] for coordinates, key in zip(existing, keys)
+        ]
+        chunk.to_csv(output, header=rows_done == 0, index=False)
+        output.flush()
+        os.fsync(output.fileno())
+        rows_done += len(chunk)
+        save_checkpoint(rows_done, os.fstat(output.fileno()).st_size)
+
+if os.path.exists(checkpoint_file):
+    os.remove(checkpoint_file)
+
+print(
+    f"\nCache : {geocoding_cache.hits} réponses réutilisées, "
+    f"{geocoding_cache.misses} requêtes envoyées"
+)
+print(f"Fichier généré : {output_file}")
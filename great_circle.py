@@ -0,0 +1,171 @@
+"""Great-circle lower bounds from the ports' ``coordinates`` column.
+
+A sea route is never shorter than the great circle between its two ends,
+so the haversine distance is a lower bound for any missing segment or
+pair: long legs stand out before any routing engine is involved, and a
+new segment shorter than its bound is wrong. Coordinates are parsed once
+per ports file into two float arrays indexed by port; the distances of a
+whole row section are computed in vectorized batches (numpy when it is
+installed, ``math`` otherwise).
+"""
+
+import math
+from array import array
+
+from distances_engine import _effective_port_id, _normalize_id
+from memory_budget import new_rows
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+EARTH_RADIUS_NM = 3440.065
+ESTIMATE_FIELD = "great_circle_nm"
+# (section, from id field, to id field) of the rows that get an estimate.
+ESTIMATE_SECTIONS = (
+    ("missing", "load_id", "disch_id"),
+    ("missing_segments", "from_id", "to_id"),
+    ("missing_complete", "disch_id", "load_id"),
+    ("pairs", "load_id", "disch_id"),
+)
+BATCH_ROWS = 1 << 16
+
+
+def parse_coordinates(text) -> tuple[float, float] | None:
+    """``"lat,lon"`` in degrees; None when blank, malformed or out of range."""
+    lat_text, sep, lon_text = str(text or "").partition(",")
+    if not sep:
+        return None
+    try:
+        lat = float(lat_text)
+        lon = float(lon_text)
+    except ValueError:
+        return None
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0):
+        return None
+    return lat, lon
+
+
+def haversine_nm(lat1, lon1, lat2, lon2):
+    """Great-circle distance in nautical miles; numpy arrays in, array out."""
+    lat1, lon1, lat2, lon2 = (np.radians(value) for value in (lat1, lon1, lat2, lon2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_NM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _haversine_nm_scalar(lat1, lon1, lat2, lon2) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_NM * math.asin(math.sqrt(min(a, 1.0)))
+
+
+class PortCoordinates:
+    """Parsed coordinates of every port id of a PortsData (NaN = unknown).
+
+    An alias without coordinates of its own borrows its master port's.
+    """
+
+    def __init__(self, ports) -> None:
+        self.index = {}
+        lats = array("d")
+        lons = array("d")
+        parsed = {}
+        for row in ports.rows:
+            port_id = _normalize_id(row.get("id"))
+            if port_id and port_id not in parsed:
+                parsed[port_id] = parse_coordinates(row.get("coordinates"))
+        for port_id, row in ports.by_id.items():
+            point = parsed.get(port_id) or parsed.get(_effective_port_id(row))
+            self.index[port_id] = len(lats)
+            lats.append(point[0] if point else math.nan)
+            lons.append(point[1] if point else math.nan)
+        self.ids = list(self.index)
+        self.lats = np.frombuffer(lats) if np is not None else lats
+        self.lons = np.frombuffer(lons) if np is not None else lons
+        self.known = sum(1 for lat in lats if not math.isnan(lat))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def point(self, port_id: str) -> tuple[float, float] | None:
+        idx = self.index.get(port_id)
+        if idx is None or math.isnan(self.lats[idx]):
+            return None
+        return self.lats[idx], self.lons[idx]
+
+    def distances(self, from_ids: list, to_ids: list) -> list:
+        """Great circle per id pair, rounded to 0.1 nm; None when either port
+        is unknown or has no coordinates."""
+        index = self.index
+        from_idx = [index.get(port_id, -1) for port_id in from_ids]
+        to_idx = [index.get(port_id, -1) for port_id in to_ids]
+        if np is None:
+            lats, lons = self.lats, self.lons
+            values = []
+            for a, b in zip(from_idx, to_idx):
+                if a < 0 or b < 0 or math.isnan(lats[a]) or math.isnan(lats[b]):
+                    values.append(None)
+                else:
+                    distance = _haversine_nm_scalar(lats[a], lons[a], lats[b], lons[b])
+                    values.append(round(distance, 1))
+            return values
+        if not from_idx:
+            return []
+        # Index -1 reads a NaN sentinel appended after the real ports.
+        lats = np.append(self.lats, math.nan)
+        lons = np.append(self.lons, math.nan)
+        a = np.asarray(from_idx)
+        b = np.asarray(to_idx)
+        values = np.round(haversine_nm(lats[a], lons[a], lats[b], lons[b]), 1)
+        return [None if math.isnan(value) else value for value in values.tolist()]
+
+
+def _estimate_rows(rows, coordinates: PortCoordinates, keys: tuple, budget):
+    """``rows`` with ESTIMATE_FIELD set, batch by batch; (rows, estimated)."""
+    from_key, to_key = keys
+    # Spill lists read their rows back from disk: updated rows go to a new one.
+    spilled = not isinstance(rows, list)
+    out = new_rows(budget) if spilled else rows
+    estimated = 0
+    batch = []
+
+    def flush() -> int:
+        values = coordinates.distances(
+            [row[from_key] for row in batch], [row[to_key] for row in batch]
+        )
+        for row, value in zip(batch, values):
+            row[ESTIMATE_FIELD] = value
+            if spilled:
+                out.append(row)
+        batch.clear()
+        return sum(value is not None for value in values)
+
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_ROWS:
+            estimated += flush()
+    estimated += flush()
+    return out, estimated
+
+
+def add_great_circle_estimates(result: dict, ports, budget=None) -> dict:
+    """Add ESTIMATE_FIELD to every missing segment / pair row of ``result``
+    and ``great_circle_estimates`` (rows with a value) to its summary."""
+    coordinates = PortCoordinates(ports)
+    estimated = 0
+    for section, *keys in ESTIMATE_SECTIONS:
+        if section not in result:
+            continue
+        result[section], count = _estimate_rows(
+            result[section], coordinates, keys, budget
+        )
+        estimated += count
+    result["summary"]["great_circle_estimates"] = estimated
+    return result
@@ -0,0 +1,181 @@
+"""Region x region coverage heatmap window shared by both Tk tools."""
+
+import tkinter as tk
+from tkinter import filedialog, messagebox, ttk
+
+from distances_engine import write_region_csv
+
+CELL = 30
+HEADER = 60
+METRICS = ("coverage %", "found", "missing", "no_rule", "pairs")
+
+
+def _region_sort_key(region: str):
+    return (not region.isdigit(), int(region) if region.isdigit() else 0, region)
+
+
+def _region_label(region: str) -> str:
+    return region or "(none)"
+
+
+def _cell_value(row: dict, metric: str):
+    if metric == "coverage %":
+        return round(100 * row["found"] / row["pairs"]) if row["pairs"] else None
+    return row[metric]
+
+
+def _cell_color(value, top: int, metric: str) -> str:
+    if value is None:
+        return "#eeeeee"
+    if metric == "coverage %":
+        # red (0 %) -> yellow (50 %) -> green (100 %)
+        share = value / 100
+        red = 255 if share < 0.5 else int(255 * (1 - share) * 2)
+        green = int(255 * share * 2) if share < 0.5 else 255
+        return f"#{red:02x}{green:02x}60"
+    level = int(255 - 200 * (value / top)) if top else 255
+    return f"#{level:02x}{level:02x}ff"
+
+
+class RegionHeatmapWindow:
+    """Disch regions as rows, load regions as columns, one metric at a time."""
+
+    def __init__(self, root: tk.Tk, result: dict, title: str) -> None:
+        self.result = result
+        self.cells = {
+            (row["disch_region_id"], row["load_region_id"]): row
+            for row in result["regions"]
+        }
+        self.disch_regions = sorted(
+            {disch for disch, _ in self.cells}, key=_region_sort_key
+        )
+        self.load_regions = sorted(
+            {load for _, load in self.cells}, key=_region_sort_key
+        )
+
+        self.window = tk.Toplevel(root)
+        self.window.title(title)
+        self.window.geometry("900x700")
+
+        top = ttk.Frame(self.window, padding=8)
+        top.pack(fill="x")
+        ttk.Label(top, text="Show").pack(side="left")
+        self.metric_var = tk.StringVar(value=METRICS[0])
+        metric_box = ttk.Combobox(
+            top,
+            textvariable=self.metric_var,
+            values=METRICS,
+            state="readonly",
+            width=12,
+        )
+        metric_box.pack(side="left", padx=6)
+        metric_box.bind("<<ComboboxSelected>>", lambda _event: self._draw())
+        ttk.Button(top, text="Export CSV", command=self.export_csv).pack(
+            side="left", padx=8
+        )
+        summary = result["summary"]
+        ttk.Label(
+            top,
+            text=(
+                f"{summary['pairs']} pairs: {summary['found']} found, "
+                f"{summary['missing']} missing, {summary['no_rule']} without rule"
+            ),
+        ).pack(side="left", padx=12)
+
+        self.hover_status = tk.StringVar(
+            value="Rows: disch region, columns: load region"
+        )
+        ttk.Label(self.window, textvariable=self.hover_status, padding=(8, 0)).pack(
+            fill="x"
+        )
+
+        frame = ttk.Frame(self.window, padding=8)
+        frame.pack(fill="both", expand=True)
+        self.canvas = tk.Canvas(frame, background="white", highlightthickness=0)
+        x_scroll = ttk.Scrollbar(frame, orient="horizontal", command=self.canvas.xview)
+        y_scroll = ttk.Scrollbar(frame, orient="vertical", command=self.canvas.yview)
+        self.canvas.configure(
+            xscrollcommand=x_scroll.set, yscrollcommand=y_scroll.set
+        )
+        self.canvas.grid(row=0, column=0, sticky="nsew")
+        y_scroll.grid(row=0, column=1, sticky="ns")
+        x_scroll.grid(row=1, column=0, sticky="ew")
+        frame.rowconfigure(0, weight=1)
+        frame.columnconfigure(0, weight=1)
+        self.canvas.bind("<Motion>", self._on_motion)
+
+        self._draw()
+
+    def _draw(self) -> None:
+        metric = self.metric_var.get()
+        canvas = self.canvas
+        canvas.delete("all")
+        values = {
+            key: _cell_value(row, metric) for key, row in self.cells.items()
+        }
+        top = max((value for value in values.values() if value), default=0)
+
+        for col, load in enumerate(self.load_regions):
+            canvas.create_text(
+                HEADER + col * CELL + CELL / 2,
+                HEADER - 4,
+                text=_region_label(load),
+                angle=90,
+                anchor="w",
+            )
+        for row_idx, disch in enumerate(self.disch_regions):
+            y = HEADER + row_idx * CELL
+            canvas.create_text(
+                HEADER - 4, y + CELL / 2, text=_region_label(disch), anchor="e"
+            )
+            for col, load in enumerate(self.load_regions):
+                x = HEADER + col * CELL
+                value = values.get((disch, load))
+                canvas.create_rectangle(
+                    x,
+                    y,
+                    x + CELL,
+                    y + CELL,
+                    fill=_cell_color(value, top, metric),
+                    outline="#ffffff",
+                )
+                if value is not None:
+                    canvas.create_text(
+                        x + CELL / 2,
+                        y + CELL / 2,
+                        text=str(value),
+                        font=("TkDefaultFont", 7),
+                    )
+        canvas.configure(scrollregion=canvas.bbox("all"))
+
+    def _on_motion(self, event: tk.Event) -> None:
+        col = int((self.canvas.canvasx(event.x) - HEADER) // CELL)
+        row_idx = int((self.canvas.canvasy(event.y) - HEADER) // CELL)
+        if not (0 <= row_idx < len(self.disch_regions)) or not (
+            0 <= col < len(self.load_regions)
+        ):
+            return
+        disch = self.disch_regions[row_idx]
+        load = self.load_regions[col]
+        row = self.cells.get((disch, load))
+        if row is None:
+            return
+        self.hover_status.set(
+            f"Disch region {_region_label(disch)} -> load region "
+            f"{_region_label(load)}: {row['pairs']} pairs, {row['found']} found, "
+            f"{row['missing']} missing, {row['no_rule']} without rule"
+        )
+
+    def export_csv(self) -> None:
+        path = filedialog.asksaveasfilename(
+            parent=self.window,
+            title="Save region coverage",
+            defaultextension=".csv",
+            filetypes=[("CSV Files", "*.csv")],
+        )
+        if not path:
+            return
+        write_region_csv(self.result, path)
+        messagebox.showinfo(
+            "Saved", f"Saved region coverage to {path}", parent=self.window
+        )
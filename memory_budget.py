@@ -0,0 +1,122 @@
+"""Memory budget for long analyses: tracemalloc watch plus spill-to-disk rows.
+
+With a budget set, result rows go into SpillList containers instead of
+plain lists. Every few thousand appends the budget samples tracemalloc; past
+``spill_ratio`` of the limit it notifies its listeners: every SpillList
+flushes its buffered rows to a temporary JSON-lines file, and mapped
+segment tables drop their decoded-lookup memo.
+"""
+
+import json
+import os
+import tempfile
+import tracemalloc
+
+CHECK_EVERY = 4096
+
+
+class MemoryBudget:
+    def __init__(
+        self,
+        limit_bytes: int,
+        spill_ratio: float = 0.8,
+        spill_dir: str | None = None,
+    ) -> None:
+        self.limit_bytes = limit_bytes
+        self.threshold = int(limit_bytes * spill_ratio)
+        self.spill_dir = spill_dir
+        self.spills = 0
+        self._listeners = []
+        self._started_tracing = False
+
+    def start(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def stop(self) -> None:
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def add_listener(self, callback) -> None:
+        self._listeners.append(callback)
+
+    def check(self) -> bool:
+        """Notify listeners when traced memory is past the spill threshold."""
+        if not tracemalloc.is_tracing():
+            return False
+        current, _ = tracemalloc.get_traced_memory()
+        if current < self.threshold:
+            return False
+        self.spills += 1
+        for callback in self._listeners:
+            callback()
+        return True
+
+    def report(self, peak_bytes: int = 0) -> dict:
+        """Budget summary; ``peak_bytes`` is the run's peak when something
+        (Profiler phases) reset the tracemalloc peak along the way."""
+        peak = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else 0
+        peak = max(peak, peak_bytes)
+        return {
+            "limit_bytes": self.limit_bytes,
+            "spill_threshold_bytes": self.threshold,
+            "peak_bytes": peak,
+            "spills": self.spills,
+        }
+
+
+class SpillList:
+    """Append-only row list that moves its rows to disk under memory pressure.
+
+    Iteration yields spilled rows first (read back lazily), then the rows
+    still buffered in memory, preserving append order.
+    """
+
+    def __init__(self, budget: MemoryBudget) -> None:
+        self._budget = budget
+        self._buffer = []
+        self._file = None
+        self._spilled = 0
+        self._appends = 0
+        budget.add_listener(self.spill)
+
+    def append(self, row) -> None:
+        self._buffer.append(row)
+        self._appends += 1
+        if self._appends % CHECK_EVERY == 0:
+            self._budget.check()
+
+    def spill(self) -> None:
+        if not self._buffer:
+            return
+        if self._file is None:
+            self._file = tempfile.TemporaryFile(
+                "w+", encoding="utf-8", dir=self._budget.spill_dir
+            )
+        self._file.seek(0, os.SEEK_END)
+        for row in self._buffer:
+            self._file.write(json.dumps(row, ensure_ascii=False))
+            self._file.write("\n")
+        self._spilled += len(self._buffer)
+        self._buffer = []
+
+    def __len__(self) -> int:
+        return self._spilled + len(self._buffer)
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def __iter__(self):
+        if self._file is not None:
+            self._file.flush()
+            with open(self._file.fileno(), encoding="utf-8", closefd=False) as reader:
+                reader.seek(0)
+                for _ in range(self._spilled):
+                    yield json.loads(reader.readline())
+        yield from list(self._buffer)
+
+
+def new_rows(budget: "MemoryBudget | None"):
+    return SpillList(budget) if budget is not None else []
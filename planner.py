@@ -0,0 +1,183 @@
+"""Pick how to run one analysis from the sizes of the loaded inputs.
+
+The estimate only uses counts that are cheap once the CSVs are parsed:
+load/disch ports per zone (after alias resolution), rules per zone pair,
+distance pairs. Costs per pair and per rule check were measured on the
+synthetic benchmark sets (single core) and are deliberately rough; the
+plan only has to tell a one-second run from a one-hour run.
+
+Strategies:
+
+- ``serial``: the plain in-process loop.
+- ``parallel``: pair scan split over worker processes (identical rows).
+- ``streaming``: serial under a MemoryBudget, rows spill to disk.
+"""
+
+import os
+from collections import Counter
+from dataclasses import asdict, dataclass
+
+from distances_engine import _effective_port_id, _normalize_id, _resolve_master_port
+from memory_budget import MemoryBudget
+
+STRATEGIES = ("auto", "serial", "parallel", "streaming")
+
+SIMPLE_SECONDS_PER_CHECK = 3e-6
+COMPLEX_SECONDS_PER_PAIR = 10e-6
+COMPLEX_SECONDS_PER_RULE = 25e-6
+ROW_BYTES = 600
+
+# Below this the process start-up and row pickling eat the gain.
+PARALLEL_MIN_SECONDS = 3.0
+PARALLEL_SECONDS_PER_WORKER = 1.5
+# Rows may use this share of physical memory before streaming kicks in.
+MEMORY_SHARE = 0.5
+
+
+@dataclass
+class AnalysisPlan:
+    mode: str
+    strategy: str
+    workers: int
+    pairs: int
+    rule_checks: int
+    estimated_seconds: float
+    estimated_row_bytes: int
+    memory_limit_bytes: int | None
+    reason: str
+
+    def describe(self) -> str:
+        workers = f" x{self.workers}" if self.strategy == "parallel" else ""
+        checks = f", {self.rule_checks:,} rule checks" if self.mode == "complex" else ""
+        limit = (
+            f" (limit {self.memory_limit_bytes / 1048576:,.0f} MB)"
+            if self.memory_limit_bytes
+            else ""
+        )
+        return (
+            f"{self.strategy}{workers}: {self.pairs:,} pairs{checks}; "
+            f"est. {self.estimated_seconds:,.1f} s, "
+            f"~{self.estimated_row_bytes / 1048576:,.0f} MB of rows{limit} "
+            f"- {self.reason}"
+        )
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+def available_cpus() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def physical_memory() -> int | None:
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def _zone_counts(port_rows, ports_by_id: dict) -> Counter:
+    """Effective (post-alias) ports per zone, one per effective id."""
+    zones = {}
+    for port in port_rows:
+        master = _resolve_master_port(port, ports_by_id)
+        zones.setdefault(
+            _effective_port_id(master), _normalize_id(master.get("region_id", ""))
+        )
+    return Counter(zones.values())
+
+
+def estimate_workload(engine, ports) -> dict:
+    """Pairs, rule checks, single-core seconds and worst-case row bytes."""
+    if engine.mode == "simple":
+        checks = len(ports.load_ports) * len(ports.disch_ports)
+        covered = 2 * len(engine.distance_pairs or ())
+        return {
+            "pairs": checks,
+            "rule_checks": 0,
+            "seconds": checks * SIMPLE_SECONDS_PER_CHECK,
+            "row_bytes": max(checks - covered, 0) * ROW_BYTES,
+        }
+    disch_zones = _zone_counts(ports.disch_ports, ports.by_id)
+    load_zones = _zone_counts(ports.load_ports, ports.by_id)
+    pairs = sum(disch_zones.values()) * sum(load_zones.values())
+    disch_zones.pop("", None)
+    load_zones.pop("", None)
+    rule_checks = 0
+    for rule in engine.rules_data or []:
+        start, end = rule["zone_start_id"], rule["zone_end_id"]
+        rule_checks += disch_zones[start] * load_zones[end]
+        if start != end:
+            rule_checks += load_zones[start] * disch_zones[end]
+    return {
+        "pairs": pairs,
+        "rule_checks": rule_checks,
+        "seconds": pairs * COMPLEX_SECONDS_PER_PAIR
+        + rule_checks * COMPLEX_SECONDS_PER_RULE,
+        "row_bytes": (pairs + rule_checks) * ROW_BYTES,
+    }
+
+
+def plan_analysis(
+    engine,
+    ports,
+    strategy: str = "auto",
+    max_workers: int | None = None,
+    memory_limit: int | None = None,
+) -> AnalysisPlan:
+    """Estimate the run and choose a strategy (``strategy`` forces one)."""
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown strategy: {strategy}")
+    estimate = estimate_workload(engine, ports)
+    if memory_limit is None:
+        physical = physical_memory()
+        memory_limit = int(physical * MEMORY_SHARE) if physical else None
+    cpus = max_workers or available_cpus()
+    if max_workers:
+        workers = max_workers
+    elif strategy == "auto":
+        # Enough workers for the estimate, at least two once parallel.
+        workers = max(
+            min(cpus, int(estimate["seconds"] / PARALLEL_SECONDS_PER_WORKER)), 2
+        )
+    else:
+        workers = cpus
+
+    if strategy != "auto":
+        reason = "requested"
+    elif memory_limit and estimate["row_bytes"] > memory_limit:
+        strategy, reason = "streaming", "rows may not fit in memory"
+    elif cpus > 1 and estimate["seconds"] >= PARALLEL_MIN_SECONDS:
+        strategy, reason = "parallel", f"long run, {cpus} CPUs"
+    elif cpus <= 1:
+        strategy, reason = "serial", "single CPU"
+    else:
+        strategy, reason = "serial", "short run"
+
+    return AnalysisPlan(
+        mode=engine.mode,
+        strategy=strategy,
+        workers=workers if strategy == "parallel" else 1,
+        pairs=estimate["pairs"],
+        rule_checks=estimate["rule_checks"],
+        estimated_seconds=round(estimate["seconds"], 3),
+        estimated_row_bytes=estimate["row_bytes"],
+        memory_limit_bytes=memory_limit,
+        reason=reason,
+    )
+
+
+def run_plan(engine, ports, plan: AnalysisPlan, progress=None) -> dict:
+    if plan.strategy == "parallel":
+        return engine.analyze(ports, progress, workers=plan.workers)
+    if plan.strategy == "streaming" and plan.memory_limit_bytes:
+        budget = MemoryBudget(plan.memory_limit_bytes)
+        budget.start()
+        try:
+            engine.enable_memory_budget(budget)
+            return engine.analyze(ports, progress)
+        finally:
+            budget.stop()
+    return engine.analyze(ports, progress)
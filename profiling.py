@@ -0,0 +1,159 @@
+"""Opt-in phase timings and hot-path counters for the analysis engines.
+
+Nothing here runs unless a Profiler is handed to an engine: instrumented
+wrappers replace the engine's hot methods on that one instance, so the
+default (unprofiled) path keeps its plain method calls.
+"""
+
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
+
+
+class Profiler:
+    def __init__(self) -> None:
+        self.phases: dict[str, float] = {}
+        self.calls: Counter = Counter()
+        self.times: defaultdict = defaultdict(float)
+        self.counters: Counter = Counter()
+        self.histograms: defaultdict = defaultdict(Counter)
+        self.events: list[dict] = []
+        self.memory: dict[str, dict] = {}
+        self._origin = time.perf_counter()
+        # Run-wide tracemalloc peak: phases reset the peak to get their own.
+        self._run_peak = 0
+
+    def _now_us(self) -> float:
+        return (time.perf_counter() - self._origin) * 1_000_000
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time a phase; also record its tracemalloc peak when tracing."""
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            start_bytes, peak = tracemalloc.get_traced_memory()
+            self._run_peak = max(self._run_peak, peak)
+            tracemalloc.reset_peak()
+        started = time.perf_counter()
+        start_us = self._now_us()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.phases[name] = self.phases.get(name, 0.0) + elapsed
+            if tracing:
+                current, peak = tracemalloc.get_traced_memory()
+                self._run_peak = max(self._run_peak, peak)
+                self.memory[name] = {
+                    "peak_bytes": peak,
+                    "retained_bytes": current - start_bytes,
+                }
+            self.events.append(
+                {
+                    "name": name,
+                    "cat": "phase",
+                    "ph": "X",
+                    "ts": round(start_us, 3),
+                    "dur": round(elapsed * 1_000_000, 3),
+                    "pid": os.getpid(),
+                    "tid": threading.get_ident(),
+                }
+            )
+
+    def peak_bytes(self) -> int:
+        """Highest traced memory of the whole run, across phase resets."""
+        if tracemalloc.is_tracing():
+            return max(self._run_peak, tracemalloc.get_traced_memory()[1])
+        return self._run_peak
+
+    def count(self, name: str, amount: int = 1) -> None:
+        self.counters[name] += amount
+
+    def observe(self, name: str, value) -> None:
+        self.histograms[name][value] += 1
+
+    def instrument(self, name: str, func):
+        """Wrap ``func`` so each call is counted and its wall time summed."""
+        calls = self.calls
+        times = self.times
+        clock = time.perf_counter
+
+        def wrapper(*args, **kwargs):
+            started = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                times[name] += clock() - started
+                calls[name] += 1
+
+        return wrapper
+
+    def report(self) -> dict:
+        report = {
+            "phases": {name: round(sec, 6) for name, sec in self.phases.items()},
+            "calls": dict(self.calls),
+            "call_seconds": {name: round(sec, 6) for name, sec in self.times.items()},
+            "counters": dict(self.counters),
+            "histograms": {
+                name: {str(key): count for key, count in sorted(values.items())}
+                for name, values in self.histograms.items()
+            },
+        }
+        if self.memory:
+            report["memory"] = dict(self.memory)
+        return report
+
+    def write_chrome_trace(self, path: str) -> None:
+        """Write phases as complete events plus final counter values."""
+        events = list(self.events)
+        end_us = round(self._now_us(), 3)
+        for name, value in self.counters.items():
+            events.append(
+                {
+                    "name": name,
+                    "cat": "counter",
+                    "ph": "C",
+                    "ts": end_us,
+                    "pid": os.getpid(),
+                    "args": {"value": value},
+                }
+            )
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(
+                {"traceEvents": events, "otherData": self.report()}, file, indent=1
+            )
+
+
+def profile_phase(profiler: "Profiler | None", name: str):
+    return profiler.phase(name) if profiler is not None else nullcontext()
+
+
+def build_profile_lines(profile: dict) -> list[str]:
+    """Tab-separated Profile section appended to the analysis tables."""
+    lines = ["", "Profile", "Metric\tValue"]
+    for name, seconds in profile.get("phases", {}).items():
+        lines.append(f"Phase {name} (s)\t{seconds:.4f}")
+    for name, count in profile.get("calls", {}).items():
+        seconds = profile.get("call_seconds", {}).get(name, 0.0)
+        lines.append(f"Calls {name}\t{count} ({seconds:.4f} s)")
+    for name, count in profile.get("counters", {}).items():
+        lines.append(f"Counter {name}\t{count}")
+    for name, values in profile.get("histograms", {}).items():
+        spread = ", ".join(f"{key}: {count}" for key, count in values.items())
+        lines.append(f"Histogram {name}\t{spread}")
+    for name, usage in profile.get("memory", {}).items():
+        lines.append(
+            f"Memory {name} (MB)\tpeak {usage['peak_bytes'] / 1048576:.1f}, "
+            f"retained {usage['retained_bytes'] / 1048576:.1f}"
+        )
+    budget = profile.get("memory_budget")
+    if budget:
+        lines.append(
+            f"Memory budget (MB)\t{budget['limit_bytes'] / 1048576:.0f} "
+            f"(peak {budget['peak_bytes'] / 1048576:.1f}, spills {budget['spills']})"
+        )
+    return lines
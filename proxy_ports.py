@@ -0,0 +1,227 @@
+"""Nearest well-covered ports as ``refer_port_id`` candidates.
+
+A port without distances is usually fixed by pointing its
+``refer_port_id`` at a nearby port that already has them. For every port
+in ``missing_ports`` (simple) or at either end of a missing segment
+(complex), this suggests the k nearest ports whose coverage reaches
+``min_coverage``. Coverage is the share of a port's possible partners it
+has a distance or segment with: in simple mode distances only join a
+load port to another port, so a discharge-only port can pair with the
+load ports and a load port with every other port; in complex mode the
+possible partners are the other ports present in the segments.
+
+Ports are placed on the unit sphere, where the straight-line (chord)
+distance orders points exactly like the great circle, and indexed in a
+3-d KD-tree: building it is O(n log n) and each query visits O(log n)
+nodes on average. scipy's cKDTree is used when it is installed.
+"""
+
+import heapq
+import math
+from collections import defaultdict
+
+from distances_engine import _effective_port_id, _normalize_id
+from great_circle import EARTH_RADIUS_NM, parse_coordinates
+
+try:
+    from scipy.spatial import cKDTree
+except Exception:
+    cKDTree = None
+
+DEFAULT_MIN_COVERAGE = 0.5
+# Leaf size below which a subtree is scanned instead of split.
+LEAF_SIZE = 8
+
+
+def _unit_vector(lat: float, lon: float) -> tuple[float, float, float]:
+    lat = math.radians(lat)
+    lon = math.radians(lon)
+    return (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat))
+
+
+def chord_to_nm(chord: float) -> float:
+    return 2 * EARTH_RADIUS_NM * math.asin(min(chord / 2, 1.0))
+
+
+class KDTree:
+    """Static 3-d KD-tree over unit vectors; ``query`` returns the k nearest
+    as ``(chord distance, point index)`` pairs, nearest first."""
+
+    def __init__(self, points: list) -> None:
+        self.points = points
+        # node: (axis, split value, left, right) or (None, indexes, None, None)
+        self.nodes = []
+        self.root = self._build(list(range(len(points)))) if points else None
+
+    def _build(self, indexes: list) -> int:
+        points = self.points
+        if len(indexes) <= LEAF_SIZE:
+            self.nodes.append((None, indexes, None, None))
+            return len(self.nodes) - 1
+        spreads = []
+        for axis in range(3):
+            values = [points[i][axis] for i in indexes]
+            spreads.append(max(values) - min(values))
+        axis = spreads.index(max(spreads))
+        indexes.sort(key=lambda i: points[i][axis])
+        middle = len(indexes) // 2
+        split = points[indexes[middle]][axis]
+        node = len(self.nodes)
+        self.nodes.append(None)
+        left = self._build(indexes[:middle])
+        right = self._build(indexes[middle:])
+        self.nodes[node] = (axis, split, left, right)
+        return node
+
+    def query(self, point, k: int, accept=None) -> list[tuple[float, int]]:
+        """k nearest points for which ``accept(index)`` is true (all if None)."""
+        if self.root is None or k <= 0:
+            return []
+        points = self.points
+        nodes = self.nodes
+        best = []  # max-heap of (-squared distance, index)
+
+        def visit(node_id: int) -> None:
+            axis, split, left, right = nodes[node_id]
+            if axis is None:
+                for i in split:
+                    if accept is not None and not accept(i):
+                        continue
+                    p = points[i]
+                    d2 = (
+                        (p[0] - point[0]) ** 2
+                        + (p[1] - point[1]) ** 2
+                        + (p[2] - point[2]) ** 2
+                    )
+                    if len(best) < k:
+                        heapq.heappush(best, (-d2, i))
+                    elif d2 < -best[0][0]:
+                        heapq.heapreplace(best, (-d2, i))
+                return
+            offset = point[axis] - split
+            near, far = (left, right) if offset < 0 else (right, left)
+            visit(near)
+            if len(best) < k or offset * offset < -best[0][0]:
+                visit(far)
+
+        visit(self.root)
+        return sorted((math.sqrt(-d2), i) for d2, i in best)
+
+
+def port_coverage(engine) -> dict[str, int]:
+    """Distinct partner ports per port id in the engine's distances (simple)
+    or segments (complex)."""
+    partners = defaultdict(set)
+    if engine.mode == "simple":
+        for first, second in engine.distance_pairs or ():
+            if first != second:
+                partners[first].add(second)
+                partners[second].add(first)
+    elif hasattr(engine.segments_data, "columns"):
+        port_ids, from_col, to_col = engine.segments_data.columns()[:3]
+        for from_idx, to_idx in zip(from_col, to_col):
+            if from_idx != to_idx:
+                partners[port_ids[from_idx]].add(port_ids[to_idx])
+                partners[port_ids[to_idx]].add(port_ids[from_idx])
+    else:
+        for key in engine.segments_data or ():
+            from_id, _, to_id = key.partition(":")
+            if from_id != to_id:
+                partners[from_id].add(to_id)
+                partners[to_id].add(from_id)
+    return {port_id: len(others) for port_id, others in partners.items()}
+
+
+def possible_partners(engine, ports, degrees: dict):
+    """``eff id -> number of ports it could have a distance / segment with``."""
+    if engine.mode == "simple":
+        load_effs = {_effective_port_id(row) for row in ports.load_ports}
+        every = len(ports.by_effective_id)
+        return lambda eff: every - 1 if eff in load_effs else len(load_effs)
+    segment_ports = len(degrees)
+    return lambda eff: segment_ports - 1
+
+
+def proxy_targets(result: dict) -> list[str]:
+    """Ports to find a proxy for, in first-seen order."""
+    if "missing_ports" in result:
+        return list(result["missing_ports"])
+    targets = {}
+    for row in result.get("missing_segments", ()):
+        targets.setdefault(row["from_id"], None)
+        targets.setdefault(row["to_id"], None)
+    return list(targets)
+
+
+def suggest_proxies(
+    result: dict,
+    ports,
+    engine,
+    k: int = 3,
+    min_coverage: float = DEFAULT_MIN_COVERAGE,
+) -> dict:
+    """Add a ``proxy_suggestions`` section (k rows per target port) and
+    ``proxy_targets`` / ``proxy_candidates`` counts to the summary."""
+    degrees = port_coverage(engine)
+    possible = possible_partners(engine, ports, degrees)
+
+    # One candidate per effective id: the master row, with its coordinates.
+    candidates = []
+    for eff, row in ports.by_effective_id.items():
+        master = ports.by_id.get(eff, row)
+        point = parse_coordinates(master.get("coordinates")) or parse_coordinates(
+            row.get("coordinates")
+        )
+        coverage = min(degrees.get(eff, 0) / max(possible(eff), 1), 1.0)
+        if point is not None and coverage >= min_coverage:
+            candidates.append((eff, master.get("port", ""), coverage, point))
+    vectors = [_unit_vector(*point) for _, _, _, point in candidates]
+
+    targets = proxy_targets(result)
+    rows = []
+    without_coordinates = 0
+    if cKDTree is not None and candidates:
+        tree = cKDTree(vectors)
+    else:
+        tree = KDTree(vectors)
+    index_by_eff = {candidate[0]: idx for idx, candidate in enumerate(candidates)}
+    for target_id in targets:
+        target = ports.by_id.get(_normalize_id(target_id))
+        point = parse_coordinates(target.get("coordinates")) if target else None
+        if point is None:
+            without_coordinates += 1
+            continue
+        own = index_by_eff.get(_effective_port_id(target))
+        vector = _unit_vector(*point)
+        if isinstance(tree, KDTree):
+            found = tree.query(vector, k, None if own is None else own.__ne__)
+        else:
+            # One extra neighbour, dropped below if it is the port itself.
+            count = min(k + 1, len(candidates))
+            distances, indexes = tree.query(vector, count)
+            if count == 1:
+                distances, indexes = [distances], [indexes]
+            found = [
+                (float(chord), int(idx))
+                for chord, idx in zip(distances, indexes)
+                if idx != own
+            ][:k]
+        for rank, (chord, idx) in enumerate(found, start=1):
+            eff, name, coverage, _ = candidates[idx]
+            rows.append(
+                {
+                    "port_id": target_id,
+                    "port_name": target.get("port", ""),
+                    "rank": rank,
+                    "suggested_id": eff,
+                    "suggested_name": name,
+                    "great_circle_nm": round(chord_to_nm(chord), 1),
+                    "coverage": round(coverage, 3),
+                }
+            )
+
+    result["summary"]["proxy_targets"] = len(targets)
+    result["summary"]["proxy_candidates"] = len(candidates)
+    result["summary"]["proxy_targets_without_coordinates"] = without_coordinates
+    result["proxy_suggestions"] = rows
+    return result
@@ -0,0 +1,338 @@
+"""Local HTTP/JSON query service over the loaded distance indexes.
+
+The ports, distance pairs, rules and segments are parsed once into a
+DistanceIndex and kept hot; each query only resolves aliases, probes the
+pair set and walks the matching rules' legs. A watcher thread polls the
+input files and, once a changed file has kept the same size and mtime for
+one poll interval, builds a complete new index next to the old one and
+swaps the reference. Every request reads that reference once, so a batch
+is always answered from a single generation and a failed reload keeps
+the previous index serving.
+
+Endpoints (JSON responses):
+
+- ``GET /health``: generation, load time, input sizes, last reload error.
+- ``GET /pair?disch=ID&load=ID``: one pair.
+- ``POST /pairs`` with ``{"pairs": [{"disch": ID, "load": ID}, ...]}``.
+- ``POST /reload``: reload now, whether or not the files changed.
+"""
+
+import http.client
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from distances_engine import (
+    ComplexDistanceEngine,
+    SimpleDistanceEngine,
+    _effective_port_id,
+    _normalize_id,
+    load_distance_pairs,
+    load_segments,
+    read_rules_csv,
+)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_POLL_SECONDS = 2.0
+MAX_BATCH_PAIRS = 100_000
+INPUT_NAMES = ("ports", "distances", "rules", "segments")
+
+
+def _stat_signature(paths: dict) -> dict:
+    signature = {}
+    for name, path in paths.items():
+        try:
+            stat = os.stat(path)
+        except OSError:
+            signature[name] = None
+        else:
+            signature[name] = (stat.st_size, stat.st_mtime_ns)
+    return signature
+
+
+class DistanceIndex:
+    """One generation of the input files, parsed and indexed for queries."""
+
+    def __init__(
+        self, paths: dict, include_inactive: bool = False, generation: int = 1
+    ) -> None:
+        self.paths = {name: paths[name] for name in INPUT_NAMES if paths.get(name)}
+        if "ports" not in self.paths:
+            raise ValueError("A ports CSV is required.")
+        if ("rules" in self.paths) != ("segments" in self.paths):
+            raise ValueError("Rules and segments CSVs go together.")
+        if "distances" not in self.paths and "rules" not in self.paths:
+            raise ValueError("Give a distances CSV, rules and segments CSVs, or both.")
+        self.signature = _stat_signature(self.paths)
+        self.include_inactive = include_inactive
+        self.generation = generation
+
+        self.simple = None
+        self.complex = None
+        if "distances" in self.paths:
+            self.simple = SimpleDistanceEngine(
+                *load_distance_pairs(self.paths["distances"])
+            )
+        if "rules" in self.paths:
+            segments, segments_rows = load_segments(self.paths["segments"])
+            self.complex = ComplexDistanceEngine(
+                read_rules_csv(self.paths["rules"]), segments, segments_rows
+            )
+            self.complex.prepare_segment_matrix()
+        engine = self.complex or self.simple
+        self.ports = engine.read_ports(self.paths["ports"], include_inactive)
+        self.loaded_at = time.time()
+
+    def describe(self) -> dict:
+        info = {
+            "ports": len(self.ports.by_id),
+            "loaded_at": time.strftime(
+                "%Y-%m-%dT%H:%M:%S", time.localtime(self.loaded_at)
+            ),
+        }
+        if self.simple is not None:
+            info["distances"] = len(self.simple.distance_pairs)
+        if self.complex is not None:
+            info["rules"] = len(self.complex.rules_data)
+            info["segments"] = self.complex.segments_rows
+        return info
+
+    def query(self, disch_id, load_id) -> dict:
+        """Coverage of one disch -> load pair, by the loaded engine(s)."""
+        by_id = self.ports.by_id
+        disch_id = _normalize_id(disch_id)
+        load_id = _normalize_id(load_id)
+        answer = {"disch_id": disch_id, "load_id": load_id}
+        unknown = [port_id for port_id in (disch_id, load_id) if port_id not in by_id]
+        if unknown:
+            answer["error"] = f"Unknown port id: {', '.join(unknown)}"
+            return answer
+        disch_port = by_id[disch_id]
+        load_port = by_id[load_id]
+
+        if self.simple is not None:
+            load_eff = _effective_port_id(load_port)
+            disch_eff = _effective_port_id(disch_port)
+            pairs = self.simple.distance_pairs
+            if load_eff == disch_eff:
+                reason = "same_port"
+            elif (load_eff, disch_eff) in pairs or (disch_eff, load_eff) in pairs:
+                reason = "found"
+            else:
+                reason = "missing"
+            answer["simple"] = {"covered": reason != "missing", "reason": reason}
+        if self.complex is not None:
+            answer["complex"] = self.complex.explain_pair(disch_port, load_port, by_id)
+        return answer
+
+
+class QueryService:
+    """Holds the current DistanceIndex and swaps in reloaded ones."""
+
+    def __init__(
+        self,
+        paths: dict,
+        include_inactive: bool = False,
+        poll_seconds: float = DEFAULT_POLL_SECONDS,
+    ) -> None:
+        self.paths = paths
+        self.include_inactive = include_inactive
+        self.poll_seconds = poll_seconds
+        self.index = DistanceIndex(paths, include_inactive)
+        self.last_error = ""
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._seen = self.index.signature
+        self._pending = None
+
+    def reload(self) -> bool:
+        """Build a new index and swap it in; keep the old one on failure."""
+        with self._reload_lock:
+            try:
+                index = DistanceIndex(
+                    self.paths, self.include_inactive, self.index.generation + 1
+                )
+            except Exception as exc:
+                # Any parse failure (csv.Error, ...) keeps the old index.
+                self.last_error = str(exc)
+                return False
+            self.index = index
+            self.last_error = ""
+            self._seen = index.signature
+            return True
+
+    def poll(self) -> bool:
+        """Reload once changed files have settled for one poll interval."""
+        signature = _stat_signature(self.index.paths)
+        if signature == self._seen:
+            self._pending = None
+            return False
+        if signature != self._pending:
+            self._pending = signature
+            return False
+        # A failed reload is retried on the next change, not every poll.
+        self._pending = None
+        self._seen = signature
+        return self.reload()
+
+    def watch(self) -> threading.Thread:
+        def run() -> None:
+            while not self._stop.wait(self.poll_seconds):
+                # One failed poll must not end the watcher.
+                try:
+                    self.poll()
+                except Exception as exc:
+                    self.last_error = str(exc)
+
+        thread = threading.Thread(target=run, name="distances-reload", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def health(self) -> dict:
+        index = self.index
+        return {
+            "status": "ok",
+            "generation": index.generation,
+            "last_error": self.last_error,
+            **index.describe(),
+        }
+
+    def query_pairs(self, pairs: list) -> dict:
+        if not isinstance(pairs, list):
+            raise ValueError('"pairs" must be a list.')
+        if len(pairs) > MAX_BATCH_PAIRS:
+            raise ValueError(f"At most {MAX_BATCH_PAIRS} pairs per request.")
+        index = self.index
+        results = []
+        for pair in pairs:
+            if not isinstance(pair, dict) or "disch" not in pair or "load" not in pair:
+                raise ValueError('Each pair needs "disch" and "load" ids.')
+            results.append(index.query(pair["disch"], pair["load"]))
+        return {"generation": index.generation, "results": results}
+
+
+class _QueryHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "DistancesQuery/1"
+    # Headers and body go out in two writes; Nagle would hold the second
+    # one for the client's delayed ACK (~40 ms per keep-alive request).
+    disable_nagle_algorithm = True
+
+    @property
+    def service(self) -> QueryService:
+        return self.server.service
+
+    def log_message(self, format, *args) -> None:
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> dict:
+        header = self.headers.get("Content-Length") or "0"
+        if not (header.isascii() and header.isdigit()):
+            # The body cannot be delimited: answer, then drop the connection.
+            self.close_connection = True
+            raise ValueError(f"Invalid Content-Length header: {header!r}")
+        length = int(header)
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError as exc:
+            raise ValueError(f"Invalid JSON body: {exc}") from exc
+        if not isinstance(payload, dict):
+            raise ValueError("The JSON body must be an object.")
+        return payload
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        if url.path == "/health":
+            self._send(200, self.service.health())
+        elif url.path == "/pair":
+            params = parse_qs(url.query)
+            if "disch" not in params or "load" not in params:
+                self._send(400, {"error": "Query needs disch= and load= ids."})
+                return
+            answer = self.service.index.query(params["disch"][0], params["load"][0])
+            self._send(404 if "error" in answer else 200, answer)
+        else:
+            self._send(404, {"error": f"Unknown path: {url.path}"})
+
+    def do_POST(self) -> None:
+        url = urlparse(self.path)
+        try:
+            payload = self._read_json()
+            if url.path == "/pairs":
+                self._send(200, self.service.query_pairs(payload.get("pairs")))
+            elif url.path == "/reload":
+                reloaded = self.service.reload()
+                self._send(200 if reloaded else 500, self.service.health())
+            else:
+                self._send(404, {"error": f"Unknown path: {url.path}"})
+        except ValueError as exc:
+            self._send(400, {"error": str(exc)})
+
+
+def make_server(
+    service: QueryService,
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    verbose: bool = False,
+) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), _QueryHandler)
+    server.daemon_threads = True
+    server.service = service
+    server.verbose = verbose
+    return server
+
+
+class QueryClient:
+    """Minimal client over one keep-alive connection (not thread-safe)."""
+
+    def __init__(self, url: str = f"http://{DEFAULT_HOST}:{DEFAULT_PORT}") -> None:
+        parsed = urlparse(url)
+        self._connection = http.client.HTTPConnection(
+            parsed.hostname or DEFAULT_HOST, parsed.port or DEFAULT_PORT, timeout=30
+        )
+
+    def _request(self, method: str, path: str, payload: dict | None = None) -> dict:
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        self._connection.request(method, path, body, headers)
+        response = self._connection.getresponse()
+        answer = json.loads(response.read())
+        if response.status >= 400 and "error" in answer and "results" not in answer:
+            raise ValueError(answer["error"])
+        return answer
+
+    def health(self) -> dict:
+        return self._request("GET", "/health")
+
+    def pair(self, disch_id: str, load_id: str) -> dict:
+        query = urlencode({"disch": disch_id, "load": load_id})
+        return self._request("GET", f"/pair?{query}")
+
+    def pairs(self, pairs: list[tuple[str, str]]) -> dict:
+        return self._request(
+            "POST",
+            "/pairs",
+            {"pairs": [{"disch": disch, "load": load} for disch, load in pairs]},
+        )
+
+    def reload(self) -> dict:
+        return self._request("POST", "/reload", {})
+
+    def close(self) -> None:
+        self._connection.close()
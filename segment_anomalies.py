@@ -0,0 +1,183 @@
+"""Bulk sanity scan of the ARW segments: suspect rows ranked by severity.
+
+Two checks over the columnar segment data (numpy required):
+
+- ``below_great_circle``: a segment shorter than the great circle between
+  its ports' coordinates (beyond ``GC_TOLERANCE`` for rounded
+  coordinates) cannot be a sea route.
+- ``triangle``: a segment A-C longer than ``ratio`` x (A-B + B-C) through
+  some midpoint B. Midpoints are the ``midpoints`` best connected ports
+  (0 = every port): one dense row of distances per midpoint, and each
+  midpoint costs one vectorized pass over all segments, so the full scan
+  is O(segments x ports) and the sampled one O(segments x midpoints).
+
+Every row is checked on its own. Legs through a midpoint are looked up
+like the engine does: B-X is the ``B:X`` row, else the ``X:B`` row.
+Severity is bound / distance for the first check and distance / via
+distance for the second; both are > 1.
+"""
+
+import math
+
+from great_circle import PortCoordinates, haversine_nm
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+DEFAULT_MIDPOINTS = 64
+DEFAULT_RATIO = 1.25
+GC_TOLERANCE = 0.02
+ANOMALY_COLUMNS = [
+    "from_id",
+    "to_id",
+    "check",
+    "total_distance",
+    "bound",
+    "via_id",
+    "severity",
+]
+
+
+def _segment_columns(segments) -> tuple:
+    """``(port_ids, from index, to index, total)`` arrays of a segments store."""
+    if hasattr(segments, "columns"):
+        port_ids, from_col, to_col, totals = segments.columns()[:4]
+        return (
+            list(port_ids),
+            np.asarray(from_col, dtype=np.int64),
+            np.asarray(to_col, dtype=np.int64),
+            np.asarray(totals, dtype=np.float64),
+        )
+    index = {}
+    from_idx = []
+    to_idx = []
+    totals = []
+    for key, segment in segments.items():
+        from_id, _, to_id = key.partition(":")
+        from_idx.append(index.setdefault(from_id, len(index)))
+        to_idx.append(index.setdefault(to_id, len(index)))
+        totals.append(segment["totalDistance"])
+    return (
+        list(index),
+        np.asarray(from_idx, dtype=np.int64),
+        np.asarray(to_idx, dtype=np.int64),
+        np.asarray(totals, dtype=np.float64),
+    )
+
+
+def _checkable(from_idx, to_idx, totals):
+    """Rows between two different ports with a positive distance."""
+    valid = (from_idx != to_idx) & np.isfinite(totals) & (totals > 0)
+    return from_idx[valid], to_idx[valid], totals[valid]
+
+
+def _great_circle_rows(port_ids, from_idx, to_idx, totals, ports) -> list:
+    coordinates = PortCoordinates(ports)
+    # Segment port index -> coordinate index (-1: not in the ports file).
+    lookup = np.asarray(
+        [coordinates.index.get(port_id, -1) for port_id in port_ids], dtype=np.int64
+    )
+    lats = np.append(np.asarray(coordinates.lats), math.nan)
+    lons = np.append(np.asarray(coordinates.lons), math.nan)
+    a = lookup[from_idx]
+    b = lookup[to_idx]
+    with np.errstate(invalid="ignore"):
+        bounds = haversine_nm(lats[a], lons[a], lats[b], lons[b])
+        suspect = np.flatnonzero(totals < bounds * (1 - GC_TOLERANCE))
+    return [
+        {
+            "from_id": port_ids[from_idx[i]],
+            "to_id": port_ids[to_idx[i]],
+            "check": "below_great_circle",
+            "total_distance": round(float(totals[i]), 3),
+            "bound": round(float(bounds[i]), 1),
+            "via_id": "",
+            "severity": round(float(bounds[i] / totals[i]), 3),
+        }
+        for i in suspect.tolist()
+    ]
+
+
+def _triangle_rows(port_ids, from_idx, to_idx, totals, midpoints, ratio) -> list:
+    ports_count = len(port_ids)
+    degree = np.bincount(from_idx, minlength=ports_count) + np.bincount(
+        to_idx, minlength=ports_count
+    )
+    order = np.argsort(-degree, kind="stable")
+    hubs = order if not midpoints else order[:midpoints]
+    hubs = hubs[degree[hubs] >= 2]
+
+    # Rows grouped by from / to port, so a midpoint's legs are two slices.
+    by_from = np.argsort(from_idx, kind="stable")
+    by_to = np.argsort(to_idx, kind="stable")
+    bounds = np.arange(ports_count + 1)
+    from_starts = np.searchsorted(from_idx[by_from], bounds)
+    to_starts = np.searchsorted(to_idx[by_to], bounds)
+
+    best_via = np.full(len(totals), np.inf)
+    best_hub = np.full(len(totals), -1, dtype=np.int64)
+    row = np.empty(ports_count)
+    for hub in hubs.tolist():
+        # Distances from this midpoint to every port (inf = no segment);
+        # the hub:port rows are written last so they win over port:hub.
+        row.fill(np.inf)
+        backward = by_to[to_starts[hub] : to_starts[hub + 1]]
+        row[from_idx[backward]] = totals[backward]
+        forward = by_from[from_starts[hub] : from_starts[hub + 1]]
+        row[to_idx[forward]] = totals[forward]
+        via = row[from_idx] + row[to_idx]
+        better = via < best_via
+        best_via[better] = via[better]
+        best_hub[better] = hub
+
+    suspect = np.flatnonzero(totals > ratio * best_via)
+    return [
+        {
+            "from_id": port_ids[from_idx[i]],
+            "to_id": port_ids[to_idx[i]],
+            "check": "triangle",
+            "total_distance": round(float(totals[i]), 3),
+            "bound": round(float(best_via[i]), 3),
+            "via_id": port_ids[best_hub[i]],
+            "severity": round(float(totals[i] / best_via[i]), 3),
+        }
+        for i in suspect.tolist()
+    ]
+
+
+def add_segment_anomalies(
+    result: dict,
+    segments,
+    ports=None,
+    midpoints: int = DEFAULT_MIDPOINTS,
+    ratio: float = DEFAULT_RATIO,
+) -> dict:
+    """Add a ``segment_anomalies`` section (most severe first) and per-check
+    counts to the summary of ``result``.
+
+    The great-circle check needs ``ports`` (a PortsData with coordinates);
+    without it only the triangle check runs.
+    """
+    if np is None:
+        raise RuntimeError(
+            "The segment anomaly scan requires numpy (pip install numpy)."
+        )
+    port_ids, from_idx, to_idx, totals = _segment_columns(segments)
+    from_idx, to_idx, totals = _checkable(from_idx, to_idx, totals)
+
+    rows = []
+    if ports is not None:
+        rows.extend(_great_circle_rows(port_ids, from_idx, to_idx, totals, ports))
+    below = len(rows)
+    rows.extend(_triangle_rows(port_ids, from_idx, to_idx, totals, midpoints, ratio))
+    rows.sort(key=lambda row: -row["severity"])
+
+    summary = result["summary"]
+    summary["anomaly_segments_checked"] = len(totals)
+    summary["anomaly_midpoints"] = min(midpoints or len(port_ids), len(port_ids))
+    summary["anomalies_below_great_circle"] = below
+    summary["anomalies_triangle"] = len(rows) - below
+    result["segment_anomalies"] = rows
+    return result
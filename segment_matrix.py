@@ -0,0 +1,170 @@
+"""Dense segment matrix for the hub / waypoint ports of the complex engine.
+
+Rule waypoints are hubs: they have segments to a large share of all ports,
+so one row per hub over every port in the segments table is mostly filled.
+Each hub row stores both directions (hub -> port and port -> hub) as
+float32 distances (NaN = no segment), float32 SECA distances and a uint16
+flag mask whose top bit marks a present segment (so a "nan" distance in
+the CSV still counts as a segment), in flat ``array`` buffers indexed by
+interned port index.
+
+Any leg touching a hub row is answered from the matrix, hit or miss,
+without building ``"from:to"`` keys or probing the hash table; other legs
+keep the hash lookup. Rows are chosen by density: only ports whose
+segments cover at least ``min_density`` of all ports get one, and the
+matrix never grows past ``max_bytes``.
+
+Distances are float32: the analysis only needs segment presence, and
+three-decimal CSV values still round back exactly below 16 000 nm.
+"""
+
+import math
+from array import array
+from collections import Counter
+
+DENSE_MIN_DENSITY = 0.25
+MAX_MATRIX_BYTES = 128 * 1024 * 1024
+# forward + backward x (float32 total, float32 seca, uint16 flags)
+CELL_BYTES = 2 * (4 + 4 + 2)
+PRESENT_BIT = 1 << 15
+# lookup() result for legs the matrix has no row for.
+UNCOVERED = object()
+
+
+class SegmentMatrix:
+    def __init__(
+        self, row_ids: list[str], column_ids: list[str], flag_names: list[str]
+    ) -> None:
+        if len(flag_names) > 15:
+            raise ValueError("SegmentMatrix holds at most 15 segment flags.")
+        self.rows = {port_id: idx for idx, port_id in enumerate(row_ids)}
+        self.columns = {port_id: idx for idx, port_id in enumerate(column_ids)}
+        self.flag_names = list(flag_names)
+        self._flag_dicts: dict[int, dict] = {}
+        self.width = len(column_ids)
+        size = len(row_ids) * self.width
+        self._total = (array("f", [math.nan]) * size, array("f", [math.nan]) * size)
+        self._seca = (array("f", bytes(4 * size)), array("f", bytes(4 * size)))
+        self._flags = (array("H", bytes(2 * size)), array("H", bytes(2 * size)))
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.rows) * self.width * CELL_BYTES
+
+    def _flag_bits(self, segment: dict) -> int:
+        bits = 0
+        for bit, name in enumerate(self.flag_names):
+            if segment[name]:
+                bits |= 1 << bit
+        return bits
+
+    def store(self, direction: int, cell: int, total: float, seca: float, bits: int):
+        self._total[direction][cell] = total
+        self._seca[direction][cell] = seca
+        self._flags[direction][cell] = bits | PRESENT_BIT
+
+    def add(self, from_id: str, to_id: str, segment: dict) -> None:
+        total = segment["totalDistance"]
+        seca = segment["secaDistance"]
+        bits = self._flag_bits(segment)
+        row = self.rows.get(from_id)
+        if row is not None:
+            self.store(0, row * self.width + self.columns[to_id], total, seca, bits)
+        row = self.rows.get(to_id)
+        if row is not None:
+            self.store(1, row * self.width + self.columns[from_id], total, seca, bits)
+
+    def _decode(self, direction: int, cell: int) -> dict | None:
+        bits = self._flags[direction][cell]
+        if not bits & PRESENT_BIT:
+            return None
+        flags = self._flag_dicts.get(bits)
+        if flags is None:
+            flags = self._flag_dicts[bits] = {
+                name: bool(bits >> bit & 1) for bit, name in enumerate(self.flag_names)
+            }
+        return {
+            "totalDistance": self._total[direction][cell],
+            "secaDistance": self._seca[direction][cell],
+            **flags,
+        }
+
+    def lookup(self, from_id: str, to_id: str):
+        """``from -> to`` else ``to -> from`` segment, None when neither
+        exists, or UNCOVERED when no hub row decides this leg."""
+        row = self.rows.get(from_id)
+        if row is not None:
+            column = self.columns.get(to_id)
+            direct = 0
+        else:
+            row = self.rows.get(to_id)
+            if row is None:
+                return UNCOVERED
+            column = self.columns.get(from_id)
+            direct = 1
+        if column is None:
+            return None
+        cell = row * self.width + column
+        return self._decode(direct, cell) or self._decode(1 - direct, cell)
+
+
+def _dense_rows(degree: Counter, width: int, min_density: float, max_bytes: int):
+    """Ports by descending degree that reach ``min_density``, within the cap."""
+    row_budget = max_bytes // max(width * CELL_BYTES, 1)
+    return [
+        port for port, count in degree.most_common() if count / width >= min_density
+    ][:row_budget]
+
+
+def _build_from_columns(columns, min_density: float, max_bytes: int):
+    """Fill straight from a mapped store's index and value columns."""
+    port_ids, from_col, to_col, totals, secas, flags, flag_names = columns
+    degree = Counter(from_col)
+    degree.update(to_col)
+    hubs = _dense_rows(degree, len(port_ids), min_density, max_bytes)
+    if not hubs:
+        return None
+    matrix = SegmentMatrix([port_ids[idx] for idx in hubs], port_ids, flag_names)
+    hub_rows = {idx: row for row, idx in enumerate(hubs)}
+    width = matrix.width
+    for idx, (from_idx, to_idx) in enumerate(zip(from_col, to_col)):
+        row = hub_rows.get(from_idx)
+        if row is not None:
+            matrix.store(0, row * width + to_idx, totals[idx], secas[idx], flags[idx])
+        row = hub_rows.get(to_idx)
+        if row is not None:
+            matrix.store(1, row * width + from_idx, totals[idx], secas[idx], flags[idx])
+    return matrix
+
+
+def build_segment_matrix(
+    segments,
+    flag_names: list[str],
+    min_density: float = DENSE_MIN_DENSITY,
+    max_bytes: int = MAX_MATRIX_BYTES,
+) -> SegmentMatrix | None:
+    """Matrix over the dense rows of ``segments``; None when no port qualifies."""
+    if hasattr(segments, "columns") and list(segments.columns()[6]) == list(flag_names):
+        return _build_from_columns(segments.columns(), min_density, max_bytes)
+
+    pairs = []
+    degree = Counter()
+    for key in segments:
+        from_id, _, to_id = key.partition(":")
+        pairs.append((key, from_id, to_id))
+        degree[from_id] += 1
+        degree[to_id] += 1
+    if not degree:
+        return None
+
+    column_ids = list(degree)
+    row_ids = _dense_rows(degree, len(column_ids), min_density, max_bytes)
+    if not row_ids:
+        return None
+
+    matrix = SegmentMatrix(row_ids, column_ids, flag_names)
+    rows = matrix.rows
+    for key, from_id, to_id in pairs:
+        if from_id in rows or to_id in rows:
+            matrix.add(from_id, to_id, segments[key])
+    return matrix
@@ -1,96 +1,31 @@
-import csv
 import os
 import threading
 import tkinter as tk
 import tkinter.filedialog  # Ensures PyInstaller bundles submodules
 import tkinter.messagebox  # Ensures PyInstaller bundles submodules
 import tkinter.ttk  # Ensures PyInstaller bundles submodules
-from dataclasses import dataclass
 from tkinter import filedialog, messagebox, ttk
 
+from analysis_cache import ResultCache, cached_analysis, file_fingerprint
+from distances_engine import (
+    DIST_COLUMNS,
+    PORT_COLUMNS,
+    PortsData,
+    SimpleDistanceEngine,
+    build_simple_output_table,
+    load_distance_pairs,
+)
+from heatmap_window import RegionHeatmapWindow
+from memory_budget import MemoryBudget
+from planner import plan_analysis, run_plan
+from profiling import Profiler, profile_phase
+
 try:
     from tkinterdnd2 import DND_FILES, TkinterDnD
 except Exception:
     DND_FILES = None
     TkinterDnD = None
 
-PORT_COLUMNS = [
-    "id",
-    "port",
-    "load",
-    "mgo_at_port",
-    "is_archived",
-    "region_id",
-    "port_country_id",
-    "port_code",
-    "port_type",
-    "is_active_port",
-    "coordinates",
-    "port_nickname",
-    "refer_port_id",
-]
-
-DIST_COLUMNS = [
-    "id",
-    "load_port_id",
-    "disch_port_id",
-    "total_distance",
-    "total_seca_distance",
-    "by_panama_canal_rp",
-    "by_gibraltar_strait_rp",
-    "by_cape_good_hope_rp",
-    "by_magellan_strait_rp",
-    "by_cape_horn_rp",
-    "by_singapore_strait_rp",
-    "by_torres_strait_rp",
-    "by_vitiaz_strait_rp",
-    "by_malacca_strait_rp",
-    "by_kiel_canal_rp",
-    "by_skaw_area_rp",
-    "by_suez_canal_rp",
-    "by_gulf_of_aden_rp",
-    "by_sunda_strait_rp",
-    "discount_suez_ballast",
-    "complete_distance_priority",
-    "by_bosporus_strait_rp",
-]
-
-
-def _as_bool(value: str) -> bool:
-    return str(value).strip().lower() in {"true", "1", "yes", "y", "t"}
-
-
-def _normalize_id(value: object) -> str:
-    if value is None:
-        return ""
-    raw = str(value).strip()
-    if raw == "":
-        return ""
-    try:
-        num = float(raw)
-        if num.is_integer():
-            return str(int(num))
-        return str(num)
-    except ValueError:
-        return raw
-
-
-def _effective_port_id(port: dict) -> str:
-    """ID to use for distance lookup: refer_port_id if set, else port id."""
-    ref = _normalize_id(port.get("refer_port_id", ""))
-    if ref:
-        return ref
-    return _normalize_id(port.get("id", ""))
-
-
-@dataclass
-class PortsData:
-    rows: list
-    load_ports: list
-    disch_ports: list
-    by_id: dict
-    by_effective_id: dict
-
 
 class DistanceAnalyzerApp:
     def __init__(self, root: tk.Tk) -> None:
@@ -103,6 +38,8 @@ class DistanceAnalyzerApp:
         self.ports_data: PortsData | None = None
         self.distance_pairs: set[tuple[str, str]] | None = None
         self.distance_rows = 0
+        self.distances_fingerprint = ""
+        self.result_cache = ResultCache()
 
         self.analysis_result = None
         self.analysis_thread = None
@@ -189,6 +126,19 @@ class DistanceAnalyzerApp:
         )
         inactive_chk.pack(side="left", padx=12)
 
+        self.profile_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            top,
+            text="Profile analysis (phase timings & counters)",
+            variable=self.profile_var,
+        ).pack(side="left", padx=12)
+
+        self.memory_budget_var = tk.StringVar(value="0")
+        ttk.Label(top, text="Memory budget MB (0 = off)").pack(side="left")
+        ttk.Entry(top, textvariable=self.memory_budget_var, width=7).pack(
+            side="left", padx=(4, 0)
+        )
+
         files = ttk.LabelFrame(self.root, text="CSV Inputs", padding=12)
         files.pack(fill="x", padx=12, pady=(0, 12))
 
@@ -233,6 +183,13 @@ class DistanceAnalyzerApp:
         )
         self.reset_btn.pack(side="left", padx=8)
 
+        ttk.Button(
+            actions, text="Region heatmap", command=self.show_region_heatmap
+        ).pack(side="left")
+
+        self.plan_status = tk.StringVar(value="")
+        ttk.Label(actions, textvariable=self.plan_status).pack(side="left", padx=12)
+
         self.progress = ttk.Progressbar(
             self.root, mode="determinate", maximum=100
         )
@@ -323,6 +280,7 @@ class DistanceAnalyzerApp:
     def _load_distances_from_path(self, path: str) -> None:
         try:
             self.distance_pairs, self.distance_rows = self._read_distances_csv(path)
+            self.distances_fingerprint = file_fingerprint(path)
         except Exception as exc:
             messagebox.showerror("Distances CSV Error", str(exc))
             return
@@ -343,16 +301,35 @@ class DistanceAnalyzerApp:
         self.distances_csv_path = None
         self.distance_pairs = None
         self.distance_rows = 0
+        self.distances_fingerprint = ""
         self.dist_status.set("Complete Distances CSV: not loaded")
         self.reset_analysis()
 
     def reset_analysis(self) -> None:
         self.analysis_result = None
+        self.plan_status.set("")
         self.output_text.delete("1.0", "end")
         self._set_result_buttons_state(enabled=False)
         self.progress.pack_forget()
         self.progress["value"] = 0
 
+    def show_region_heatmap(self) -> None:
+        if not self.ports_data or not self.distance_pairs:
+            messagebox.showwarning(
+                "Missing CSVs",
+                "Please load both the Ports CSV and Complete Distances CSV first.",
+            )
+            return
+        engine = SimpleDistanceEngine(self.distance_pairs or set(), self.distance_rows)
+        try:
+            result = engine.region_coverage(self._read_ports_csv(self.ports_csv_path))
+        except Exception as exc:
+            messagebox.showerror("Region Heatmap Error", str(exc))
+            return
+        RegionHeatmapWindow(
+            self.root, result, "Region coverage: found / missing distances"
+        )
+
     def start_analysis(self) -> None:
         if not self.ports_data or not self.distance_pairs:
             messagebox.showwarning(
@@ -392,36 +369,7 @@ class DistanceAnalyzerApp:
         self._set_result_buttons_state(enabled=True)
 
     def _build_output_table(self, result: dict) -> str:
-        summary = result["summary"]
-        missing = result["missing"]
-
-        lines = []
-        lines.append("Summary")
-        lines.append("Metric\tValue")
-        lines.append(f"Total ports CSV rows\t{summary['total_ports_rows']}")
-        lines.append(f"Total load ports\t{summary['total_load_ports']}")
-        lines.append(f"Total disch ports\t{summary['total_disch_ports']}")
-        lines.append(f"Total distance CSV rows\t{summary['total_distance_rows']}")
-        lines.append(f"Total distances (pairs)\t{summary['total_distances']}")
-        lines.append(f"Number of distances found\t{summary['found']}")
-        lines.append(f"Number of distances missing\t{summary['missing']}")
-        lines.append(
-            "Number of missing ports from distances\t"
-            f"{summary['missing_ports_count']}"
-        )
-        lines.append("")
-        lines.append("Missing distances")
-        lines.append("Load port name\tLoad port id\tDisch port name\tDisch port id")
-        for row in missing:
-            lines.append(
-                f"{row['load_name']}\t{row['load_id']}\t{row['disch_name']}\t{row['disch_id']}"
-            )
-        lines.append("")
-        lines.append("Missing ports from distances")
-        lines.append("Port id")
-        for port_id in result["missing_ports"]:
-            lines.append(port_id)
-        return "\n".join(lines)
+        return build_simple_output_table(result)
 
     def copy_output(self) -> None:
         if not self.analysis_result:
@@ -447,141 +395,64 @@ class DistanceAnalyzerApp:
         messagebox.showinfo("Saved", f"Saved analysis to {path}")
 
     def _read_ports_csv(self, path: str) -> PortsData:
-        with open(path, newline="", encoding="utf-8-sig") as file:
-            reader = csv.DictReader(file)
-            self._validate_headers(reader.fieldnames, PORT_COLUMNS, "Ports CSV")
-            rows = list(reader)
-
-        load_ports = []
-        disch_ports = []
-        by_id = {}
-        include_inactive = self.include_inactive_var.get()
-
-        for row in rows:
-            port_id = _normalize_id(row["id"])
-            if not port_id:
-                continue
-            is_load = _as_bool(row["load"])
-            is_active = _as_bool(row["is_active_port"])
-            if not include_inactive and not is_active:
-                continue
-            by_id[port_id] = row
-            disch_ports.append(row)
-            if is_load:
-                load_ports.append(row)
-
-        by_effective_id = {}
-        for row in by_id.values():
-            by_effective_id[_effective_port_id(row)] = row
-
-        return PortsData(
-            rows=rows,
-            load_ports=load_ports,
-            disch_ports=disch_ports,
-            by_id=by_id,
-            by_effective_id=by_effective_id,
-        )
+        return SimpleDistanceEngine.read_ports(path, self.include_inactive_var.get())
 
     def _read_distances_csv(self, path: str) -> tuple[set[tuple[str, str]], int]:
-        with open(path, newline="", encoding="utf-8-sig") as file:
-            reader = csv.DictReader(file)
-            self._validate_headers(
-                reader.fieldnames, DIST_COLUMNS, "Complete Distances CSV"
-            )
-            pairs = set()
-            row_count = 0
-            for row in reader:
-                row_count += 1
-                load_id = _normalize_id(row["load_port_id"])
-                disch_id = _normalize_id(row["disch_port_id"])
-                if load_id and disch_id:
-                    pairs.add((load_id, disch_id))
-            return pairs, row_count
-
-    def _validate_headers(self, actual, expected, label: str) -> None:
-        if not actual:
-            raise ValueError(f"{label} has no headers.")
-        trimmed = [h.strip() for h in actual]
-        if trimmed != expected:
-            raise ValueError(
-                f"{label} header mismatch.\nExpected:\n{expected}\nGot:\n{trimmed}"
+        return load_distance_pairs(path)
+
+    def _report_progress(self, value: int) -> None:
+        self.root.after(0, self.progress.configure, {"value": value})
+
+    def _memory_budget_mb(self) -> int:
+        try:
+            return max(int(self.memory_budget_var.get().strip() or 0), 0)
+        except ValueError:
+            return 0
+
+    def _instrumented_analysis(self, engine, budget_mb: int) -> dict:
+        profiler = Profiler()
+        budget = None
+        if budget_mb:
+            budget = MemoryBudget(budget_mb * 1024 * 1024)
+            budget.start()
+            engine.enable_memory_budget(budget)
+        engine.enable_profiling(profiler, counters=self.profile_var.get())
+        try:
+            with profile_phase(profiler, "parse_ports"):
+                ports = self._read_ports_csv(self.ports_csv_path)
+            result = engine.analyze_missing_distances(
+                ports, progress=self._report_progress
             )
+            result["profile"] = profiler.report()
+            if budget is not None:
+                result["profile"]["memory_budget"] = budget.report(
+                    profiler.peak_bytes()
+                )
+        finally:
+            if budget is not None:
+                budget.stop()
+        return result
 
     def _analyze_missing_distances(self) -> dict:
-        ports = self._read_ports_csv(self.ports_csv_path)
-        distance_pairs = self.distance_pairs or set()
-
-        load_ports = ports.load_ports
-        disch_ports = ports.disch_ports
-
-        total_pairs = len(distance_pairs)
-        total_distance_rows = self.distance_rows
-        total_ports_rows = len(ports.rows)
-        total_load = len(load_ports)
-        total_disch = len(disch_ports)
-
-        missing = []
-        found = 0
-        total_checks = max(total_load * total_disch, 1)
-        checked = 0
-
-        distance_port_ids = set()
-        for load_id, disch_id in distance_pairs:
-            distance_port_ids.add(load_id)
-            distance_port_ids.add(disch_id)
-
-        for load in load_ports:
-            load_eff = _effective_port_id(load)
-            load_id = _normalize_id(load["id"])
-            load_name = load["port"]
-            for disch in disch_ports:
-                disch_eff = _effective_port_id(disch)
-                disch_id = _normalize_id(disch["id"])
-                if load_eff == disch_eff:
-                    checked += 1
-                    continue
-                if (load_eff, disch_eff) in distance_pairs or (
-                    disch_eff,
-                    load_eff,
-                ) in distance_pairs:
-                    found += 1
-                else:
-                    missing.append(
-                        {
-                            "load_name": load_name,
-                            "load_id": load_id,
-                            "disch_name": disch["port"],
-                            "disch_id": disch_id,
-                        }
-                    )
-                checked += 1
-                if checked % 200 == 0 or checked == total_checks:
-                    progress_value = int((checked / total_checks) * 100)
-                    self.root.after(
-                        0, self.progress.configure, {"value": progress_value}
-                    )
-
-        effective_ids = {
-            _effective_port_id(row) for row in load_ports + disch_ports
-        }
-        missing_ports = sorted(
-            eid for eid in effective_ids if eid and eid not in distance_port_ids
+        engine = SimpleDistanceEngine(self.distance_pairs or set(), self.distance_rows)
+        budget_mb = self._memory_budget_mb()
+        if self.profile_var.get() or budget_mb:
+            return self._instrumented_analysis(engine, budget_mb)
+
+        def compute() -> dict:
+            ports = self._read_ports_csv(self.ports_csv_path)
+            plan = plan_analysis(engine, ports)
+            self.root.after(0, self.plan_status.set, f"Plan: {plan.describe()}")
+            return run_plan(engine, ports, plan, progress=self._report_progress)
+
+        result, _ = cached_analysis(
+            self.result_cache,
+            engine.mode,
+            [file_fingerprint(self.ports_csv_path), self.distances_fingerprint],
+            {"include_inactive": self.include_inactive_var.get()},
+            compute,
         )
-
-        return {
-            "summary": {
-                "total_ports_rows": total_ports_rows,
-                "total_load_ports": total_load,
-                "total_disch_ports": total_disch,
-                "total_distance_rows": total_distance_rows,
-                "total_distances": total_pairs,
-                "found": found,
-                "missing": len(missing),
-                "missing_ports_count": len(missing_ports),
-            },
-            "missing": missing,
-            "missing_ports": missing_ports,
-        }
+        return result
 
 
 def main() -> None:
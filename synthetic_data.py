@@ -0,0 +1,189 @@
+"""Seeded synthetic Ports / Distances / Rules / Segments CSV generator.
+
+Ports are clustered around one centre per region (so coordinates are
+plausible), a share of them alias another port through ``refer_port_id``
+or is inactive. A few hub ports act as rule waypoints and get a dense set
+of segments; every other port gets ``segments_per_port`` random segments.
+The same seed always produces byte-identical files.
+"""
+
+import csv
+import os
+import random
+from dataclasses import asdict, dataclass
+
+from distances_engine import DIST_COLUMNS, PORT_COLUMNS, RULE_COLUMNS, SEGMENT_COLUMNS
+
+
+@dataclass
+class SyntheticConfig:
+    ports: int = 1000
+    regions: int = 20
+    load_ratio: float = 0.01
+    alias_ratio: float = 0.05
+    inactive_ratio: float = 0.1
+    hubs: int = 40
+    rules: int = 200
+    max_waypoints: int = 3
+    hub_coverage: float = 0.5
+    segments_per_port: float = 10.0
+    distance_coverage: float = 0.3
+    seed: int = 0
+
+
+def _write_csv(path: str, columns: list[str], rows) -> int:
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.DictWriter(file, columns)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def _flag_row(columns: list[str], rnd: random.Random) -> dict:
+    return {
+        column: "TRUE" if rnd.random() < 0.05 else "FALSE"
+        for column in columns
+        if column.startswith("by_")
+    }
+
+
+def _ports(config: SyntheticConfig, rnd: random.Random) -> list[dict]:
+    centres = [
+        (rnd.uniform(-55.0, 65.0), rnd.uniform(-180.0, 180.0))
+        for _ in range(config.regions)
+    ]
+    ports = []
+    for idx in range(1, config.ports + 1):
+        region = rnd.randrange(config.regions)
+        lat, lon = centres[region]
+        refer = ""
+        if idx > config.hubs and rnd.random() < config.alias_ratio:
+            refer = str(rnd.randint(1, idx - 1))
+        ports.append(
+            {
+                "id": str(idx),
+                "port": f"PORT {idx}",
+                "load": "TRUE" if rnd.random() < config.load_ratio else "FALSE",
+                "mgo_at_port": "FALSE",
+                "is_archived": "FALSE",
+                "region_id": str(region + 1),
+                "port_country_id": str(region + 1),
+                "port_code": f"XX{idx:05d}",
+                "port_type": "P",
+                "is_active_port": (
+                    "FALSE"
+                    if idx > config.hubs and rnd.random() < config.inactive_ratio
+                    else "TRUE"
+                ),
+                "coordinates": (
+                    f"{max(-89.0, min(89.0, lat + rnd.gauss(0.0, 3.0))):.6f},"
+                    f"{(lon + rnd.gauss(0.0, 3.0) + 180.0) % 360.0 - 180.0:.6f}"
+                ),
+                "port_nickname": "",
+                "refer_port_id": refer,
+            }
+        )
+    return ports
+
+
+def _rules(config: SyntheticConfig, rnd: random.Random):
+    hub_ids = [str(idx) for idx in range(1, config.hubs + 1)]
+    for idx in range(1, config.rules + 1):
+        row = {column: "" for column in RULE_COLUMNS}
+        row.update(
+            {
+                "id": str(idx),
+                "distance_rule_name": f"RULE {idx}",
+                "order_of_priority": str(rnd.randint(1, 5)),
+                "zone_start_id": str(rnd.randint(1, config.regions)),
+                "zone_end_id": str(rnd.randint(1, config.regions)),
+                "discount_suez_ballast": "0",
+                "discount_suez_laden": "0",
+            }
+        )
+        for wp in range(1, rnd.randint(0, config.max_waypoints) + 1):
+            row[f"waypoint{wp}_id"] = rnd.choice(hub_ids) if hub_ids else ""
+        yield row
+
+
+def _segment_pairs(config: SyntheticConfig, rnd: random.Random) -> list[tuple[int, int]]:
+    n = config.ports
+    pairs = set()
+    for hub in range(1, config.hubs + 1):
+        for port in rnd.sample(range(1, n + 1), int(n * config.hub_coverage)):
+            if port != hub:
+                pairs.add((hub, port) if rnd.random() < 0.5 else (port, hub))
+    for _ in range(int(n * config.segments_per_port)):
+        a = rnd.randint(1, n)
+        b = rnd.randint(1, n)
+        if a != b:
+            pairs.add((a, b))
+    return sorted(pairs)
+
+
+def _segments(config: SyntheticConfig, rnd: random.Random):
+    for idx, (a, b) in enumerate(_segment_pairs(config, rnd), start=1):
+        row = _flag_row(SEGMENT_COLUMNS, rnd)
+        row.update(
+            {
+                "id": str(idx),
+                "load_port_id": str(a),
+                "disch_port_id": str(b),
+                "total_distance": f"{rnd.uniform(50.0, 12000.0):.3f}",
+                "total_seca_distance": f"{rnd.uniform(0.0, 300.0):.3f}",
+                "waypoint_data": "",
+                "updated_at": "2025-01-01 00:00:00",
+            }
+        )
+        yield row
+
+
+def _distances(config: SyntheticConfig, ports: list[dict], rnd: random.Random):
+    load_ids = [p["id"] for p in ports if p["load"] == "TRUE"]
+    all_ids = [p["id"] for p in ports]
+    idx = 0
+    for load_id in load_ids:
+        for disch_id in all_ids:
+            if load_id == disch_id or rnd.random() >= config.distance_coverage:
+                continue
+            idx += 1
+            row = _flag_row(DIST_COLUMNS, rnd)
+            row.update(
+                {
+                    "id": str(idx),
+                    "load_port_id": load_id,
+                    "disch_port_id": disch_id,
+                    "total_distance": f"{rnd.uniform(50.0, 15000.0):.3f}",
+                    "total_seca_distance": "0.000",
+                    "discount_suez_ballast": "0.000",
+                    "complete_distance_priority": "1",
+                }
+            )
+            yield row
+
+
+def generate(config: SyntheticConfig, directory: str) -> dict:
+    """Write the four CSVs into ``directory`` and return their paths and sizes."""
+    os.makedirs(directory, exist_ok=True)
+    rnd = random.Random(config.seed)
+    ports = _ports(config, rnd)
+    paths = {
+        "ports": os.path.join(directory, "ports.csv"),
+        "distances": os.path.join(directory, "complete arw-distances.csv"),
+        "rules": os.path.join(directory, "rules.csv"),
+        "segments": os.path.join(directory, "distances-arw.csv"),
+    }
+    counts = {
+        "ports": _write_csv(paths["ports"], PORT_COLUMNS, ports),
+        "distances": _write_csv(
+            paths["distances"], DIST_COLUMNS, _distances(config, ports, rnd)
+        ),
+        "rules": _write_csv(paths["rules"], RULE_COLUMNS, _rules(config, rnd)),
+        "segments": _write_csv(
+            paths["segments"], SEGMENT_COLUMNS, _segments(config, rnd)
+        ),
+    }
+    return {"config": asdict(config), "paths": paths, "rows": counts}